@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class MainConfig(AppConfig):
+    name = 'chelseasymphony.main'
+
+    def ready(self):
+        from .signal_handlers import register_signal_handlers
+        register_signal_handlers()
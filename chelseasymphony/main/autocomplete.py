@@ -0,0 +1,81 @@
+"""Admin autocomplete
+
+Editors entering concert programs look people, compositions and instruments
+up with `AutocompletePanel`, which searches on every keystroke.
+wagtailautocomplete filters on one field with `icontains`, and renders each
+composition's label by loading its composer. For the models in
+`AUTOCOMPLETE_FIELDS`, `search` matches every word of the query against any
+of the model's name columns, which have trigram indexes on Postgres, loads
+composers in the same query, and caches results briefly per query. Cached
+results are purged when the model changes. Other models are searched by
+wagtailautocomplete.
+"""
+from functools import reduce
+from hashlib import md5
+from operator import and_, or_
+from urllib.parse import unquote
+from django.apps import apps
+from django.conf import settings
+from django.db.models import Q
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.views.decorators.http import require_GET
+from wagtailautocomplete import views as autocomplete_views
+from .caching import get_or_build
+from .models import Composition, InstrumentModel, Person
+
+# The fields each word of a query is matched against, and the relations
+# the labels need
+AUTOCOMPLETE_FIELDS = {
+    Person: ('first_name', 'last_name'),
+    Composition: (
+        'plain_title', 'composer__first_name', 'composer__last_name'),
+    InstrumentModel: ('instrument',),
+}
+AUTOCOMPLETE_RELATED = {
+    Composition: ('composer',),
+}
+
+
+def autocomplete_tag(model):
+    return 'autocomplete:{}'.format(model._meta.label_lower)
+
+
+def search_q(model, search_query):
+    """Matches every word of the query against any of the model's fields"""
+    return reduce(and_, (
+        reduce(or_, (Q(**{field + '__icontains': word})
+                     for field in AUTOCOMPLETE_FIELDS[model]))
+        for word in search_query.split()), Q())
+
+
+@require_GET
+def search(request):
+    try:
+        model = apps.get_model(request.GET.get('type', 'wagtailcore.Page'))
+        limit = int(request.GET.get('limit', 100))
+    except (LookupError, ValueError):
+        return HttpResponseBadRequest()
+    if model not in AUTOCOMPLETE_FIELDS:
+        return autocomplete_views.search(request)
+
+    search_query = request.GET.get('query', '')
+    exclusions = [unquote(pk) for pk in
+                  request.GET.get('exclude', '').split(',') if pk]
+
+    def build():
+        queryset = model.objects.filter(search_q(model, search_query))\
+            .select_related(*AUTOCOMPLETE_RELATED.get(model, ()))
+        if getattr(queryset, 'live', None):
+            queryset = queryset.live()
+        if exclusions:
+            queryset = queryset.exclude(pk__in=exclusions)
+        return [autocomplete_views.render_page(obj)
+                for obj in queryset[:limit]]
+
+    key = 'admin-autocomplete:{}'.format(md5('{}:{}:{}:{}'.format(
+        model._meta.label_lower, ' '.join(search_query.lower().split()),
+        limit, ','.join(exclusions)).encode()).hexdigest())
+    items = get_or_build(
+        key, [autocomplete_tag(model)], build,
+        timeout=getattr(settings, 'ADMIN_AUTOCOMPLETE_CACHE_TIMEOUT', 60))
+    return JsonResponse({'items': items})
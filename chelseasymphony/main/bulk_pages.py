@@ -0,0 +1,176 @@
+"""Bulk page creation
+
+Creating a page with `add_child()` and publishing it with
+`save_revision().publish()` locks and updates the parent, checks the slug
+against every sibling, and writes the page several times along with a
+revision and log entries. `PageTreeWriter` creates many pages under one
+parent instead, as the import does: it hands out tree paths and unique
+slugs in memory, saves each page once, already published, and then writes
+one revision per page, and the log entries publishing would, in bulk.
+Callers write the pages' child rows in bulk themselves, and set them on the
+pages in memory so that the revisions include them.
+
+Search indexing is deferred while pages are written in bulk, and each
+batch is indexed in bulk once it commits, see `deferred_search_indexing`
+and `index_in_bulk`.
+"""
+import json
+from collections import defaultdict
+from contextlib import contextmanager
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.utils import timezone
+from django.utils.text import slugify
+from wagtail.core.models import Page, PageLogEntry, PageRevision
+from wagtail.search.backends import get_search_backends
+from wagtail.search.signal_handlers import post_save_signal_handler
+
+
+def place_child(page, parent, last_path=None):
+    """
+    Gives a new page the tree position `parent.add_child()` would, after the
+    child at `last_path`, or as the first child. Saving the page would look
+    up its parent, and whether it is a site root; both are set here instead.
+    Only this relies on treebeard's and Wagtail's internals, and
+    `test_place_child` checks it against `add_child()`.
+    """
+    step = Page._str2int(last_path[-Page.steplen:]) + 1 if last_path else 1
+    page.depth = parent.depth + 1
+    page.path = Page._get_path(parent.path, page.depth, step)
+    page.numchild = 0
+    page._cached_parent_obj = parent
+    page._is_site_root = False
+
+
+class PageTreeWriter:
+    """
+    Adds published pages as the last children of a parent. A writer is
+    used for one batch of pages, inside a transaction, and `publish()` is
+    called once the batch has been added.
+    """
+    def __init__(self, parent, new_parent=False):
+        if new_parent:
+            # A page created by this import has no children yet
+            self.parent = parent
+            self.last_path = None
+            self.slugs = set()
+        else:
+            # Lock the parent so that pages created meanwhile can't take
+            # the paths handed out here
+            self.parent = Page.objects.select_for_update().get(pk=parent.pk)
+            last = self.parent.get_last_child()
+            self.last_path = last.path if last else None
+            self.slugs = set(
+                self.parent.get_children().values_list('slug', flat=True))
+        self.pages = []
+
+    def unique_slug(self, title):
+        """Returns a slug for a title that no sibling uses, as Wagtail would"""
+        base_slug = slugify(title, allow_unicode=getattr(
+            settings, 'WAGTAIL_ALLOW_UNICODE_SLUGS', True)) or 'page'
+        slug = base_slug
+        suffix = 1
+        while slug in self.slugs:
+            suffix += 1
+            slug = '{}-{}'.format(base_slug, suffix)
+        self.slugs.add(slug)
+        return slug
+
+    def add(self, page):
+        """Saves a new page, published, as the parent's last child"""
+        now = timezone.now()
+        place_child(page, self.parent, self.last_path)
+        self.last_path = page.path
+        page.slug = self.unique_slug(page.slug or page.title)
+        page.draft_title = page.title
+        page.locale_id = self.parent.locale_id
+        page.live = True
+        page.has_unpublished_changes = False
+        page.first_published_at = page.last_published_at = now
+        page.latest_revision_created_at = now
+        page.save(clean=False, log_action=None)
+        self.pages.append(page)
+        return page
+
+    def publish(self):
+        """
+        Writes a revision of each page added as its live revision, logs
+        the pages' creation and publishing, and counts the pages as the
+        parent's children
+        """
+        if not self.pages:
+            return
+        revisions = PageRevision.objects.bulk_create([
+            PageRevision(
+                page_id=page.pk,
+                content_json=page.to_json(),
+                created_at=page.latest_revision_created_at)
+            for page in self.pages
+        ])
+        for page, revision in zip(self.pages, revisions):
+            page.live_revision_id = revision.pk
+        Page.objects.bulk_update(
+            [Page(pk=page.pk, live_revision_id=page.live_revision_id)
+             for page in self.pages],
+            ['live_revision'])
+
+        entries = []
+        for page in self.pages:
+            fields = {
+                'content_type': ContentType.objects.get_for_model(
+                    page, for_concrete_model=False),
+                'label': page.get_admin_display_title(),
+                'timestamp': page.latest_revision_created_at,
+                'page_id': page.pk,
+            }
+            entries += [
+                PageLogEntry(
+                    action='wagtail.create', data_json=json.dumps(''),
+                    content_changed=True, **fields),
+                PageLogEntry(
+                    action='wagtail.publish', data_json=json.dumps(None),
+                    revision_id=page.live_revision_id, content_changed=True,
+                    **fields),
+            ]
+        PageLogEntry.objects.bulk_create(entries)
+
+        Page.objects.filter(pk=self.parent.pk).update(
+            numchild=F('numchild') + len(self.pages))
+        self.parent.numchild += len(self.pages)
+
+
+@contextmanager
+def deferred_search_indexing(models):
+    """
+    Stops saving instances of the given models from indexing them one by
+    one, so that they can be indexed in bulk with `index_in_bulk`
+    """
+    for model in models:
+        post_save.disconnect(post_save_signal_handler, sender=model)
+    try:
+        yield
+    finally:
+        for model in models:
+            post_save.connect(post_save_signal_handler, sender=model)
+
+
+def index_in_bulk(objects):
+    """
+    Indexes objects in bulk, by model, once the current transaction commits.
+    Each batch is indexed as soon as it is written, so that a batch an
+    interrupted import has committed is searchable, as the import won't
+    write it again when resumed.
+    """
+    by_model = defaultdict(list)
+    for obj in objects:
+        by_model[type(obj)].append(obj)
+
+    def index():
+        for backend in get_search_backends(with_auto_update=True):
+            for model, objs in by_model.items():
+                backend.add_bulk(model, objs)
+    if by_model:
+        transaction.on_commit(index)
@@ -0,0 +1,268 @@
+"""Rendered fragment and page caching
+
+Cached content is labelled with dependency tags, such as `concert:12` for
+anything that displays concert 12, or `page:34` for anything that displays
+page 34. Every tag has a version token; cached content records the tokens of
+its tags when it is stored, and is only used while they are all unchanged.
+Purging a tag discards its token, which orphans everything labelled with it,
+and nothing else.
+
+Concert cards are the same on every concert listing, so each is rendered once
+and cached under its concert's tag, and `PAGES_TAG`. Anonymous responses for
+the page types in `PAGE_CACHE_MODELS` are cached whole by
+`chelseasymphony.main.middleware.PageCacheMiddleware`, under the tags
+recorded on the request while it was served.
+"""
+from hashlib import md5
+from urllib.parse import urlencode
+from uuid import uuid4
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, prefetch_related_objects
+from django.http import HttpResponse
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+from .models import (
+    BasicPage, BlogIndex, BlogPost, Concert, ConcertIndex, Home,
+    Performance, Performer, Person, PersonIndex)
+
+CONCERT_CARD_TEMPLATE = 'concert_card.html'
+
+# Pages showing the set of published concerts, or of blog posts, carry these
+# tags, which are purged when a concert or blog post is published or removed
+CONCERTS_TAG = 'concerts'
+BLOG_TAG = 'blog'
+# The musicians roster, purged when a person or instrument changes
+ROSTER_TAG = 'roster'
+# Every page carries the navigation menus, so purging this tag purges every
+# cached page
+MENUS_TAG = 'menus'
+# Everything that displays links to other pages, or hides restricted ones,
+# which is purged when the page tree or view restrictions change
+PAGES_TAG = 'pages'
+# Cached search results, purged whenever the search index changes
+SEARCH_TAG = 'search'
+# Search suggestions, whose in-memory index is rebuilt when this is purged,
+# and has changes to suggestions applied when the second is
+SUGGEST_TAG = 'suggest'
+SUGGEST_CHANGES_TAG = 'suggest-changes'
+
+PAGE_CACHE_MODELS = (
+    Home, ConcertIndex, Concert, Person, PersonIndex, BlogIndex, BlogPost,
+    BasicPage)
+
+
+def concert_tag(concert_id):
+    return 'concert:{}'.format(concert_id)
+
+
+def page_tag(page_id):
+    return 'page:{}'.format(page_id)
+
+
+def _tag_key(tag):
+    return 'cache-tag:{}'.format(tag)
+
+
+def tag_versions(tags):
+    """
+    Returns the current version token of each tag, creating tokens for tags
+    that don't have one yet
+    """
+    keys = {_tag_key(tag): tag for tag in tags}
+    versions = {keys[k]: v for k, v in cache.get_many(keys).items()}
+    missing = {k: uuid4().hex for k, tag in keys.items()
+               if tag not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update({keys[k]: v for k, v in missing.items()})
+    return versions
+
+
+def purge_cache_tags(tags):
+    """
+    Discards the version token of each tag, orphaning what it labels. A new
+    token is created the next time the tag is used.
+    """
+    if tags:
+        cache.delete_many([_tag_key(tag) for tag in set(tags)])
+
+
+def get_or_build(key, tags, build, timeout=None):
+    """
+    Returns the value cached under a key and the current versions of the
+    given tags, building and caching it if there isn't one
+    """
+    versions = tag_versions(tags)
+    key = ':'.join([key] + [versions[tag] for tag in sorted(versions)])
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, timeout=timeout)
+    return value
+
+
+def add_cache_tags(request, tags):
+    """Records that the response to a request depends on the given tags"""
+    if request is not None and hasattr(request, 'page_cache_tags'):
+        request.page_cache_tags.update(tags)
+
+
+def render_concert_cards(concerts, request=None,
+                         template_name=CONCERT_CARD_TEMPLATE):
+    """
+    Returns the rendered card of each concert, in order. Only the cards that
+    aren't cached have their programs and images loaded, which is done in
+    bulk.
+    """
+    from .program import attach_programs
+    from .renditions import prefetch_renditions
+    concerts = list(concerts)
+    tags = [concert_tag(c.pk) for c in concerts]
+    add_cache_tags(request, tags + [PAGES_TAG])
+    versions = tag_versions(tags + [PAGES_TAG])
+    keys = {
+        c.pk: 'concert-card:{}:{}:{}:{}:{}'.format(
+            template_name, c.pk, c.live_revision_id, versions[tag],
+            versions[PAGES_TAG])
+        for c, tag in zip(concerts, tags)
+    }
+    cards = cache.get_many(keys.values())
+
+    misses = [c for c in concerts if keys[c.pk] not in cards]
+    if misses:
+        attach_programs(misses)
+        prefetch_related_objects(misses, 'concert_image')
+        prefetch_renditions(template_name, {
+            'concert_image': [c.concert_image for c in misses]})
+        template = get_template(template_name)
+        rendered = {
+            keys[c.pk]: template.render({'c': c, 'request': request})
+            for c in misses
+        }
+        cache.set_many(
+            rendered,
+            timeout=getattr(settings, 'CONCERT_CARD_CACHE_TIMEOUT', None))
+        cards.update(rendered)
+
+    return [mark_safe(cards[keys[c.pk]]) for c in concerts]
+
+
+def page_cache_tags(page):
+    """Returns the tags of the content a page displays itself"""
+    tags = {page_tag(page.pk), MENUS_TAG, PAGES_TAG}
+    if isinstance(page, Home):
+        tags.add(CONCERTS_TAG)
+    if isinstance(page, (Home, BlogIndex, BlogPost)):
+        tags.add(BLOG_TAG)
+    if isinstance(page, Concert):
+        tags.add(concert_tag(page.pk))
+    if isinstance(page, BlogPost) and page.author_id:
+        tags.add(page_tag(page.author_id))
+    if isinstance(page, PersonIndex):
+        tags.add(ROSTER_TAG)
+    return tags
+
+
+def _page_cache_key(request):
+    """
+    Keys a request by its host, path and the query parameters pages read,
+    so that other parameters, such as tracking parameters or cache busters,
+    share the entry rather than filling the cache with copies
+    """
+    allowed = getattr(settings, 'PAGE_CACHE_QUERY_PARAMS', ())
+    query = urlencode(sorted(
+        (name, value) for name, values in request.GET.lists()
+        if name in allowed for value in values))
+    return 'page-cache:{}'.format(md5('{}{}?{}'.format(
+        request.get_host(), request.path, query).encode()).hexdigest())
+
+
+def get_cached_page(request):
+    """
+    Returns the cached response to a request, or None if there isn't one or
+    any of its tags have been purged since it was stored
+    """
+    entry = cache.get(_page_cache_key(request))
+    if entry is None:
+        return None
+
+    current = cache.get_many([_tag_key(tag) for tag in entry['tags']])
+    if any(current.get(_tag_key(tag)) != version
+           for tag, version in entry['tags'].items()):
+        return None
+
+    response = HttpResponse(entry['content'], status=entry['status'])
+    for header, value in entry['headers']:
+        response[header] = value
+    return response
+
+
+def cache_page(request, response, tags):
+    cache.set(_page_cache_key(request), {
+        'content': response.content,
+        'status': response.status_code,
+        'headers': list(response.items()),
+        'tags': tag_versions(tags),
+    }, timeout=getattr(settings, 'PAGE_CACHE_TIMEOUT', None))
+
+
+def concert_ids_for_performances(performance_ids):
+    """Returns the IDs of the concerts the given performances belong to"""
+    paths = Performance.objects.filter(pk__in=performance_ids)\
+        .values_list('path', flat=True)
+    parent_paths = {p[:-Performance.steplen] for p in paths}
+    return list(Concert.objects.filter(path__in=parent_paths)
+                .values_list('pk', flat=True))
+
+
+def concert_ids_for_people(person_ids):
+    """
+    Returns the IDs of the concerts the given people appear on, as
+    performers, conductors or composers
+    """
+    performance_ids = Performance.objects.filter(
+        Q(performer__person__in=person_ids) |
+        Q(conductor__in=person_ids) |
+        Q(composition__composer__in=person_ids)
+    ).values_list('pk', flat=True)
+    return concert_ids_for_performances(performance_ids) + list(
+        Concert.objects.filter(performer__person__in=person_ids)
+        .values_list('pk', flat=True))
+
+
+def concert_ids_for_compositions(composition_ids):
+    return concert_ids_for_performances(
+        Performance.objects.filter(composition__in=composition_ids)
+        .values_list('pk', flat=True))
+
+
+def concert_ids_for_instruments(instrument_ids):
+    return concert_ids_for_performances(
+        Performer.objects.filter(instrument__in=instrument_ids)
+        .values_list('performance_id', flat=True))
+
+
+def concert_ids_for_images(image_ids):
+    return list(Concert.objects.filter(concert_image__in=image_ids)
+                .values_list('pk', flat=True))
+
+
+def page_ids_for_instruments(instrument_ids):
+    return list(Person.objects.filter(instrument__in=instrument_ids)
+                .values_list('pk', flat=True))
+
+
+def page_ids_for_images(image_ids):
+    """Returns the IDs of the pages that use the given images as fields"""
+    return list(
+        Person.objects.filter(headshot__in=image_ids)
+        .values_list('pk', flat=True)
+    ) + list(
+        BlogPost.objects.filter(blog_image__in=image_ids)
+        .values_list('pk', flat=True)
+    ) + list(
+        Home.objects.filter(
+            Q(banner_image__in=image_ids) |
+            Q(supplimental_image__in=image_ids))
+        .values_list('pk', flat=True))
@@ -1,5 +1,7 @@
 """Django Forms"""
 from django import forms
+from django.conf import settings
+from django.template.defaultfilters import filesizeformat
 from django.utils.translation import gettext_lazy as _
 from .models import NewMemberRequest
 
@@ -23,6 +25,16 @@ class NewMemberRequestForm(forms.ModelForm):
                                'are not compensated.')
         }
 
+    def __init__(self, *args, oversized_uploads=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        # Files over the maximum upload size are dropped while they are
+        # received, so they arrive missing
+        for name in oversized_uploads:
+            if name in self.fields:
+                self.fields[name].error_messages['required'] = _(
+                    'Please upload a file smaller than %(size)s.') % {
+                    'size': filesizeformat(settings.FILE_UPLOAD_MAX_SIZE)}
+
     def clean_read_policies(self):
         """Validate that user has checked box indicating that they've read
         the orchestra's policies"""
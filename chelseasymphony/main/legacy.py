@@ -0,0 +1,337 @@
+"""Legacy site import pipeline
+
+The import commands read the old Drupal site's JSON API and its images in
+stages. The API payloads a command needs are fetched concurrently over one
+pooled session. Then, before each import stage, the images it uses are
+downloaded and checked concurrently, a bounded number at a time, skipping
+images that were imported before. The command itself makes every database
+write, from its own thread, using what was fetched.
+
+`LegacySite` takes the site's base URL, so the pipeline can be run against
+a local server with recorded payloads and images.
+
+Payloads are parsed as they stream in, one node at a time, and spooled to
+disk as newline delimited JSON, as are the images downloaded. Commands
+iterate over the spooled nodes, indexing the ones they look up, rather
+than holding every payload in memory. Given a spool directory, the
+spooled payloads and images are kept, and `--replay` imports from them
+again without fetching anything.
+
+Imports are incremental: `SyncState` diffs the fetched nodes against the
+records imported before, by a hash of each node's content, so that only new
+and changed records are written.
+"""
+import codecs
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from io import BytesIO
+import json
+import os
+import re
+from tempfile import TemporaryDirectory
+from urllib import parse
+from PIL import Image
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import CommandError
+from wagtail.images import get_image_model
+from .models import LegacyRecord
+
+IMPORT_BASE_URL = 'https://chelseasymphony.org'
+
+# The API endpoint of each payload
+ENDPOINTS = {
+    'concerts': '/api/concerts',
+    'concert_dates': '/api/concert-date',
+    'concert_performances': '/api/performances',
+    'concert_soloists': '/api/soloists',
+    'concert_photos': '/api/concerts/images',
+    'people': '/api/users',
+    'headshots': '/api/users/headshot',
+    'blog_posts': '/api/blogpost',
+    'blog_posts_images': '/api/blogpost-image',
+}
+
+# The size of the chunks payloads are read in
+SPOOL_CHUNK_SIZE = 64 * 1024
+
+
+def filename_from_url(url):
+    return os.path.split(parse.urlparse(url).path)[1]
+
+
+def iter_array(chunks, key='nodes'):
+    """
+    Yields the items of the array under a key of a JSON object, parsing the
+    object incrementally from chunks of bytes, so that only one item is held
+    in memory at a time. The key is expected to be the first string in the
+    object that is followed by an array, as it is in the legacy payloads.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buffer = ''
+
+    def read():
+        nonlocal buffer
+        chunk = next(chunks, None)
+        if chunk is None:
+            raise ValueError(
+                'The payload ended before its {} array did'.format(key))
+        buffer += utf8.decode(chunk)
+
+    start = re.compile(r'"{}"\s*:\s*\['.format(re.escape(key)))
+    while True:
+        match = start.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        read()
+
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,')
+        if not buffer:
+            read()
+            continue
+        if buffer[0] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            # The item continues in the next chunk
+            read()
+            continue
+        buffer = buffer[end:]
+        yield item
+
+
+class NodeFile:
+    """
+    The nodes of a payload spooled to disk, one per line, which are read
+    again each time they are iterated over
+    """
+    def __init__(self, path, spool=None):
+        self.path = path
+        # Keeps a temporary spool directory until its nodes are done with
+        self._spool = spool
+
+    def __iter__(self):
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+
+def add_site_arguments(parser):
+    """Adds the options of `site_from_options()` to an import command"""
+    parser.add_argument(
+        '--base-url', default=IMPORT_BASE_URL,
+        help='The legacy site to import from')
+    parser.add_argument(
+        '--spool-dir',
+        help='Keep the fetched payloads and images in this directory')
+    parser.add_argument(
+        '--replay', action='store_true',
+        help=(
+            'Import the payloads and images kept in --spool-dir by an '
+            'earlier run, rather than fetching them'))
+
+
+def site_from_options(options):
+    if options['replay'] and not options['spool_dir']:
+        raise CommandError('--replay needs the --spool-dir to replay')
+    return LegacySite(
+        options['base_url'], spool_dir=options['spool_dir'],
+        replay=options['replay'])
+
+
+def pooled_session(pool_size):
+    """Returns a session that keeps up to `pool_size` connections per host"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class LegacySite:
+    def __init__(self, base_url=IMPORT_BASE_URL, spool_dir=None,
+                 replay=False):
+        self.base_url = base_url.rstrip('/')
+        self.fetch_workers = getattr(settings, 'IMPORT_FETCH_WORKERS', 4)
+        self.image_workers = getattr(settings, 'IMPORT_IMAGE_WORKERS', 4)
+        self.session = pooled_session(
+            max(self.fetch_workers, self.image_workers))
+        self.replay = replay
+        self._spool = None
+        if spool_dir is None:
+            # Payloads are spooled either way, to keep them out of memory
+            self._spool = TemporaryDirectory(prefix='legacy-')
+            spool_dir = self._spool.name
+        self.spool_dir = spool_dir
+        os.makedirs(os.path.join(spool_dir, 'images'), exist_ok=True)
+
+    def url(self, path):
+        """Resolves a path, or image source, against the site"""
+        return parse.urljoin(self.base_url + '/', path)
+
+    def fetch_nodes(self, name):
+        """
+        Streams the nodes of a payload to the spool, unless replaying, and
+        returns the spooled nodes
+        """
+        path = os.path.join(self.spool_dir, name + '.ndjson')
+        if self.replay:
+            if not os.path.exists(path):
+                raise FileNotFoundError(
+                    'The {} payload was not spooled to {}'.format(
+                        name, self.spool_dir))
+            return NodeFile(path)
+
+        with self.session.get(
+                self.url(ENDPOINTS[name]), stream=True) as response:
+            response.raise_for_status()
+            # A payload is only replayed once it has been spooled in full
+            with open(path + '.part', 'w', encoding='utf-8') as f:
+                for n in iter_array(
+                        response.iter_content(SPOOL_CHUNK_SIZE)):
+                    f.write(json.dumps(n['node']) + '\n')
+        os.replace(path + '.part', path)
+        return NodeFile(path, self._spool)
+
+    def fetch(self, *names):
+        """Fetches the nodes of the named payloads concurrently, by name"""
+        with ThreadPoolExecutor(self.fetch_workers) as executor:
+            return dict(zip(names, executor.map(self.fetch_nodes, names)))
+
+    def image_path(self, url):
+        return os.path.join(self.spool_dir, 'images', filename_from_url(url))
+
+    def download_image(self, url):
+        """
+        Spools the image at a URL, unless it was spooled before, and
+        returns its path, or None if it failed
+        """
+        path = self.image_path(url)
+        if os.path.exists(path):
+            return path
+        if self.replay:
+            print(f"Not spooled: {url}")
+            return None
+
+        print(f"Downloading {url}")
+        response = self.session.get(self.url(url))
+
+        if response.status_code != 200:
+            print(f"Error {response.status_code} downloading: {url}")
+            return None
+
+        # check its a valid image
+        Image.open(BytesIO(response.content)).verify()
+        with open(path + '.part', 'wb') as f:
+            f.write(response.content)
+        os.replace(path + '.part', path)
+        return path
+
+    def download_images(self, urls):
+        """
+        Downloads the images at the given URLs that haven't been imported
+        yet, concurrently, and returns their spooled paths by URL
+        """
+        urls = {url for url in urls if url}
+        imported = set(get_image_model().objects.filter(
+            title__in={filename_from_url(url) for url in urls}
+        ).values_list('title', flat=True))
+        urls = [url for url in urls if filename_from_url(url) not in imported]
+        with ThreadPoolExecutor(self.image_workers) as executor:
+            return dict(zip(urls, executor.map(self.download_image, urls)))
+
+
+def get_wagtail_image(url, downloads):
+    """
+    Returns the image imported from a URL, creating it from its spooled
+    download if it hasn't been imported yet, or None if it couldn't be
+    downloaded.
+    From: https://github.com/kevinhowbrook/wagtail-migration/blob
+          /debdead7d5e9b3f00439e803642a3ef45ad2bb19/importers/base.py#L127
+    """
+    WagtailImage = get_image_model()
+    filename = filename_from_url(url)
+
+    # see if an image with the same name exists
+    try:
+        return WagtailImage.objects.get(title=filename)
+    except WagtailImage.DoesNotExist:
+        pass
+
+    path = downloads.get(url)
+    if path is None:
+        return None
+
+    # save and return
+    with open(path, 'rb') as f:
+        return WagtailImage.objects.create(
+            title=filename,
+            file=SimpleUploadedFile(filename, f.read())
+        )
+
+
+def content_hash(content):
+    """Returns a hash of JSON content that doesn't depend on key order"""
+    return sha256(
+        json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+class SyncState:
+    """
+    The records of a model synced from one source, loaded in two queries,
+    and counts of the records created, updated and skipped by a sync
+    """
+    def __init__(self, source, model):
+        self.source = source
+        self.pks = dict(model.objects.exclude(legacy_id=None)
+                        .values_list('legacy_id', 'pk'))
+        self.hashes = dict(LegacyRecord.objects.filter(source=source)
+                           .values_list('legacy_id', 'content_hash'))
+        self.counts = Counter()
+
+    def diff(self, nodes, legacy_id, content):
+        """
+        Returns the nodes that have no record, and the nodes whose content
+        has changed since their record was synced, by the record's pk.
+        Unchanged nodes are counted as skipped.
+        """
+        new = []
+        changed = {}
+        for node in nodes:
+            key = int(legacy_id(node))
+            node_hash = content_hash(content(node))
+            if key not in self.pks:
+                new.append(node)
+            elif self.hashes.get(key) != node_hash:
+                changed[self.pks[key]] = node
+            else:
+                self.counts['skipped'] += 1
+                continue
+            self.hashes[key] = node_hash
+        return new, changed
+
+    def record(self, legacy_ids, action):
+        """
+        Stores the content hashes of synced records, counting them under
+        an action
+        """
+        legacy_ids = [int(key) for key in legacy_ids]
+        LegacyRecord.objects.filter(
+            source=self.source, legacy_id__in=legacy_ids).delete()
+        LegacyRecord.objects.bulk_create([
+            LegacyRecord(source=self.source, legacy_id=key,
+                         content_hash=self.hashes[key])
+            for key in legacy_ids])
+        self.counts[action] += len(legacy_ids)
+
+    def report(self):
+        return '{created} created, {updated} updated, {skipped} skipped'\
+            .format_map(self.counts)
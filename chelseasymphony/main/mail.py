@@ -0,0 +1,24 @@
+"""Outbound mail
+
+Requests don't talk to the mail server, so that a slow SMTP server can't
+hold up a web worker. `queue_mail` sends each email as a background task,
+which is retried with backoff like any other if it fails to send. An email
+is sent at least once: if a worker stops between sending it and recording
+that, it is sent again once the task's lease expires.
+"""
+from django.core.mail import send_mail
+from .tasks import run_in_background
+
+
+def send_queued_email(subject, body, from_email, recipient_list):
+    """Sends an email queued by `queue_mail`, raising if it fails to send"""
+    send_mail(subject, body, from_email, recipient_list, fail_silently=False)
+
+
+def queue_mail(subject, body, from_email, recipient_list):
+    """
+    Sends an email in the background, taking the arguments of `send_mail`.
+    Returns the queued task.
+    """
+    return run_in_background(
+        send_queued_email, subject, body, from_email, list(recipient_list))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from chelseasymphony.main.models import Concert
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalculates the denormalized first date, last date and date count "
+        "of every concert from its concert dates"
+    )
+
+    def handle(self, *args, **kwargs):
+        concert_ids = Concert.objects.values_list('pk', flat=True)
+        for concert_id in concert_ids:
+            Concert.update_date_range(concert_id)
+        self.stdout.write('Updated {} concerts'.format(len(concert_ids)))
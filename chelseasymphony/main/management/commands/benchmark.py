@@ -0,0 +1,198 @@
+import json
+import random
+import subprocess
+from datetime import datetime, timedelta
+from statistics import median
+from time import perf_counter
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models.query import QuerySet
+from django.test import Client, RequestFactory
+from django.test.utils import (
+    override_settings, setup_test_environment, teardown_test_environment)
+from django.utils.timezone import get_current_timezone
+from chelseasymphony.main.models import (
+    Composition, Concert, Performance, Person)
+from chelseasymphony.main.profiling import RequestProfile
+
+TZ = get_current_timezone()
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds a synthetic multi-season dataset in a throwaway test "
+        "database, times the main pages, search and the concert admin "
+        "listing against it, and prints the results as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seasons', type=int, default=5,
+            help='Number of concert seasons, ending with next season')
+        parser.add_argument(
+            '--concerts', type=int, default=10,
+            help='Number of concerts per season')
+        parser.add_argument(
+            '--performances', type=int, default=20,
+            help='Number of performances per concert, at least 4')
+        parser.add_argument(
+            '--people', type=int, default=300,
+            help='Number of people to draw performers and composers from')
+        parser.add_argument(
+            '--compositions', type=int, default=500,
+            help='Number of compositions to draw performances from')
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Number of warm runs of each benchmark')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed, so that runs build the same dataset')
+        parser.add_argument(
+            '--output', help='Write the results to this file')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(PAGE_CACHE_ENABLED=False):
+                dataset = self.build_dataset(options)
+                results = self.run_benchmarks(options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps({
+            'commit': self.git_commit(),
+            'database': connection.vendor,
+            'dataset': dataset,
+            'results': results,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def build_dataset(self, options):
+        # The factories depend on the test requirements
+        from wagtail_factories import ImageFactory
+        from chelseasymphony.main.tests.factories import (
+            BlogPostFactory, CompositionFactory, ConcertFactory,
+            PerformanceFactory, PersonFactory)
+        from chelseasymphony.main.tests.test_models import create_base_site
+
+        self.stderr.write('Building dataset...')
+        self.homepage, self.c_idx, self.p_idx, b_idx = create_base_site()
+
+        images = [ImageFactory() for i in range(10)]
+        people = [PersonFactory(headshot=random.choice(images))
+                  for i in range(options['people'])]
+        compositions = [CompositionFactory(composer=random.choice(people))
+                        for i in range(options['compositions'])]
+        for i in range(10):
+            BlogPostFactory(parent=b_idx, author=random.choice(people))\
+                .save_revision().publish()
+
+        # Seasons start on Aug 1, and the last one built is next season
+        today = datetime.now(TZ)
+        last_season = today.year + 1 if today.month >= 8 else today.year
+        week = timedelta(days=7)
+        for year in range(last_season - options['seasons'] + 1,
+                          last_season + 1):
+            first_date = datetime(year, 8, 1, 20, tzinfo=TZ)
+            for i in range(options['concerts']):
+                d = first_date + week * (i * 50 // options['concerts'])
+                concert = ConcertFactory(
+                    parent=self.c_idx,
+                    dates=[d, d + timedelta(days=1)],
+                    concert_image=random.choice(images))
+                for j in range(options['performances'] - 4):
+                    PerformanceFactory(
+                        parent=concert,
+                        composition=random.choice(compositions),
+                        conductor=random.choice(people),
+                        performer__person=random.choice(people))
+
+        self.superuser = get_user_model().objects.create_superuser(
+            'benchmark', 'benchmark@example.org', 'benchmark')
+
+        return {
+            'seasons': options['seasons'],
+            'concerts': Concert.objects.count(),
+            'performances': Performance.objects.count(),
+            'people': Person.objects.count(),
+            'compositions': Composition.objects.count(),
+        }
+
+    def get_context_benchmark(self, page, *args):
+        """Times a page's get_context, evaluating any querysets it returns"""
+        request = RequestFactory().get(page.url)
+        request.user = self.superuser
+
+        def run():
+            for value in page.get_context(request, *args).values():
+                if isinstance(value, QuerySet):
+                    list(value)
+        return run
+
+    def client_benchmark(self, url, login=False):
+        client = Client()
+        if login:
+            client.force_login(self.superuser)
+
+        def run():
+            response = client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+        return run
+
+    def run_benchmarks(self, repeat):
+        concert = Concert.objects.future_concerts().first() or \
+            Concert.objects.order_by('-first_date').first()
+        benchmarks = {
+            'Home.get_context': self.get_context_benchmark(self.homepage),
+            'ConcertIndex.upcoming_concerts':
+                self.client_benchmark(self.c_idx.url),
+            'ConcertIndex.concerts_by_season':
+                self.client_benchmark(
+                    '{}{}/'.format(self.c_idx.url, concert.season)),
+            'Concert.get_context': self.get_context_benchmark(concert),
+            'PersonIndex.get_context':
+                self.get_context_benchmark(self.p_idx),
+            'search': self.client_benchmark('/search/?query=concert'),
+            'ConcertAdmin.index':
+                self.client_benchmark('/admin/main/concert/', login=True),
+        }
+
+        results = dict()
+        for name, run in benchmarks.items():
+            self.stderr.write('Timing {}...'.format(name))
+            cache.clear()
+            timings = list()
+            for i in range(repeat + 1):
+                profile = RequestProfile()
+                with connection.execute_wrapper(profile):
+                    start = perf_counter()
+                    run()
+                    timings.append((perf_counter() - start) * 1000)
+            cold, warm = timings[0], timings[1:]
+            results[name] = {
+                'cold_ms': round(cold, 2),
+                'median_ms': round(median(warm), 2),
+                'min_ms': round(min(warm), 2),
+                'max_ms': round(max(warm), 2),
+                'queries': profile.query_count,
+                'duplicate_queries': profile.duplicate_count,
+            }
+        return results
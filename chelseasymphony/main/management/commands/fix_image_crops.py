@@ -1,22 +1,19 @@
-from io import BytesIO
-import os
-from urllib import parse
 from math import floor
-from PIL import Image
-import requests
 from django.apps import apps
 from django.core.management.base import BaseCommand
-from django.core.files.uploadedfile import SimpleUploadedFile
-from wagtail.images import get_image_model
+from chelseasymphony.main.legacy import (
+    add_site_arguments, get_wagtail_image, site_from_options)
 from chelseasymphony.main.models import (
     Concert, Person, BlogPost
 )
 
-WagtailImage = get_image_model()
 ContentType = apps.get_model('contenttypes.ContentType')
 
-
-IMPORT_BASE_URL = 'https://chelseasymphony.org'
+# The crops whose focal points are used. Headshots without the crop use
+# their uncropped image.
+CONCERT_IMAGE_CROP = 'tcs2r_concert_image_2_7'
+HEADSHOT_CROPS = ('tcs2r_concert_image_0_79', '')
+BLOG_IMAGE_CROP = 'tsc2r_blog_list___homepage_desktop'
 
 
 class Command(BaseCommand):
@@ -28,119 +25,75 @@ class Command(BaseCommand):
         'legacy must must have been previously imported.'
     )
 
-    def __init__(self, *args, **kwargs):
-        """Sets up instace variables"""
-        super().__init__(*args, **kwargs)
-
-        # For concerts
-        cns = requests.get(IMPORT_BASE_URL + '/api/concerts').json()['nodes']
-        self.concerts = [c['node'] for c in cns]
-
-        cphts = requests.get(
-            IMPORT_BASE_URL + '/api/concerts/images').json()['nodes']
-        self.concert_photos = [p['node'] for p in cphts]
-
-        users = requests.get(IMPORT_BASE_URL + '/api/users').json()['nodes']
-        self.people = [p['node'] for p in users]
-
-        hdshts = requests.get(
-            IMPORT_BASE_URL + '/api/users/headshot').json()['nodes']
-        self.headshots = [p['node'] for p in hdshts]
-
-        blog_post = requests.get(
-            IMPORT_BASE_URL + '/api/blogpost').json()['nodes']
-        self.blog_posts = [b['node'] for b in blog_post]
+    def add_arguments(self, parser):
+        add_site_arguments(parser)
 
-        bp_img = requests.get(
-            IMPORT_BASE_URL + '/api/blogpost-image').json()['nodes']
-        self.blog_posts_images = [b['node'] for b in bp_img]
+    def fetch_data(self):
+        """
+        Fetches the legacy site's nodes concurrently, and indexes the image
+        nodes of the crops used as they are read from the spool
+        """
+        for name, nodes in self.site.fetch(
+                'concerts', 'concert_photos', 'people', 'headshots',
+                'blog_posts', 'blog_posts_images').items():
+            setattr(self, name, nodes)
+        self.images = {}
+
+        self.concert_photos_by_nid = {}
+        for p in self.concert_photos:
+            if p['crop_style_name'] == CONCERT_IMAGE_CROP:
+                self.concert_photos_by_nid.setdefault(p['nid'], p)
+        self.headshots_by_uid = {}
+        for p in self.headshots:
+            if p['crop_style_name'] in HEADSHOT_CROPS:
+                crops = self.headshots_by_uid.setdefault(p['uid'], {})
+                crops.setdefault(p['crop_style_name'], p)
+        self.blog_images_by_nid = {}
+        for p in self.blog_posts_images:
+            if p['crop_style_name'] == BLOG_IMAGE_CROP:
+                self.blog_images_by_nid.setdefault(p['nid'], p)
 
     def get_concert_photo_by_id(self, nid):
         """
         Gets concert images by node id
         Note: this uses the tightest crop to set the focal point for the image
         """
-        try:
-            return [p for p in self.concert_photos
-                    if (p['nid'] == str(nid) and
-                        p['crop_style_name'] == 'tcs2r_concert_image_2_7')][0]
-        except IndexError:
-            return None
+        return self.concert_photos_by_nid.get(str(nid))
 
     def get_headshot_by_uid(self, uid):
         """
         Gets a person's headshot based on thier legacy Drupal uid
         """
-        try:
-            return [p for p in self.headshots
-                    if (p['uid'] == str(uid) and
-                        p['crop_style_name'] ==
-                        'tcs2r_concert_image_0_79')][0]
-        except IndexError:
-            pass
-
-        try:
-            return [p for p in self.headshots
-                    if (p['uid'] == str(uid) and
-                        p['crop_style_name'] == '')][0]
-        except IndexError:
-            return None
+        crops = self.headshots_by_uid.get(str(uid), {})
+        for crop in HEADSHOT_CROPS:
+            if crop in crops:
+                return crops[crop]
+        return None
 
     def get_blog_img_from_id(self, nid):
         """
         Gets a blog image from legacy Drupal nid
         """
-        try:
-            return [p for p in self.blog_posts_images
-                    if (p['nid'] == str(nid) and
-                        p['crop_style_name'] ==
-                        'tsc2r_blog_list___homepage_desktop')][0]
-        except IndexError:
-            return None
+        return self.blog_images_by_nid.get(str(nid))
 
-    def get_wagtail_image(self, url):
+    def download_images(self, image_nodes, field):
         """
-        Looks for an existing image with the same name, otherwise downloads
-        and saves the image.
-        From: https://github.com/kevinhowbrook/wagtail-migration/blob
-              /debdead7d5e9b3f00439e803642a3ef45ad2bb19/importers/base.py#L127
+        Downloads the images of the given image nodes, before the stage that
+        fixes them
         """
-        filename = self._filename_from_url(url)
-
-        # see if an image with the same name exists
-        try:
-            return WagtailImage.objects.get(title=filename)
-        except WagtailImage.DoesNotExist:
-            pass
-
-        # otherwise download
-        print(f"Downloading {url}")
-        response = requests.get(url)
-
-        if response.status_code != 200:
-            print(f"Error {response.status_code} downloading: {url}")
-            return None
-
-        # check its a valid image
-        pil_image = Image.open(BytesIO(response.content))
-        pil_image.verify()
-
-        # save and return
-        return WagtailImage.objects.create(
-            title=filename,
-            file=SimpleUploadedFile(filename, response.content)
-        )
-
-    @staticmethod
-    def _filename_from_url(url):
-        # Get file name for image from a given URL
-        url_parsed = parse.urlparse(url)
-        return os.path.split(url_parsed.path)[1]
+        self.images.update(self.site.download_images(
+            n[field]['src'] for n in image_nodes if n))
+
+    def get_wagtail_image(self, url):
+        return get_wagtail_image(url, self.images)
 
     def fix_concert_images(self):
         """Method to save missing crops on concert images"""
-        concerts = (conc for conc in self.concerts
-                    if Concert.objects.filter(legacy_id=conc['nid']).exists())
+        concerts = [conc for conc in self.concerts
+                    if Concert.objects.filter(legacy_id=conc['nid']).exists()]
+        self.download_images(
+            [self.get_concert_photo_by_id(c['nid']) for c in concerts],
+            'concert_image')
         for conc in concerts:
             # Create the concert
             concert = Concert.objects.get(legacy_id=conc['nid'])
@@ -167,8 +120,11 @@ class Command(BaseCommand):
 
     def fix_people_headshots(self):
         """Adds missing crops to headshots"""
-        persons = (p for p in self.people
-                   if Person.objects.filter(legacy_id=p['uid']).exists())
+        persons = [p for p in self.people
+                   if Person.objects.filter(legacy_id=p['uid']).exists()]
+        self.download_images(
+            [self.get_headshot_by_uid(p['uid']) for p in persons],
+            'head_shot')
         for pers in persons:
             print('Now creating: ' + pers['name'])
             person = Person.objects.get(legacy_id=pers['uid'])
@@ -199,8 +155,11 @@ class Command(BaseCommand):
 
     def fix_blogpost_img(self):
         """Adds missing crops to blog post images"""
-        posts = (p for p in self.blog_posts
-                 if BlogPost.objects.filter(legacy_id=p['nid']).exists())
+        posts = [p for p in self.blog_posts
+                 if BlogPost.objects.filter(legacy_id=p['nid']).exists()]
+        self.download_images(
+            [self.get_blog_img_from_id(p['nid']) for p in posts],
+            'blog_image')
 
         for post in posts:
             blog_post = BlogPost.objects.get(legacy_id=post['nid'])
@@ -225,6 +184,9 @@ class Command(BaseCommand):
                 blog_post.save_revision().publish()
 
     def handle(self, *args, **kwargs):
+        self.site = site_from_options(kwargs)
+        self.fetch_data()
+
         # Create people first, so that Concerts and Blogs can reference them
         self.fix_people_headshots()
 
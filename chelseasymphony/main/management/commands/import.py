@@ -1,29 +1,104 @@
-from io import BytesIO
-import os
-from PIL import Image
+from collections import defaultdict
+from contextlib import contextmanager
 import re
-from urllib import parse
-import requests
+from time import perf_counter
+from chelseasymphony.main.autocomplete import autocomplete_tag
+from chelseasymphony.main.bulk_pages import (
+    PageTreeWriter, deferred_search_indexing, index_in_bulk)
+from chelseasymphony.main.caching import (
+    BLOG_TAG, CONCERTS_TAG, MENUS_TAG, ROSTER_TAG, SEARCH_TAG, SUGGEST_TAG,
+    purge_cache_tags)
+from chelseasymphony.main.legacy import (
+    ENDPOINTS, SyncState, add_site_arguments, get_wagtail_image,
+    site_from_options)
 from chelseasymphony.main.models import (
-    ConcertDate, ConcertIndex, Concert,
+    ConcertDate, ConcertIndex, Concert, ConcertPerformer,
     Performance, Performer, Composition, Person, PersonIndex,
     InstrumentModel, BlogPost, BlogIndex
 )
 from django.apps import apps
 from django.core.management.base import BaseCommand
-from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
 from django.utils.dateparse import parse_date, parse_datetime
 from django.utils.html import linebreaks
-from django.utils.timezone import make_aware
+from django.utils.timezone import localtime, make_aware
 from wagtail.contrib.redirects.models import Redirect
 from wagtail.core.rich_text import RichText
-from wagtail.images import get_image_model
 
-WagtailImage = get_image_model()
 ContentType = apps.get_model('contenttypes.ContentType')
 
+# The page types --bulk creates
+BULK_PAGE_MODELS = (Person, Concert, Performance, BlogPost)
 
-IMPORT_BASE_URL = 'https://chelseasymphony.org'
+# What publishing the page types --bulk creates purges, as a whole: the
+# listings, menus, search results and suggestions they appear in, and admin
+# autocomplete results for people, who compositions are chosen by
+BULK_PURGE_TAGS = [
+    MENUS_TAG, ROSTER_TAG, CONCERTS_TAG, BLOG_TAG, SEARCH_TAG, SUGGEST_TAG,
+    autocomplete_tag(Person), autocomplete_tag(Composition)]
+
+# Images are imported with the focal point of one of their crop styles
+CONCERT_IMAGE_CROP = 'tcs2r_concert_image_0_79'
+HEADSHOT_CROP = 'tcs2r_musician_headshot_1_5'
+BLOG_IMAGE_CROP = 'tsc2r_blog_list___homepage_desktop'
+
+# The fields --sync updates on changed records. Biographies are synced by
+# import_bios.
+CONCERT_FIELDS = ('title', 'promo_copy', 'description', 'venue', 'season')
+PERSON_FIELDS = ('first_name', 'last_name', 'position', 'active_roster')
+BLOG_POST_FIELDS = ('title', 'promo_copy', 'body', 'author', 'date')
+
+
+def index_by(nodes, key):
+    """Indexes nodes by a key function, keeping the first node per key"""
+    index = {}
+    for node in nodes:
+        index.setdefault(key(node), node)
+    return index
+
+
+def batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def split_name(name):
+    """Splits a name into first and last names, as people are created"""
+    name = name.strip()
+    first = last = ''
+    try:
+        first, last = re.split(r'\s+', name, 1)
+    except ValueError:
+        last = name
+    return first, last
+
+
+def bulk_create_m2m(instances, field_name):
+    """Writes the rows of a many to many field set on instances in memory"""
+    if not instances:
+        return
+    field = instances[0]._meta.get_field(field_name)
+    through = field.remote_field.through
+    through.objects.bulk_create([
+        through(**{
+            field.m2m_field_name(): instance,
+            field.m2m_reverse_field_name(): target})
+        for instance in instances
+        for target in getattr(instance, field_name).all()
+    ])
+
+
+def copy_fields(source, target, fields):
+    for field in fields:
+        setattr(target, field, getattr(source, field))
+
+
+def group_by(nodes, key):
+    """Groups nodes by a key function, in order"""
+    groups = defaultdict(list)
+    for node in nodes:
+        groups[key(node)].append(node)
+    return groups
 
 
 class Command(BaseCommand):
@@ -46,40 +121,80 @@ class Command(BaseCommand):
         except IndexError:
             print("The blog index does not exist")
             raise
+        self.timings = {}
+        self.images = {}
+        self.instruments = {}
+        self.bulk = False
+        self.sync = False
+        self.sync_states = {}
+
+    def add_arguments(self, parser):
+        add_site_arguments(parser)
+        parser.add_argument(
+            '--bulk', action='store_true',
+            help=(
+                'Create pages in bulk, in one transaction per batch, rather '
+                'than publishing them one by one'))
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='The number of pages created per transaction with --bulk')
+        parser.add_argument(
+            '--sync', action='store_true',
+            help=(
+                'Update records whose content on the legacy site has changed '
+                'since they were imported, as well as creating new ones'))
+
+    @contextmanager
+    def timed(self, stage):
+        """Adds the time spent in the block to the stage's timing"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0) + \
+                perf_counter() - start
 
-    def fetch_data(self):
-        # For concerts
-        cns = requests.get(IMPORT_BASE_URL + '/api/concerts').json()['nodes']
-        self.concerts = [c['node'] for c in cns]
-
-        cdts = requests.get(
-            IMPORT_BASE_URL + '/api/concert-date').json()['nodes']
-        self.concert_dates = [d['node'] for d in cdts]
-
-        cprf = requests.get(
-            IMPORT_BASE_URL + '/api/performances').json()['nodes']
-        self.concert_performances = [p['node'] for p in cprf]
-
-        csls = requests.get(IMPORT_BASE_URL + '/api/soloists').json()['nodes']
-        self.concert_soloists = [c['node'] for c in csls]
-
-        cphts = requests.get(
-            IMPORT_BASE_URL + '/api/concerts/images').json()['nodes']
-        self.concert_photos = [p['node'] for p in cphts]
+    def print_counts(self):
+        for source, state in self.sync_states.items():
+            print('{}: {}'.format(source, state.report()))
 
-        users = requests.get(IMPORT_BASE_URL + '/api/users').json()['nodes']
-        self.people = [p['node'] for p in users]
+    def print_timings(self):
+        print('Timings:')
+        for stage, seconds in self.timings.items():
+            print('  {:<12} {:>8.2f}s'.format(stage, seconds))
 
-        hdshts = requests.get(
-            IMPORT_BASE_URL + '/api/users/headshot').json()['nodes']
-        self.headshots = [p['node'] for p in hdshts]
+    def fetch_data(self):
+        for name, nodes in self.site.fetch(*ENDPOINTS).items():
+            setattr(self, name, nodes)
 
-        bp = requests.get(IMPORT_BASE_URL + '/api/blogpost').json()['nodes']
-        self.blog_posts = [b['node'] for b in bp]
+        self.index_data()
 
-        bp_img = requests.get(
-            IMPORT_BASE_URL + '/api/blogpost-image').json()['nodes']
-        self.blog_posts_images = [b['node'] for b in bp_img]
+    def index_data(self):
+        """
+        Indexes the fetched nodes by the IDs they are looked up by, so each
+        lookup is a dict access rather than a scan of the whole payload.
+        Only the image nodes of the crops imported are kept.
+        """
+        self.concert_dates_by_nid = index_by(
+            self.concert_dates, lambda d: d['nid'])
+        self.performances_by_nid = group_by(
+            self.concert_performances, lambda p: p['nid'])
+        for performances in self.performances_by_nid.values():
+            performances.sort(key=lambda p: p['program_order'])
+        self.soloists_by_performance_id = group_by(
+            self.concert_soloists, lambda s: s['performance_id'])
+        self.concert_photos_by_nid = index_by(
+            (p for p in self.concert_photos
+             if p['crop_style_name'] == CONCERT_IMAGE_CROP),
+            lambda p: p['nid'])
+        self.headshots_by_uid = index_by(
+            (p for p in self.headshots
+             if p['crop_style_name'] == HEADSHOT_CROP),
+            lambda p: p['uid'])
+        self.blog_images_by_nid = index_by(
+            (p for p in self.blog_posts_images
+             if p['crop_style_name'] == BLOG_IMAGE_CROP),
+            lambda p: p['nid'])
 
     def escape_markup(self, text):
         text = linebreaks(text, autoescape=True)
@@ -89,92 +204,94 @@ class Command(BaseCommand):
     def get_concert_dates(self, cid):
         """Gets concert dates by concert ID"""
         print('cid: ' + str(cid))
-        return [d for d in self.concert_dates if d['nid'] == str(cid)][0]
+        return self.concert_dates_by_nid[str(cid)]
 
     def get_concert_performances(self, nid):
-        """Gets concert performances by concert ID"""
-        performances = [p for p in self.concert_performances
-                        if p['nid'] == str(nid)]
-        return sorted(performances, key=lambda p: p['program_order'])
+        """Gets concert performances by concert ID, in program order"""
+        return self.performances_by_nid.get(str(nid), [])
 
     def get_soloists_by_performance_id(self, nid):
         """Gets soloists by performance ID"""
-        return [s for s in self.concert_soloists
-                if s['performance_id'] == str(nid)]
+        return self.soloists_by_performance_id.get(str(nid), [])
 
     def get_concert_photo_by_id(self, nid):
         """
         Gets concert images by node id
         Note: this uses the tightest crop to set the focal point for the image
         """
-        try:
-            return [p for p in self.concert_photos
-                    if (p['nid'] == str(nid) and
-                        p['crop_style_name'] == 'tcs2r_concert_image_0_79')][0]
-        except IndexError:
-            return None
+        return self.concert_photos_by_nid.get(str(nid))
 
     def get_headshot_by_uid(self, uid):
-        try:
-            return [p for p in self.headshots
-                    if (p['uid'] == str(uid) and
-                        p['crop_style_name'] ==
-                        'tcs2r_musician_headshot_1_5')][0]
-        except IndexError:
-            return None
+        return self.headshots_by_uid.get(str(uid))
 
     def get_blog_img_from_id(self, nid):
-        try:
-            return [p for p in self.blog_posts_images
-                    if (p['nid'] == str(nid) and
-                        p['crop_style_name'] ==
-                        'tsc2r_blog_list___homepage_desktop')][0]
-        except IndexError:
-            return None
+        return self.blog_images_by_nid.get(str(nid))
 
-    def get_wagtail_image(self, url):
+    def download_images(self, image_nodes, field):
         """
-        Looks for an existing image with the same name, otherwise downloads
-        and saves the image.
-        From: https://github.com/kevinhowbrook/wagtail-migration/blob/debdead7d5e9b3f00439e803642a3ef45ad2bb19/importers/base.py#L127
+        Downloads the images of the given image nodes, before the stage that
+        imports them
         """
-        filename = self._filename_from_url(url)
+        with self.timed('images'):
+            self.images.update(self.site.download_images(
+                n[field]['src'] for n in image_nodes if n))
 
-        # see if an image with the same name exists
-        try:
-            return WagtailImage.objects.get(title=filename)
-        except WagtailImage.DoesNotExist:
-            pass
-
-        # otherwise download
-        print(f"Downloading {url}")
-        response = requests.get(url)
-
-        if response.status_code != 200:
-            print(f"Error {response.status_code} downloading: {url}")
-            return None
-
-        # check its a valid image
-        pil_image = Image.open(BytesIO(response.content))
-        pil_image.verify()
-
-        # save and return
-        return WagtailImage.objects.create(
-            title=filename,
-            file=SimpleUploadedFile(filename, response.content)
-        )
+    def diff(self, source, model, nodes, legacy_id, content):
+        """
+        Returns the sync state of a source, the nodes to create, and, with
+        --sync, the changed nodes to update by the pk of their record
+        """
+        state = self.sync_states[source] = SyncState(source, model)
+        new, changed = state.diff(nodes, legacy_id, content)
+        if not self.sync:
+            state.counts['skipped'] += len(changed)
+            changed = {}
+        return state, new, changed
+
+    def concert_content(self, c):
+        """The nodes a concert is imported from"""
+        performances = self.get_concert_performances(c['nid'])
+        return [
+            c,
+            self.concert_dates_by_nid.get(str(c['nid'])),
+            performances,
+            [self.get_soloists_by_performance_id(p['performance_id'])
+             for p in performances],
+            self.get_concert_photo_by_id(c['nid']),
+        ]
+
+    def person_content(self, p):
+        """The nodes a person is imported from, except their biography"""
+        return [
+            {key: value for key, value in p.items() if key != 'biography'},
+            self.get_headshot_by_uid(p['uid']),
+        ]
+
+    def blog_post_content(self, post):
+        """The nodes a blog post is imported from"""
+        return [post, self.get_blog_img_from_id(post['nid'])]
 
-    def _filename_from_url(self, url):
-        url_parsed = parse.urlparse(url)
-        return os.path.split(url_parsed.path)[1]
+    def get_wagtail_image(self, url):
+        return get_wagtail_image(url, self.images)
+
+    def import_image(self, node, field):
+        """Imports an image node's image, with the focal point of its crop"""
+        image = self.get_wagtail_image(node[field]['src'])
+        image.focal_point_x = node['crop_area_X_offset']
+        image.focal_point_y = node['crop_area_Y_offset']
+        image.focal_point_width = node['crop_area_width']
+        image.focal_point_height = node['crop_area_height']
+        image.save()
+        return image
+
+    def get_instrument(self, name):
+        if name not in self.instruments:
+            self.instruments[name], created = InstrumentModel.objects.\
+                get_or_create(instrument=name)
+        return self.instruments[name]
 
     def get_or_create_person(self, name):
-        name = name.strip()
-        first = last = ''
-        try:
-            first, last = re.split(r'\s+', name, 1)
-        except ValueError:
-            last = name
+        first, last = split_name(name)
 
         try:
             return Person.objects.get(first_name=first, last_name=last)
@@ -252,7 +369,7 @@ class Command(BaseCommand):
             concert.concert_date.add(c_date)
             concert.save_revision().publish()
 
-    def create_concert(self, c):
+    def build_concert(self, c):
         venue = c['concert_location'] if c['concert_location'] \
             else "St. Paul's Church"
 
@@ -264,20 +381,16 @@ class Command(BaseCommand):
             legacy_id=c['nid']
         )
         concert.season = c['concert_season']
+        return concert
+
+    def create_concert(self, c):
+        concert = self.build_concert(c)
         self.concert_idx.add_child(instance=concert)
         concert.save_revision().publish()
 
         c_img = self.get_concert_photo_by_id(c['nid'])
         if c_img:
-            concert_image = self.get_wagtail_image(
-                c_img['concert_image']['src'])
-
-            concert_image.focal_point_x = c_img['crop_area_X_offset']
-            concert_image.focal_point_y = c_img['crop_area_Y_offset']
-            concert_image.focal_point_width = c_img['crop_area_width']
-            concert_image.focal_point_height = c_img['crop_area_height']
-            concert_image.save()
-            concert.concert_image = concert_image
+            concert.concert_image = self.import_image(c_img, 'concert_image')
             concert.save()
 
         # Create a redirect
@@ -288,99 +401,418 @@ class Command(BaseCommand):
         if not self.concerts:
             self.fetch_data()
 
-        concerts = (c for c in self.concerts
-                    if not Concert.objects.filter(legacy_id=c['nid']).exists())
+        state, concerts, changed = self.diff(
+            'concerts', Concert, self.concerts, lambda c: c['nid'],
+            self.concert_content)
+        self.download_images(
+            [self.get_concert_photo_by_id(c['nid'])
+             for c in concerts + list(changed.values())],
+            'concert_image')
+        self.update_concerts(changed, state)
+        if self.bulk:
+            return self.bulk_create_concerts(concerts, state)
+
         for c in concerts:
             print('Creating concert: ' + c['title'])
-            # Create the concert
-            concert = self.create_concert(c)
-            # Create dates for the concert
-            self.create_concert_dates(concert)
-            # Create performances
-            self.create_performances(concert)
+            with transaction.atomic():
+                # Create the concert
+                concert = self.create_concert(c)
+                # Create dates for the concert
+                self.create_concert_dates(concert)
+                # Create performances
+                self.create_performances(concert)
+                state.record([c['nid']], 'created')
+
+    def update_concerts(self, changed, state):
+        """Updates changed concerts, replacing their dates and program"""
+        for concert in Concert.objects.in_bulk(list(changed)).values():
+            c = changed[concert.pk]
+            print('Updating concert: ' + c['title'])
+            with transaction.atomic():
+                for performance in Performance.objects.child_of(concert):
+                    performance.delete()
+                ConcertDate.objects.filter(concert=concert).delete()
+
+                copy_fields(self.build_concert(c), concert, CONCERT_FIELDS)
+                c_img = self.get_concert_photo_by_id(c['nid'])
+                if c_img:
+                    concert.concert_image = self.import_image(
+                        c_img, 'concert_image')
+                concert.save_revision().publish()
+                Redirect.objects.get_or_create(
+                    old_path=c['path'], site=None,
+                    defaults={'redirect_page': concert})
+
+                self.create_concert_dates(concert)
+                self.create_performances(concert)
+                state.record([c['nid']], 'updated')
 
     def create_people(self):
         if not self.people:
             self.fetch_data()
 
-        persons = (p for p in self.people
-                   if not Person.objects.filter(legacy_id=p['uid']).exists())
+        state, persons, changed = self.diff(
+            'people', Person, self.people, lambda p: p['uid'],
+            self.person_content)
+        self.download_images(
+            [self.get_headshot_by_uid(p['uid'])
+             for p in persons + list(changed.values())],
+            'head_shot')
+        self.update_people(changed, state)
+        if self.bulk:
+            return self.bulk_create_people(persons, state)
+
         for p in persons:
             print('Now creating: ' + p['name'])
-            active_roster = True if p['active_roster'] == "Yes" else False
-            person = Person(
-                first_name=p['first_name'],
-                last_name=p['last_name'],
-                biography=self.escape_markup(p['biography']),
-                position=p['orchestra_admin_position'],
-                active_roster=active_roster,
-                legacy_id=p['uid']
-            )
-            self.person_idx.add_child(instance=person)
-            person.save_revision().publish()
-
-            instrument, created = InstrumentModel.objects.\
-                get_or_create(instrument=p['instrument'])
-            person.instrument.add(instrument)
-            person.save_revision().publish()
-
-            h_img = self.get_headshot_by_uid(p['uid'])
-            if h_img:
-                headshot = self.get_wagtail_image(h_img['head_shot']['src'])
-                headshot.focal_point_x = h_img['crop_area_X_offset']
-                headshot.focal_point_y = h_img['crop_area_Y_offset']
-                headshot.focal_point_width = h_img['crop_area_width']
-                headshot.focal_point_height = h_img['crop_area_height']
-                headshot.save()
-                person.headshot = headshot
-                person.save()
+            with transaction.atomic():
+                person = self.build_person(p)
+                self.person_idx.add_child(instance=person)
+                person.save_revision().publish()
+
+                person.instrument.add(self.get_instrument(p['instrument']))
+                person.save_revision().publish()
+
+                h_img = self.get_headshot_by_uid(p['uid'])
+                if h_img:
+                    person.headshot = self.import_image(h_img, 'head_shot')
+                    person.save()
+                state.record([p['uid']], 'created')
+
+    def update_people(self, changed, state):
+        for person in Person.objects.in_bulk(list(changed)).values():
+            p = changed[person.pk]
+            print('Now updating: ' + p['name'])
+            with transaction.atomic():
+                copy_fields(self.build_person(p), person, PERSON_FIELDS)
+                person.instrument = [self.get_instrument(p['instrument'])]
+                h_img = self.get_headshot_by_uid(p['uid'])
+                if h_img:
+                    person.headshot = self.import_image(h_img, 'head_shot')
+                person.save_revision().publish()
+                state.record([p['uid']], 'updated')
+
+    def build_person(self, p):
+        active_roster = True if p['active_roster'] == "Yes" else False
+        return Person(
+            first_name=p['first_name'],
+            last_name=p['last_name'],
+            biography=self.escape_markup(p['biography']),
+            position=p['orchestra_admin_position'],
+            active_roster=active_roster,
+            legacy_id=p['uid']
+        )
 
     def create_blogposts(self):
         if not self.blog_posts:
             self.fetch_data()
 
-        posts = (p for p in self.blog_posts
-                 if not BlogPost.objects.filter(legacy_id=p['nid']).exists())
+        state, posts, changed = self.diff(
+            'blog_posts', BlogPost, self.blog_posts, lambda p: p['nid'],
+            self.blog_post_content)
+        self.download_images(
+            [self.get_blog_img_from_id(p['nid'])
+             for p in posts + list(changed.values())],
+            'blog_image')
+        self.update_blogposts(changed, state)
+        if self.bulk:
+            return self.bulk_create_blogposts(posts, state)
+
         for post in posts:
             print('Creating blog post: ' + post['title'])
-            # This assumes that all Persons will be created first
-            author = Person.objects.get(legacy_id=post['author_uid'])
-            blog_post = BlogPost(
-                title=post['title'],
-                legacy_id=post['nid'],
-                promo_copy=post['promo_copy'],
-                body=self.escape_markup(post['body']),
-                author=author,
-                date=parse_date(post['post_date'])
-            )
-            self.blog_idx.add_child(instance=blog_post)
-            blog_post.save_revision().publish()
-
-            # Create a redirect
-            Redirect.objects.create(
-                old_path=post['path'],
-                redirect_page=blog_post)
-
-            blog_img = self.get_blog_img_from_id(post['nid'])
-            if blog_img:
-                blog_image = self.get_wagtail_image(
-                    blog_img['blog_image']['src'])
-                blog_image.focal_point_x = blog_img['crop_area_X_offset']
-                blog_image.focal_point_y = blog_img['crop_area_Y_offset']
-                blog_image.focal_point_width = blog_img['crop_area_width']
-                blog_image.focal_point_height = blog_img['crop_area_height']
-                blog_image.save()
-                blog_post.blog_image = blog_image
+            with transaction.atomic():
+                # This assumes that all Persons will be created first
+                author = Person.objects.get(legacy_id=post['author_uid'])
+                blog_post = self.build_blog_post(post, author)
+                self.blog_idx.add_child(instance=blog_post)
                 blog_post.save_revision().publish()
 
+                # Create a redirect
+                Redirect.objects.create(
+                    old_path=post['path'],
+                    redirect_page=blog_post)
+
+                blog_img = self.get_blog_img_from_id(post['nid'])
+                if blog_img:
+                    blog_post.blog_image = self.import_image(
+                        blog_img, 'blog_image')
+                    blog_post.save_revision().publish()
+                state.record([post['nid']], 'created')
+
+    def update_blogposts(self, changed, state):
+        authors = self.people_by_legacy_id(
+            p['author_uid'] for p in changed.values())
+        for blog_post in BlogPost.objects.in_bulk(list(changed)).values():
+            post = changed[blog_post.pk]
+            print('Updating blog post: ' + post['title'])
+            with transaction.atomic():
+                copy_fields(
+                    self.build_blog_post(
+                        post, authors[int(post['author_uid'])]),
+                    blog_post, BLOG_POST_FIELDS)
+                blog_img = self.get_blog_img_from_id(post['nid'])
+                if blog_img:
+                    blog_post.blog_image = self.import_image(
+                        blog_img, 'blog_image')
+                blog_post.save_revision().publish()
+                Redirect.objects.get_or_create(
+                    old_path=post['path'], site=None,
+                    defaults={'redirect_page': blog_post})
+                state.record([post['nid']], 'updated')
+
+    def build_blog_post(self, post, author):
+        return BlogPost(
+            title=post['title'],
+            legacy_id=post['nid'],
+            promo_copy=post['promo_copy'],
+            body=self.escape_markup(post['body']),
+            author=author,
+            date=parse_date(post['post_date'])
+        )
+
+    def bulk_published(self, pages):
+        """
+        Does what publishing pages one by one would for a batch of pages
+        created in bulk, once the batch commits: indexes them, and purges
+        what they appear in, which also has processes rebuild their search
+        suggestions. It is called inside the batch's transaction, so that
+        this waits for the batch to commit. The renditions of their images
+        aren't prerendered here: saving an imported image queues that, and
+        the task runs once the batch, and the pages using the image, are
+        committed.
+        """
+        index_in_bulk(pages)
+        transaction.on_commit(lambda: purge_cache_tags(BULK_PURGE_TAGS))
+
+    def people_by_legacy_id(self, uids):
+        return Person.objects.in_bulk(
+            {int(uid) for uid in uids if uid}, field_name='legacy_id')
+
+    def bulk_create_people(self, persons, state):
+        for batch in batches(persons, self.batch_size):
+            with transaction.atomic():
+                writer = PageTreeWriter(self.person_idx)
+                for p in batch:
+                    print('Now creating: ' + p['name'])
+                    person = self.build_person(p)
+                    person.title = str(person)
+                    h_img = self.get_headshot_by_uid(p['uid'])
+                    if h_img:
+                        person.headshot = self.import_image(h_img, 'head_shot')
+                    writer.add(person)
+
+                    person.instrument = [self.get_instrument(p['instrument'])]
+                bulk_create_m2m(writer.pages, 'instrument')
+                writer.publish()
+                state.record([p['uid'] for p in batch], 'created')
+                self.bulk_published(writer.pages)
+
+    def bulk_get_people_by_name(self, names):
+        """
+        Returns people by name, as get_or_create_person would find them,
+        creating the missing people in bulk
+        """
+        names = {name: split_name(name) for name in names}
+        people = {}
+        for person in Person.objects.filter(
+                last_name__in={last for first, last in names.values()})\
+                .order_by('pk'):
+            people.setdefault((person.first_name, person.last_name), person)
+
+        missing = {key for key in names.values() if key not in people}
+        if not missing:
+            return {name: people[key] for name, key in names.items()}
+        with transaction.atomic():
+            writer = PageTreeWriter(self.person_idx)
+            for first, last in missing:
+                person = Person(
+                    first_name=first,
+                    last_name=last,
+                    active_roster=False
+                )
+                person.title = str(person)
+                person.instrument = []
+                people[(first, last)] = writer.add(person)
+            writer.publish()
+            self.bulk_published(writer.pages)
+        return {name: people[key] for name, key in names.items()}
+
+    def bulk_get_compositions(self, performances):
+        """
+        Returns the compositions of the given performance nodes by title, as
+        get_or_create_composition would, creating the missing compositions
+        and composers
+        """
+        compositions = {}
+        for composition in Composition.objects.filter(
+                title__in={p['composition'] for p in performances})\
+                .order_by('pk'):
+            compositions.setdefault(composition.title, composition)
+
+        # Missing compositions are created with the composer of their first
+        # performance
+        missing = {}
+        for p in performances:
+            if p['composition'] not in compositions:
+                missing.setdefault(p['composition'], p['composer'])
+        composers = self.bulk_get_people_by_name(
+            {composer for composer in missing.values() if composer})
+        for title, composer in missing.items():
+            compositions[title] = Composition.objects.create(
+                title=title,
+                composer=composers[composer] if composer else None
+            )
+        return compositions
+
+    def bulk_create_concerts(self, concerts, state):
+        performances = [p for c in concerts
+                        for p in self.get_concert_performances(c['nid'])]
+        compositions = self.bulk_get_compositions(performances)
+        # This assumes that all Person objects are created first
+        people = self.people_by_legacy_id(
+            [p['conductor_uid'] for p in performances] +
+            [s['uid'] for p in performances
+             for s in self.get_soloists_by_performance_id(
+                 p['performance_id'])])
+
+        for batch in batches(concerts, self.batch_size):
+            with transaction.atomic():
+                writers = self.bulk_create_concert_batch(
+                    batch, compositions, people)
+                state.record([c['nid'] for c in batch], 'created')
+                self.bulk_published(
+                    [page for writer in writers for page in writer.pages])
+
+    def bulk_create_concert_batch(self, batch, compositions, people):
+        """
+        Creates a batch of concerts and their performances, writing their
+        dates, performers and redirects in bulk
+        """
+        writer = PageTreeWriter(self.concert_idx)
+        performance_writers = []
+        dates = []
+        performance_dates = []
+        performers = []
+        concert_performers = []
+        redirects = []
+        for c in batch:
+            print('Creating concert: ' + c['title'])
+            concert = self.build_concert(c)
+            c_img = self.get_concert_photo_by_id(c['nid'])
+            if c_img:
+                concert.concert_image = self.import_image(
+                    c_img, 'concert_image')
+            writer.add(concert)
+            redirects.append(
+                Redirect(old_path=c['path'], redirect_page=concert))
+
+            concert.concert_date = [
+                ConcertDate(date=make_aware(parse_datetime(d)))
+                for d in self.get_concert_dates(c['nid'])[
+                    'concert_date'].split(', ')]
+            concert_dates = list(concert.concert_date.all())
+            dates += concert_dates
+            concert.first_date = min(d.date for d in concert_dates)
+            concert.last_date = max(d.date for d in concert_dates)
+            concert.date_count = len(concert_dates)
+
+            performance_writer = PageTreeWriter(concert, new_parent=True)
+            performance_writers.append(performance_writer)
+            soloists = []
+            for perf in self.get_concert_performances(c['nid']):
+                print('Creating performance for concert ' + concert.title +
+                      ': ' + perf['composition'])
+                composition = compositions[perf['composition']]
+                performance = Performance(
+                    title=str(composition),
+                    conductor=people[int(perf['conductor_uid'])]
+                    if perf['conductor_uid'] else None,
+                    composition=composition
+                )
+                performance_writer.add(performance)
+
+                days = {parse_date(d)
+                        for d in re.split(r', ', perf['performance_date'])}
+                performance.performance_date = [
+                    d for d in concert_dates
+                    if localtime(d.date).date() in days]
+                performance_dates.append(performance)
+
+                performance.performer = [
+                    Performer(
+                        person=people[int(s['uid'])],
+                        instrument=self.get_instrument(s['instrument']),
+                        sort_order=i)
+                    for i, s in enumerate(self.get_soloists_by_performance_id(
+                        perf['performance_id']))]
+                performers += performance.performer.all()
+                soloists += [p.person for p in performance.performer.all()
+                             if p.person not in soloists]
+
+            concert.performer = [
+                ConcertPerformer(person=person, sort_order=i)
+                for i, person in enumerate(soloists)]
+            concert_performers += concert.performer.all()
+            concert.roster = []
+
+        # Performances link to the concert dates by their IDs, which they
+        # have once they are created
+        ConcertDate.objects.bulk_create(dates)
+        bulk_create_m2m(performance_dates, 'performance_date')
+        Performer.objects.bulk_create(performers)
+        ConcertPerformer.objects.bulk_create(concert_performers)
+        Concert.objects.bulk_update(writer.pages, Concert.DATE_RANGE_FIELDS)
+        Redirect.objects.bulk_create(redirects)
+
+        for performance_writer in performance_writers:
+            performance_writer.publish()
+        writer.publish()
+        return [writer] + performance_writers
+
+    def bulk_create_blogposts(self, posts, state):
+        # This assumes that all Persons will be created first
+        authors = self.people_by_legacy_id(p['author_uid'] for p in posts)
+        for batch in batches(posts, self.batch_size):
+            with transaction.atomic():
+                writer = PageTreeWriter(self.blog_idx)
+                redirects = []
+                for post in batch:
+                    print('Creating blog post: ' + post['title'])
+                    blog_post = self.build_blog_post(
+                        post, authors[int(post['author_uid'])])
+                    blog_img = self.get_blog_img_from_id(post['nid'])
+                    if blog_img:
+                        blog_post.blog_image = self.import_image(
+                            blog_img, 'blog_image')
+                    writer.add(blog_post)
+                    redirects.append(Redirect(
+                        old_path=post['path'], redirect_page=blog_post))
+                Redirect.objects.bulk_create(redirects)
+                writer.publish()
+                state.record([p['nid'] for p in batch], 'created')
+                self.bulk_published(writer.pages)
+
     def handle(self, *args, **kwargs):
-        self.fetch_data()
+        self.site = site_from_options(kwargs)
+        self.bulk = kwargs['bulk']
+        self.batch_size = kwargs['batch_size']
+        self.sync = kwargs['sync']
+        with self.timed('fetch'):
+            self.fetch_data()
+
+        # Pages created in bulk are indexed in bulk, a batch at a time
+        with deferred_search_indexing(BULK_PAGE_MODELS if self.bulk else []):
+            # Create people first, so that Concerts and Blogs can reference
+            # them
+            with self.timed('people'):
+                self.create_people()
 
-        # Create people first, so that Concerts and Blogs can reference them
-        self.create_people()
+            # Then create concerts
+            with self.timed('concerts'):
+                self.create_concerts()
 
-        # Then create concerts
-        self.create_concerts()
+            # Then create blog posts
+            with self.timed('blog posts'):
+                self.create_blogposts()
 
-        # Then create blog posts
-        self.create_blogposts()
+        self.print_counts()
+        self.print_timings()
@@ -1,11 +1,12 @@
 """Import biographies from Drupal site"""
 import re
-import requests
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils.html import linebreaks
 from wagtail.core.rich_text import RichText
+from chelseasymphony.main.legacy import (
+    SyncState, add_site_arguments, site_from_options)
 from chelseasymphony.main.models import Person
-IMPORT_BASE_URL = 'https://chelseasymphony.org'
 
 
 class Command(BaseCommand):
@@ -15,10 +16,8 @@ class Command(BaseCommand):
         "empty strings in the import data"
     )
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        users = requests.get(IMPORT_BASE_URL + '/api/users').json()['nodes']
-        self.people = [p['node'] for p in users]
+    def add_arguments(self, parser):
+        add_site_arguments(parser)
 
     @staticmethod
     def escape_markup(text):
@@ -30,21 +29,34 @@ class Command(BaseCommand):
     def handle(self, *args, **kwargs):
         """Import User bios
 
-        Look up person self.people from legacy id
-        Get the bio text from the dict
+        Look up the people whose biography has changed since it was last
+        imported, in one query
         clean the text, as done in the import script
         Add it to the biography field
-        Save revision and publish
+        Save revision and publish, recording the biography's hash in the
+        same transaction, so an interrupted run resumes where it stopped
         """
-        for person in Person.objects.all():
-
-            try:
-                data = [prs for prs in self.people
-                        if str(person.legacy_id) == prs['uid']][0]
-            except IndexError:
-                pass
-
-            if data['biography']:
-                clean_bio = self.escape_markup(data['biography'])
-                person.biography = [('paragraph', RichText(clean_bio))]
-                person.save_revision().publish()
+        people = site_from_options(kwargs).fetch('people')['people']
+        people_by_uid = {}
+        for prs in people:
+            people_by_uid.setdefault(prs['uid'], prs)
+
+        state = SyncState('biographies', Person)
+        new, changed = state.diff(
+            people_by_uid.values(), lambda p: p['uid'],
+            lambda p: p['biography'])
+        # Biographies are only imported for people that exist
+        state.counts['skipped'] += len(new)
+
+        for person in Person.objects.in_bulk(list(changed)).values():
+            data = changed[person.pk]
+            with transaction.atomic():
+                if data['biography']:
+                    clean_bio = self.escape_markup(data['biography'])
+                    person.biography = [('paragraph', RichText(clean_bio))]
+                    person.save_revision().publish()
+                    state.record([data['uid']], 'updated')
+                else:
+                    state.record([data['uid']], 'skipped')
+
+        print('Biographies: ' + state.report())
@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connections
+from chelseasymphony.main.renditions import (
+    PRERENDER_MODELS, generate_renditions, image_fields, rendition_specs)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates the image renditions the templates use for every live "
+        "page, such as after a deploy that changes a filter spec"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Number of images to generate renditions for at once')
+
+    def handle(self, *args, **options):
+        specs = rendition_specs()
+        needed = dict()
+        for model in PRERENDER_MODELS:
+            for field in image_fields(model):
+                image_ids = model.objects.live()\
+                    .exclude(**{field: None})\
+                    .values_list(field + '_id', flat=True)
+                for image_id in image_ids:
+                    needed.setdefault(image_id, set()).update(specs[field])
+
+        def generate(image_id):
+            try:
+                generate_renditions(image_id, sorted(needed[image_id]))
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            list(executor.map(generate, needed))
+
+        self.stdout.write('Generated renditions for {} images'.format(
+            len(needed)))
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from chelseasymphony.main.profiling import get_report, reset_report
+from chelseasymphony.search.results import cache_stats, reset_cache_stats
+
+ROW = '{:<36} {:>8} {:>8} {:>8} {:>8} {:>8} {:>10} {:>10} {:>8}'
+
+
+class Command(BaseCommand):
+    help = (
+        "Reports the average queries, duplicate queries, database time, "
+        "template time and rendition queries of each page type and route, "
+        "as recorded by QueryProfileMiddleware, and the search result "
+        "cache's hits and misses"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Clear the recorded profiles after reporting them')
+
+    def handle(self, *args, **kwargs):
+        report = get_report()
+        budgets = getattr(settings, 'QUERY_BUDGETS', {})
+        self.stdout.write(ROW.format(
+            'Page', 'Requests', 'Queries', 'Max', 'Budget', 'Dupes',
+            'DB ms', 'Render ms', 'Rend Qs'))
+        for label, stats in report.items():
+            n = stats['requests']
+            self.stdout.write(ROW.format(
+                label, n,
+                round(stats['queries'] / n, 1),
+                stats['max_queries'],
+                budgets.get(label, '-'),
+                round(stats['duplicates'] / n, 1),
+                round(stats['db_time'] * 1000 / n, 1),
+                round(stats['template_time'] * 1000 / n, 1),
+                round(stats['rendition_queries'] / n, 1)))
+
+        search = cache_stats()
+        self.stdout.write('Search cache: {} hits, {} misses'.format(
+            search['hits'], search['misses']))
+
+        if kwargs['reset']:
+            reset_report()
+            reset_cache_stats()
@@ -0,0 +1,37 @@
+from time import sleep
+from django.core.management.base import BaseCommand
+from chelseasymphony.main.tasks import run_queued_tasks
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the queued background tasks that are due, including those "
+        "whose worker stopped before finishing them. The Docker image keeps "
+        "it running with --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int,
+            help='Number of tasks to take at a time')
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep checking for queued tasks until interrupted')
+        parser.add_argument(
+            '--interval', type=float, default=10,
+            help='Seconds to wait between checks with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            # Run batches until no task is due
+            total = 0
+            done = run_queued_tasks(options['batch_size'])
+            while done:
+                total += done
+                done = run_queued_tasks(options['batch_size'])
+            if total:
+                self.stdout.write('Ran {} tasks'.format(total))
+
+            if not options['loop']:
+                return
+            sleep(options['interval'])
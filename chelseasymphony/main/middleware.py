@@ -0,0 +1,85 @@
+"""Middleware"""
+from time import perf_counter
+from django.conf import settings
+from django.db import connection
+from .caching import cache_page, get_cached_page
+from .profiling import RequestProfile
+
+
+class PageCacheMiddleware:
+    """
+    Serves anonymous GET requests for Wagtail pages from the page cache.
+
+    Pages are only cached if the `before_serve_page` hook marked the request
+    as cacheable, by giving it a set of `page_cache_tags`. Responses carry an
+    `X-Page-Cache` header of HIT or MISS.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def is_cacheable(self, request):
+        return (
+            getattr(settings, 'PAGE_CACHE_ENABLED', False) and
+            request.method == 'GET' and
+            settings.SESSION_COOKIE_NAME not in request.COOKIES and
+            not request.user.is_authenticated
+        )
+
+    def __call__(self, request):
+        if not self.is_cacheable(request):
+            return self.get_response(request)
+
+        response = get_cached_page(request)
+        if response is not None:
+            response['X-Page-Cache'] = 'HIT'
+            return response
+
+        response = self.get_response(request)
+        tags = getattr(request, 'page_cache_tags', None)
+        # Responses that set cookies, such as a CSRF token, are per visitor
+        if tags is None or response.status_code != 200 or \
+                response.streaming or response.cookies or \
+                request.META.get('CSRF_COOKIE_USED'):
+            return response
+
+        cache_page(request, response, tags)
+        response['X-Page-Cache'] = 'MISS'
+        return response
+
+
+class QueryProfileMiddleware:
+    """
+    Profiles the queries and template rendering of each Wagtail page request.
+
+    The `before_serve_page` hook labels the request with the page type and
+    route. Labelled profiles are aggregated for `manage.py query_report`,
+    and with DEBUG on, are returned as `X-Query-Count` and related headers.
+    This should be the first middleware, so that every query is counted.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'QUERY_PROFILE_ENABLED', False):
+            return self.get_response(request)
+
+        profile = request.profile = RequestProfile()
+        with connection.execute_wrapper(profile):
+            response = self.get_response(request)
+
+        if profile.label is not None:
+            profile.record()
+            if settings.DEBUG:
+                for header, value in profile.headers().items():
+                    response[header] = value
+        return response
+
+    def process_template_response(self, request, response):
+        profile = getattr(request, 'profile', None)
+        if profile is not None:
+            start = perf_counter()
+
+            def rendered(response):
+                profile.template_time += perf_counter() - start
+            response.add_post_render_callback(rendered)
+        return response
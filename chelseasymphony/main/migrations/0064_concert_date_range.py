@@ -0,0 +1,53 @@
+# Generated by Django 3.2.20 on 2026-10-18 15:04
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def backfill_date_ranges(apps, schema_editor):
+    Concert = apps.get_model('main', 'Concert')
+    ranges = Concert.objects.annotate(
+        first=Min('concert_date__date'),
+        last=Max('concert_date__date'),
+        count=Count('concert_date')
+    ).values_list('pk', 'first', 'last', 'count')
+    for pk, first, last, count in ranges:
+        Concert.objects.filter(pk=pk).update(
+            first_date=first, last_date=last, date_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0063_auto_20230811_2332'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='concert',
+            name='date_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='concert',
+            name='first_date',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='concert',
+            name='last_date',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='concert',
+            index=models.Index(fields=['last_date', 'first_date'], name='concert_last_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='concert',
+            index=models.Index(fields=['season', 'last_date'], name='concert_season_last_date_idx'),
+        ),
+        migrations.RunPython(
+            backfill_date_ranges,
+            migrations.RunPython.noop
+        ),
+    ]
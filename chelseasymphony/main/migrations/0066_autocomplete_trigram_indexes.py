@@ -0,0 +1,43 @@
+# Generated by Django 3.2.20 on 2026-10-18 16:20
+
+from django.db import migrations
+
+# Admin autocomplete filters with `icontains`, which Postgres runs as
+# `UPPER(column) LIKE UPPER('%term%')`, so the trigram indexes are on the
+# upper cased columns. Other databases go without.
+TRIGRAM_INDEXES = [
+    ('main_composition_title_trgm', 'main_composition', 'title'),
+    ('main_person_first_name_trgm', 'main_person', 'first_name'),
+    ('main_person_last_name_trgm', 'main_person', 'last_name'),
+    ('main_instrumentmodel_instrument_trgm', 'main_instrumentmodel',
+     'instrument'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS {} ON {} '
+            'USING gin (UPPER({}::text) gin_trgm_ops)'.format(
+                name, table, column))
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0065_outboundemail'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
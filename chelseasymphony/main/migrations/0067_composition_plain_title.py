@@ -0,0 +1,71 @@
+# Generated by Django 3.2.20 on 2026-10-18 16:45
+
+from html import unescape
+import re
+import string
+import unicodedata
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+
+def sort_key(plain_title):
+    text = ''.join(c for c in unicodedata.normalize('NFKD', plain_title)
+                   if not unicodedata.combining(c))
+    text = ' '.join(text.casefold().split()).lstrip(string.punctuation)
+    return re.sub(r'\d+', lambda m: m.group().zfill(8), text)
+
+
+def backfill_plain_titles(apps, schema_editor):
+    Composition = apps.get_model('main', 'Composition')
+    compositions = list(Composition.objects.only('title'))
+    for c in compositions:
+        c.plain_title = unescape(strip_tags(c.title))
+        c.sort_title = sort_key(c.plain_title)
+    Composition.objects.bulk_update(
+        compositions, ['plain_title', 'sort_title'], batch_size=500)
+
+
+def move_trigram_index(apps, schema_editor):
+    """Admin autocomplete now searches the plain title"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS main_composition_title_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS main_composition_plain_title_trgm '
+        'ON main_composition USING gin (UPPER(plain_title::text) '
+        'gin_trgm_ops)')
+
+
+def restore_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'DROP INDEX IF EXISTS main_composition_plain_title_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS main_composition_title_trgm '
+        'ON main_composition USING gin (UPPER(title::text) gin_trgm_ops)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0066_autocomplete_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='composition',
+            name='plain_title',
+            field=models.TextField(db_index=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='composition',
+            name='sort_title',
+            field=models.TextField(db_index=True, default='', editable=False),
+        ),
+        migrations.RunPython(
+            backfill_plain_titles,
+            migrations.RunPython.noop
+        ),
+        migrations.RunPython(move_trigram_index, restore_trigram_index),
+    ]
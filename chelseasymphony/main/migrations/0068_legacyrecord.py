@@ -0,0 +1,26 @@
+# Generated by Django 3.2.20 on 2026-10-18 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0067_composition_plain_title'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LegacyRecord',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=32)),
+                ('legacy_id', models.IntegerField()),
+                ('content_hash', models.CharField(max_length=64)),
+                ('synced', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('source', 'legacy_id')},
+            },
+        ),
+    ]
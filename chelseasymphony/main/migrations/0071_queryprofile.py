@@ -0,0 +1,27 @@
+# Generated by Django 3.2.20 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0070_outboundemail_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=255, unique=True)),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('queries', models.PositiveIntegerField(default=0)),
+                ('max_queries', models.PositiveIntegerField(default=0)),
+                ('duplicates', models.PositiveIntegerField(default=0)),
+                ('db_time', models.FloatField(default=0)),
+                ('template_time', models.FloatField(default=0)),
+                ('rendition_queries', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 3.2.20 on 2026-10-18 23:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0071_queryprofile'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='OutboundEmail',
+        ),
+    ]
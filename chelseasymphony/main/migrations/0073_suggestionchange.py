@@ -0,0 +1,27 @@
+# Generated by Django 3.2.20 on 2026-10-18 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0072_delete_outboundemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SuggestionChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_type', models.CharField(max_length=32)),
+                ('item_pk', models.PositiveIntegerField()),
+                ('suggestion', models.JSONField(null=True)),
+                ('changed', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='suggestionchange',
+            index=models.Index(fields=['item_type', 'item_pk'], name='main_sugges_item_ty_f6cb65_idx'),
+        ),
+    ]
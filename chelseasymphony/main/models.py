@@ -2,13 +2,15 @@
 from chelseasymphony.main.blocks import YouTubeVideoBlock
 from datetime import datetime, timedelta
 from html import unescape
+import re
+import string
+import unicodedata
 from django import forms
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.core.mail import send_mail
 from django.core.validators import FileExtensionValidator
 from django.db import models
-from django.db.models import Max, Min
+from django.db.models import Count, FilteredRelation, Max, Min, Q
 from django.http import Http404
 from django.template.loader import get_template
 from django.template.response import TemplateResponse
@@ -21,7 +23,7 @@ from django.utils.translation import ugettext as _
 from django.shortcuts import get_object_or_404
 
 from modelcluster.fields import ParentalKey, ParentalManyToManyField
-from wagtail.core.models import Page, PageManager, Orderable, PageQuerySet
+from wagtail.core.models import Page, PageManager, Orderable
 from wagtail.core.fields import RichTextField, StreamField
 from wagtail.core import blocks
 from wagtail.contrib.routable_page.models import RoutablePageMixin, route
@@ -53,6 +55,7 @@ from paypal.standard.forms import PayPalPaymentsForm
 
 # For Wagtail Metadata
 from wagtailmetadata.models import MetadataPageMixin
+from .privacy import PrivacyQuerySet, is_live_public, restricted_paths
 
 
 class Home(MetadataPageMixin, Page):
@@ -94,11 +97,26 @@ class Home(MetadataPageMixin, Page):
 
     def get_context(self, request):
         context = super().get_context(request)
-        future_concerts = Concert.objects.future_concerts().live().public()
+        future_concerts = Concert.objects.future_concerts().live_public()
         context['featured_concert'] = future_concerts.first()
+        if context['featured_concert']:
+            from .caching import add_cache_tags, concert_tag
+            add_cache_tags(
+                request, [concert_tag(context['featured_concert'].pk)])
         context['upcoming_concerts'] = future_concerts[1:4]
-        context['recent_blog_posts'] = BlogPost.objects.all().\
-            live().public().order_by('-date')[:2]
+        context['recent_blog_posts'] = list(
+            BlogPost.objects.live_public().select_related('blog_image')
+            .order_by('-date')[:2])
+
+        from .renditions import prefetch_renditions
+        featured = context['featured_concert']
+        prefetch_renditions(self.get_template(request), {
+            'banner_image': [self.banner_image],
+            'supplimental_image': [self.supplimental_image],
+            'concert_image': [featured.concert_image] if featured else [],
+            'blog_image': [p.blog_image
+                           for p in context['recent_blog_posts']],
+        })
         return context
 
     max_count = 1
@@ -191,6 +209,10 @@ class BasicPage(MetadataPageMixin, Page, MenuPageMixin):
         ], template='main/blocks/personnel_center.html', icon='user'))
     ])
 
+    search_fields = Page.search_fields + [
+        index.SearchField('body'),
+    ]
+
     content_panels = Page.content_panels + [
         StreamFieldPanel('body')
     ]
@@ -241,11 +263,14 @@ class ConcertIndex(RoutablePageMixin, Page):
 
     @route(r'^$')
     def upcoming_concerts(self, request):
+        from .caching import CONCERTS_TAG, add_cache_tags
+        add_cache_tags(request, [CONCERTS_TAG])
         context = self.get_context(request)
         context['seasons'] = Concert.objects.concert_seasons()
-        context['concerts'] = Concert.objects.future_concerts().live().public()
+        context['concerts'] = Concert.objects.future_concerts()\
+            .live_public()
         context['previous_concerts'] = Concert.objects.\
-            past_concerts_current_season().live().public()
+            past_concerts_current_season().live_public()
         return TemplateResponse(
             request,
             self.get_template(request),
@@ -258,15 +283,14 @@ class ConcertIndex(RoutablePageMixin, Page):
         if season not in seasons:
             raise Http404()
 
+        from .caching import CONCERTS_TAG, add_cache_tags
+        add_cache_tags(request, [CONCERTS_TAG])
         context = self.get_context(request)
         context['seasons'] = seasons
         context['season'] = season
         context['concerts'] = Concert.objects.\
-            annotate(last_date=Max('concert_date__date')).\
-            filter(
-                season=season,
-                concert_date__date__isnull=False).distinct().\
-            order_by('last_date').live().public()
+            filter(season=season, last_date__isnull=False).\
+            order_by('last_date').live_public()
         return TemplateResponse(
             request,
             self.get_template(request),
@@ -280,12 +304,11 @@ class ConcertIndex(RoutablePageMixin, Page):
             season=season,
             slug=slug
         )
-        if not concert_page.live:
-            raise Http404()
-
-        if concert_page.get_view_restrictions():
+        if not is_live_public(concert_page):
             raise Http404()
 
+        from .caching import add_cache_tags, page_cache_tags
+        add_cache_tags(request, page_cache_tags(concert_page))
         return concert_page.serve(request)
 
     @route(r'.+')
@@ -305,7 +328,7 @@ class ConcertIndex(RoutablePageMixin, Page):
     subpage_types = ['Concert']
 
 
-class ConcertQuerySet(PageQuerySet):
+class ConcertQuerySet(PrivacyQuerySet):
     def concert_seasons(self):
         return sorted(
             set(s for s in self.values_list('season', flat=True))
@@ -318,13 +341,8 @@ class ConcertQuerySet(PageQuerySet):
             second=0,
             microsecond=0
         )
-        return Concert.objects.\
-            annotate(first_date=Min('concert_date__date')).\
-            annotate(last_date=Max('concert_date__date')).\
-            filter(
-                last_date__gt=today,
-                live=True,
-                concert_date__date__isnull=False).distinct().\
+        return self.\
+            filter(last_date__gt=today, live=True).\
             order_by('first_date')
 
     def past_concerts_current_season(self):
@@ -335,14 +353,11 @@ class ConcertQuerySet(PageQuerySet):
             microsecond=0
         )
         current_season = Concert.calculate_season(today)
-        return Concert.objects.\
-            annotate(first_date=Min('concert_date__date')).\
-            annotate(last_date=Max('concert_date__date')).\
+        return self.\
             filter(
                 last_date__lte=today,
                 season=current_season,
-                live=True,
-                concert_date__date__isnull=False).distinct().\
+                live=True).\
             order_by('first_date')
 
 
@@ -440,6 +455,33 @@ class Concert(MetadataPageMixin, Page):
         blank=True,
         unique=True
     )
+    # Denormalized from ConcertDate, see update_date_range()
+    first_date = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False
+    )
+    last_date = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False
+    )
+    date_count = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False
+    )
+
+    DATE_RANGE_FIELDS = ('first_date', 'last_date', 'date_count')
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['last_date', 'first_date'],
+                name='concert_last_date_idx'),
+            models.Index(
+                fields=['season', 'last_date'],
+                name='concert_season_last_date_idx'),
+        ]
 
     @staticmethod
     def calculate_season(date):
@@ -456,96 +498,43 @@ class Concert(MetadataPageMixin, Page):
     def get_meta_image(self):
         return self.search_image or self.concert_image
 
-    def get_context(self, request):
-        context = super().get_context(request)
-        performances = self.get_descendants().live().public().select_related(
-            'performance__conductor',
-            'performance__composition')
-
-        # Conductors
-        # TODO: test that conductor exists, is live, and is public
-        conductors = dict()
-        for p in performances:
-            conductor = p.specific.conductor
-            if (conductor and conductor.is_live_public()):
-                name = conductor.title
-                conductors[name] = {
-                    'name': name,
-                    'last_name': p.specific.conductor.last_name,
-                    'url': p.specific.conductor.url,
-                    'headshot': p.specific.conductor.headshot,
-                    'bio': p.specific.conductor.biography,
-                }
+    @staticmethod
+    def update_date_range(concert_id):
+        """
+        Recalculates the first date, last date and number of dates of a
+        concert from its ConcertDate rows, and stores them on the concert.
+        These are kept in sync by the ConcertDate signal handlers and by
+        Concert.save(), so that concert listings can filter and order on
+        indexed columns rather than aggregating over concert dates.
+        """
+        date_range = ConcertDate.objects.filter(concert_id=concert_id)\
+            .aggregate(
+                first_date=Min('date'),
+                last_date=Max('date'),
+                date_count=Count('pk'))
+        Concert.objects.filter(pk=concert_id).update(**date_range)
+        return date_range
 
-        context['conductors'] = sorted(
-            conductors.values(), key=lambda x: x['last_name'])
-
-        # Program
-        program = list()
-        for p in performances:
-            # First make a set of all performers for a given performance
-            performers = list()
-            # TODO: test that performer is live, is public()
-            perfs = (p for p in p.specific.performer.all() if p.person.is_live_public())
-            for performer in perfs:
-                performers.append({
-                    'name': performer.person.title,
-                    'url': performer.person.url,
-                    'instrument': performer.instrument.instrument
-                })
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Saving a concert commits its concert dates, and may write a stale
+        # date range from a revision, so recalculate it afterwards
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or \
+                set(update_fields) & {'concert_date', *self.DATE_RANGE_FIELDS}:
+            for field, value in self.update_date_range(self.pk).items():
+                setattr(self, field, value)
 
-            # Then assemble with composer and composition
-            cmpsr = p.specific.composition.composer
-            composer = None
-            if cmpsr.is_live_public():
-                composer = cmpsr
-
-            program.append({
-                'composer': composer.title if composer else 'Anon.',
-                'composition': p.specific.composition.title,
-                'supplemental_text': p.specific.supplemental_text,
-                'performers': performers  # TODO: what happens if performers is null?
-            })
-        context['program'] = program
-
-        # Performer
-        # This needs to display the performer, the work they are performing,
-        # and the date they are performing it.
-        performers = list()
-        for soloist in (p.person for p
-                        in self.performer.all().order_by('sort_order')
-                        if p.person.is_live_public()):
-            # Select performances that have this soloist as a performer
-            perfs = Performance.objects.descendant_of(self).\
-                filter(performer__person__id=soloist.id).live().public()
-
-            # Build up an aggregation of solo performances
-            solo_perfs = list()
-            solo_instrument = set()
-            for p in perfs:
-                cmpsr = p.composition.composer
-                composer = None
-                if cmpsr.is_live_public():
-                    composer = cmpsr
-
-                solo_perfs.append({
-                    'composer': composer.title if composer else 'Anon.',
-                    'work': p.composition.title,
-                    'dates': [d.date for d in p.performance_date.all()]
-                })
-                s = p.performer.get(person__id=soloist.id)
-                solo_instrument.add(s.instrument)
-
-            performers.append({
-                'name': soloist.title,
-                'url': soloist.url,
-                'headshot': soloist.headshot,
-                'instrument': list(solo_instrument),
-                'performances': solo_perfs,
-                'bio': soloist.biography
-            })
-
-        context['performers'] = performers
+    def get_context(self, request):
+        from .program import ConcertProgram
+        from .renditions import prefetch_renditions
+        context = super().get_context(request)
+        context.update(ConcertProgram(self, request).get_context())
+        prefetch_renditions(self.get_template(request), {
+            'concert_image': [self.concert_image],
+            'headshot': [p['headshot'] for p in
+                         context['performers'] + context['conductors']],
+        })
         return context
 
     def performances_by_date(self):
@@ -565,42 +554,12 @@ class Concert(MetadataPageMixin, Page):
                 * name
                 * url
                 * instrument
-        """
-        concert_dates = self.concert_date.all()
-        performances_by_date = list()
-        for cd in concert_dates:
-            performances = list()
-            ps = cd.performance_set.all().live().public()
-            for p in ps:
-                # First make a set of all performers for a given performance
-                performers = list()
-                live_public_performers = (
-                    perf for perf in p.specific.performer.all()
-                    if perf.person.is_live_public())
-                for performer in live_public_performers:
-                    performers.append({
-                        'name': performer.person.title,
-                        'url': performer.person.url,
-                        'instrument': performer.instrument.instrument
-                    })
-
-                # Then assemble with composer and composition
-                cmpsr = p.specific.composition.composer
-                composer = cmpsr if cmpsr.is_live_public() else 'Anon.'
-                performances.append({
-                    'composer': composer,
-                    'composition': p.specific.composition.title,
-                    'supplemental_text': p.specific.supplemental_text,
-                    'performers': performers
-                })
-
-            # Finally assemble with the date
-            performances_by_date.append({
-                'date': cd.date,
-                'program': performances
-            })
 
-        return performances_by_date
+        Concert listings attach this in bulk with `attach_programs`.
+        """
+        from .program import attach_programs
+        attach_programs([self])
+        return self._performances_by_date
 
     def get_url_parts(self, *args, **kwargs):
         site_id, root_url, page_path = super().get_url_parts(*args, **kwargs)
@@ -630,6 +589,26 @@ class Concert(MetadataPageMixin, Page):
                 if qs:
                     raise err
 
+    search_fields = Page.search_fields + [
+        index.SearchField('promo_copy'),
+        index.SearchField('description'),
+        index.SearchField('program_text'),
+    ]
+
+    def program_text(self):
+        """
+        The works and composers on the program, so that concerts can be
+        found by what is being performed
+        """
+        performances = Performance.objects.child_of(self).live()\
+            .select_related('composition__composer')
+        return ' '.join(
+            '{} {}'.format(
+                p.composition.plain_title,
+                p.composition.composer.title if p.composition.composer
+                else '')
+            for p in performances)
+
     content_panels = Page.content_panels + [
         FieldPanel('promo_copy'),
         StreamFieldPanel('description'),
@@ -766,10 +745,10 @@ class ConcertPerformer(Orderable):
     )
 
     def is_performer_live_public(self):
-        return self.person.live and not self.person.get_view_restrictions()
+        return is_live_public(self.person)
 
     def get_performer(self):
-        if (self.person.live and not self.person.get_view_restrictions()):
+        if is_live_public(self.person):
             return self.person
 
         return None
@@ -808,10 +787,10 @@ class Performer(Orderable):
     )
 
     def is_performer_live_public(self):
-        return self.person.live and not self.person.get_view_restrictions()
+        return is_live_public(self.person)
 
     def get_performer(self):
-        if (self.person.live and not self.person.get_view_restrictions()):
+        if is_live_public(self.person):
             return self.person
 
         return None
@@ -869,8 +848,6 @@ class Performer(Orderable):
 
 @register_snippet
 class Composition(index.Indexed, models.Model):
-    # Note: calling unescape on the title below is only ok because the input is
-    # being sanitized by the RichTextField.
     title = RichTextField(features=['bold', 'italic'])
     composer = models.ForeignKey(
         'Person',
@@ -879,18 +856,47 @@ class Composition(index.Indexed, models.Model):
         on_delete=models.SET_NULL,
         related_name='+'
     )
+    # The title as plain text, and the key compositions are sorted by. Both
+    # are kept in step with the title when a composition is saved.
+    plain_title = models.TextField(editable=False, db_index=True, default='')
+    sort_title = models.TextField(editable=False, db_index=True, default='')
+
+    @staticmethod
+    def plain_text(title):
+        # Note: calling unescape on the title is only ok because the input is
+        # being sanitized by the RichTextField.
+        return unescape(strip_tags(title))
+
+    @staticmethod
+    def sort_key(plain_title):
+        """
+        Folds case and accents, drops leading punctuation and pads numbers,
+        so that "No. 10" sorts after "No. 9"
+        """
+        text = ''.join(c for c in unicodedata.normalize('NFKD', plain_title)
+                       if not unicodedata.combining(c))
+        text = ' '.join(text.casefold().split()).lstrip(string.punctuation)
+        return re.sub(r'\d+', lambda m: m.group().zfill(8), text)
+
+    def save(self, *args, **kwargs):
+        self.plain_title = self.plain_text(self.title)
+        self.sort_title = self.sort_key(self.plain_title)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'title' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {
+                'plain_title', 'sort_title'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
-        return unescape(strip_tags(self.title))
+        return self.plain_title or self.plain_text(self.title)
 
     def display_title(self):
         return str(self)
+    display_title.admin_order_field = 'sort_title'
+    display_title.short_description = 'Title'
 
     def autocomplete_label(self):
-        return "{} - {}".format(
-            unescape(strip_tags(self.title)),
-            self.composer
-        )
+        return "{} - {}".format(self, self.composer)
 
     panels = [
         FieldPanel('title'),
@@ -900,7 +906,7 @@ class Composition(index.Indexed, models.Model):
     ]
 
     search_fields = [
-        index.SearchField('title', partial_match=True),
+        index.SearchField('plain_title', partial_match=True),
         index.RelatedFields('composer', [
             index.SearchField('first_name', partial_match=True),
             index.SearchField('last_name', partial_match=True),
@@ -943,8 +949,10 @@ class Person(MetadataPageMixin, Page):
         unique=True
     )
 
+    objects = PageManager.from_queryset(PrivacyQuerySet)()
+
     def is_live_public(self):
-        return self.live and not self.get_view_restrictions()
+        return is_live_public(self)
 
     def get_meta_image(self):
         return self.search_image or self.headshot
@@ -965,6 +973,11 @@ class Person(MetadataPageMixin, Page):
         self.slug = ''
         super().full_clean(*args, **kwargs)
 
+    search_fields = Page.search_fields + [
+        index.SearchField('biography'),
+        index.SearchField('position'),
+    ]
+
     content_panels = [
         FieldPanel('first_name'),
         FieldPanel('last_name'),
@@ -999,19 +1012,40 @@ class PersonIndex(Page, MenuPageMixin):
     parent_page_types = ['Home']
     subpage_types = ['Person', 'BasicPage']
 
+    @staticmethod
+    def build_roster():
+        """
+        Returns each instrument shown on the roster, in weight order, with
+        the live and public musicians on the active roster who play it.
+
+        Musicians are loaded with their instruments in a single query over
+        the Person-Instrument relation, plus one for view restrictions.
+        Musicians are returned as dicts, so the roster can be cached.
+        """
+        paths = restricted_paths()
+        rows = InstrumentModel.objects.filter(show_on_roster=True)\
+            .annotate(musician=FilteredRelation(
+                'person_instrument',
+                condition=Q(person_instrument__active_roster=True)))\
+            .order_by('weight', 'musician__last_name',
+                      'musician__first_name')\
+            .values_list('instrument', 'musician__title', 'musician__path',
+                         'musician__live')
+
+        roster = dict()
+        for instrument, title, path, live in rows:
+            musicians = roster.setdefault(instrument, [])
+            if live and not any(path.startswith(p) for p in paths):
+                musicians.append({'title': title})
+        return roster
+
     def get_context(self, request):
+        from .caching import ROSTER_TAG, get_or_build
         context = super().get_context(request)
         # For each instrument that is show on roster, get each musician that
         # is on the active roster
-        roster = dict()
-        instruments = InstrumentModel.objects\
-            .filter(show_on_roster=True).order_by('weight')
-        for i in instruments:
-            musicians = Person.objects.filter(
-                instrument__pk=i.pk, active_roster=True)\
-                .live().public().order_by('last_name', 'first_name')
-            roster[i.instrument] = [m for m in musicians]
-        context['roster'] = roster
+        context['roster'] = get_or_build(
+            'person-index-roster', [ROSTER_TAG], self.build_roster)
         return context
 
     settings_panels = AbstractEmailForm.settings_panels + [
@@ -1072,6 +1106,13 @@ class BlogPost(MetadataPageMixin, Page):
         unique=True
     )
 
+    objects = PageManager.from_queryset(PrivacyQuerySet)()
+
+    search_fields = Page.search_fields + [
+        index.SearchField('promo_copy'),
+        index.SearchField('body'),
+    ]
+
     content_panels = Page.content_panels + [
         AutocompletePanel('author', target_model='main.Person'),
         FieldPanel('date'),
@@ -1104,7 +1145,7 @@ class BlogPost(MetadataPageMixin, Page):
 
     def get_context(self, request):
         context = super().get_context(request)
-        context['recent_blog_posts'] = BlogPost.objects.live().public()\
+        context['recent_blog_posts'] = BlogPost.objects.live_public()\
             .order_by('-date')[:5]
         return context
 
@@ -1118,7 +1159,7 @@ class BlogIndex(Page):
 
     def get_context(self, request):
         context = super().get_context(request)
-        context['blog_posts'] = BlogPost.objects.live().public()\
+        context['blog_posts'] = BlogPost.objects.live_public()\
             .order_by('-date')
         return context
 
@@ -1353,14 +1394,17 @@ class NewMemberRequestPage(MetadataPageMixin, Page, MenuPageMixin):
 
     def serve(self, request):
         from .forms import NewMemberRequestForm
+        from .mail import queue_mail
         PERSONEL_MGR_EMAIL = 'personnel@chelseasymphony.org'
         if request.method == 'POST':
-            form = NewMemberRequestForm(request.POST, request.FILES)
+            form = NewMemberRequestForm(
+                request.POST, request.FILES,
+                oversized_uploads=getattr(request, 'oversized_uploads', ()))
             if form.is_valid():
                 form.save()
                 # Send confirmation email to applicant
                 confirmation = get_template('main/email/new_member_request_confirmation.txt')
-                send_mail(
+                queue_mail(
                     'Thank you for your submission',
                     confirmation.render(
                         {'first_name': form.cleaned_data.get('first_name')}),
@@ -1378,7 +1422,7 @@ class NewMemberRequestPage(MetadataPageMixin, Page, MenuPageMixin):
                     'link': form.cleaned_data['link']
                 }
                 personel_email_template = get_template('main/email/new_member_submission_notification.txt')
-                send_mail(
+                queue_mail(
                     'A new member request has been submitted',
                     personel_email_template.render(personel_ctx),
                     PERSONEL_MGR_EMAIL,
@@ -1396,3 +1440,99 @@ class NewMemberRequestPage(MetadataPageMixin, Page, MenuPageMixin):
             'page': self,
             'form': form
         })
+
+
+class BackgroundTask(models.Model):
+    """
+    A call queued by `run_in_background`. It is written in the transaction
+    that queued it, so the work is not lost if the process that was to run
+    it stops; `manage.py run_background_tasks` runs tasks that are due, or
+    whose worker let its lease expire. Tasks are deleted once they succeed.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    ]
+
+    # The dotted path of a module level function
+    task = models.CharField(max_length=255)
+    arguments = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    # A running task whose lease has expired is assumed to have been lost
+    leased_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt'])]
+
+    def __str__(self):
+        return self.task
+
+
+class LegacyRecord(models.Model):
+    """
+    A hash of the legacy site content a record was last synced from. An
+    import only updates records whose content has changed since. Each record
+    is written in the same transaction as the page synced from it, so an
+    interrupted import resumes where it stopped.
+    """
+    # The payload, or part of it, synced, e.g. 'concerts' or 'biographies'
+    source = models.CharField(max_length=32)
+    legacy_id = models.IntegerField()
+    content_hash = models.CharField(max_length=64)
+    synced = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('source', 'legacy_id')]
+
+    def __str__(self):
+        return '{} {}'.format(self.source, self.legacy_id)
+
+
+class QueryProfile(models.Model):
+    """
+    The aggregated profiles of the requests for one kind of page, recorded
+    by `QueryProfileMiddleware` and reported by `manage.py query_report`.
+    Profiles are added with single UPDATE statements, so concurrent
+    requests, and processes, don't lose each other's counts.
+    """
+    # The page type, and route for routable pages
+    label = models.CharField(max_length=255, unique=True)
+    requests = models.PositiveIntegerField(default=0)
+    queries = models.PositiveIntegerField(default=0)
+    max_queries = models.PositiveIntegerField(default=0)
+    duplicates = models.PositiveIntegerField(default=0)
+    db_time = models.FloatField(default=0)
+    template_time = models.FloatField(default=0)
+    rendition_queries = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.label
+
+
+class SuggestionChange(models.Model):
+    """
+    The latest change to the search suggestion of a person, concert or
+    composition. Every process applies the changes made since it last
+    looked to its in-memory suggestion index, in the order they were made.
+    """
+    # The item's type and primary key, e.g. ('person', 12)
+    item_type = models.CharField(max_length=32)
+    item_pk = models.PositiveIntegerField()
+    # None once the item is no longer suggested
+    suggestion = models.JSONField(null=True)
+    changed = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['item_type', 'item_pk'])]
+
+    def __str__(self):
+        return '{} {}'.format(self.item_type, self.item_pk)
@@ -0,0 +1,63 @@
+"""Page privacy
+
+A page is live and public if it is live and not in a section of the site
+with a view restriction. Rather than querying each page's ancestors for
+restrictions, as `Page.get_view_restrictions()` does, the paths of every
+restricted page are loaded in one query and cached, and pages are checked
+against them by path. The cache is cleared when view restrictions change or
+pages move.
+"""
+from django.core.cache import cache
+from django.db.models import Q
+from wagtail.core.models import PageQuerySet, PageViewRestriction
+
+RESTRICTED_PATHS_KEY = 'restricted-page-paths'
+
+
+def restricted_paths():
+    """Returns the tree paths of every page that has a view restriction"""
+    paths = cache.get(RESTRICTED_PATHS_KEY)
+    if paths is None:
+        paths = list(
+            PageViewRestriction.objects.values_list('page__path', flat=True))
+        cache.set(RESTRICTED_PATHS_KEY, paths, timeout=None)
+    return paths
+
+
+def clear_restricted_paths():
+    cache.delete(RESTRICTED_PATHS_KEY)
+
+
+def is_live_public(page, paths=None):
+    """
+    Returns True if a page is live and not under any restricted path. This
+    mirrors `page.live and not page.get_view_restrictions()`.
+    """
+    if page is None or not page.live:
+        return False
+    if paths is None:
+        paths = restricted_paths()
+    return not any(page.path.startswith(path) for path in paths)
+
+
+def live_public_ids(pages):
+    """Returns the IDs of the given pages that are live and public"""
+    paths = restricted_paths()
+    return {page.pk for page in pages if is_live_public(page, paths)}
+
+
+def public_q():
+    """Returns a filter excluding pages under any restricted path"""
+    q = Q()
+    for path in restricted_paths():
+        q &= ~Q(path__startswith=path)
+    return q
+
+
+class PrivacyQuerySet(PageQuerySet):
+    def live_public(self):
+        """
+        Equivalent to `.live().public()`, without querying for view
+        restrictions each time
+        """
+        return self.live().filter(public_q())
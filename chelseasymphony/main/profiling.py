@@ -0,0 +1,111 @@
+"""Request profiling
+
+Records what serving each kind of page costs: the number of queries, how
+many of them were exact repeats, time spent in the database and rendering
+templates, and queries of the renditions table. Profiles are labelled
+with the page type, and route for routable pages, e.g.
+`ConcertIndex.get_concert`, and aggregated per label in the database, where
+`manage.py query_report` reads them from another process.
+"""
+from collections import Counter
+from time import perf_counter
+from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from .models import QueryProfile
+
+
+def profile_label(page, serve_args):
+    """Returns the label of a page, and its route if it is routable"""
+    label = type(page).__name__
+    if serve_args and callable(serve_args[0]):
+        label = '{}.{}'.format(label, serve_args[0].__name__)
+    return label
+
+
+class RequestProfile:
+    """
+    A database execute wrapper that records every query made while it is
+    installed. Template time is added by the middleware.
+    """
+    def __init__(self):
+        self.label = None
+        self.queries = Counter()
+        self.db_time = 0
+        self.template_time = 0
+        self.rendition_queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - start
+            self.queries[(sql, repr(params))] += 1
+            # Counts queries, not `get_rendition` calls: renditions found in
+            # the renditions cache, or prefetched with their image, make no
+            # query, and `get_renditions` looks up many in one
+            if sql.startswith('SELECT') and \
+                    'FROM "wagtailimages_rendition"' in sql:
+                self.rendition_queries += 1
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    @property
+    def duplicate_count(self):
+        return self.query_count - len(self.queries)
+
+    def as_dict(self):
+        return {
+            'queries': self.query_count,
+            'duplicates': self.duplicate_count,
+            'db_time': self.db_time,
+            'template_time': self.template_time,
+            'rendition_queries': self.rendition_queries,
+        }
+
+    def headers(self):
+        return {
+            'X-Profile-Label': self.label,
+            'X-Query-Count': str(self.query_count),
+            'X-Duplicate-Queries': str(self.duplicate_count),
+            'X-DB-Time': '{:.1f}ms'.format(self.db_time * 1000),
+            'X-Template-Time': '{:.1f}ms'.format(self.template_time * 1000),
+            'X-Rendition-Queries': str(self.rendition_queries),
+        }
+
+    def over_budget(self):
+        """
+        Returns a message describing how this profile exceeds the
+        `QUERY_BUDGETS` setting for its label, or None if it doesn't
+        """
+        budget = getattr(settings, 'QUERY_BUDGETS', {}).get(self.label)
+        if budget is not None and self.query_count > budget:
+            return '{} made {} queries, over its budget of {}'.format(
+                self.label, self.query_count, budget)
+        return None
+
+    def record(self):
+        """Adds this profile to the aggregated report for its label"""
+        QueryProfile.objects.get_or_create(label=self.label)
+        QueryProfile.objects.filter(label=self.label).update(
+            requests=F('requests') + 1,
+            max_queries=Greatest('max_queries', Value(self.query_count)),
+            **{stat: F(stat) + value
+               for stat, value in self.as_dict().items()})
+
+
+def get_report():
+    """Returns the aggregated stats of every label, by label"""
+    return {
+        stats.pop('label'): stats
+        for stats in QueryProfile.objects.order_by('label').values(
+            'label', 'requests', 'queries', 'max_queries', 'duplicates',
+            'db_time', 'template_time', 'rendition_queries')
+    }
+
+
+def reset_report():
+    QueryProfile.objects.all().delete()
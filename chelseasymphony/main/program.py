@@ -0,0 +1,233 @@
+"""Concert program assembly
+
+Builds the conductors, program and featured performers of a concert from a
+fixed number of bulk queries, rather than walking the page tree and
+resolving each relation one object at a time.
+"""
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+from django.db.models import prefetch_related_objects
+from .models import Performance, Performer
+from .privacy import is_live_public, restricted_paths
+
+
+class ConcertProgram:
+    """
+    Loads everything needed to render a concert's program up front.
+
+    The following queries are made, regardless of the number of performances
+    or performers on the concert:
+        * view restrictions, unless cached
+        * performances, with compositions, composers and conductors
+        * performers, with people, headshots and instruments
+        * performance dates
+        * concert performers, with people and headshots
+    """
+    def __init__(self, concert, request=None):
+        self.concert = concert
+        self.request = request
+        self.restricted_paths = restricted_paths()
+
+        self.performances = [
+            p for p in Performance.objects.descendant_of(concert).live()
+            .select_related(
+                'composition__composer',
+                'conductor__headshot')
+            .order_by('path')
+            if is_live_public(p, self.restricted_paths)
+        ]
+        performance_ids = [p.id for p in self.performances]
+
+        self.performers = defaultdict(list)
+        for performer in Performer.objects\
+                .filter(performance__in=performance_ids)\
+                .select_related('person__headshot', 'instrument')\
+                .order_by('sort_order'):
+            self.performers[performer.performance_id].append(performer)
+
+        self.dates = defaultdict(list)
+        PerformanceDate = Performance.performance_date.through
+        for pd in PerformanceDate.objects\
+                .filter(performance__in=performance_ids)\
+                .select_related('concertdate')\
+                .order_by('concertdate__date'):
+            self.dates[pd.performance_id].append(pd.concertdate)
+
+        self.concert_performers = list(
+            concert.performer.all().select_related('person__headshot')
+            .order_by('sort_order'))
+
+    def is_live_public(self, page):
+        return is_live_public(page, self.restricted_paths)
+
+    def url(self, page):
+        return page.get_url(self.request)
+
+    def composer(self, performance):
+        """Returns the composer if they may be displayed, otherwise None"""
+        composer = performance.composition.composer
+        return composer if self.is_live_public(composer) else None
+
+    def live_public_performers(self, performance):
+        return [p for p in self.performers[performance.id]
+                if self.is_live_public(p.person)]
+
+    def conductors(self):
+        conductors = dict()
+        for p in self.performances:
+            conductor = p.conductor
+            if conductor and self.is_live_public(conductor):
+                name = conductor.title
+                conductors[name] = {
+                    'name': name,
+                    'last_name': conductor.last_name,
+                    'url': self.url(conductor),
+                    'headshot': conductor.headshot,
+                    'bio': conductor.biography,
+                }
+
+        return sorted(conductors.values(), key=lambda x: x['last_name'])
+
+    def program(self):
+        program = list()
+        for p in self.performances:
+            performers = [{
+                'name': performer.person.title,
+                'url': self.url(performer.person),
+                'instrument': performer.instrument.instrument
+            } for performer in self.live_public_performers(p)]
+
+            composer = self.composer(p)
+            program.append({
+                'composer': composer.title if composer else 'Anon.',
+                'composition': p.composition.title,
+                'supplemental_text': p.supplemental_text,
+                'performers': performers
+            })
+
+        return program
+
+    def featured_performers(self):
+        """
+        Lists each concert performer with the works they are performing,
+        and the dates they are performing them.
+        """
+        performers = list()
+        for cp in self.concert_performers:
+            soloist = cp.person
+            if not self.is_live_public(soloist):
+                continue
+
+            solo_perfs = list()
+            solo_instrument = list()
+            for p in self.performances:
+                appearances = [s for s in self.performers[p.id]
+                               if s.person_id == soloist.id]
+                if not appearances:
+                    continue
+
+                composer = self.composer(p)
+                solo_perfs.append({
+                    'composer': composer.title if composer else 'Anon.',
+                    'work': p.composition.title,
+                    'dates': [d.date for d in self.dates[p.id]]
+                })
+                for s in appearances:
+                    if s.instrument not in solo_instrument:
+                        solo_instrument.append(s.instrument)
+
+            performers.append({
+                'name': soloist.title,
+                'url': self.url(soloist),
+                'headshot': soloist.headshot,
+                'instrument': solo_instrument,
+                'performances': solo_perfs,
+                'bio': soloist.biography
+            })
+
+        return performers
+
+    def get_context(self):
+        return {
+            'conductors': self.conductors(),
+            'program': self.program(),
+            'performers': self.featured_performers(),
+        }
+
+
+def attach_programs(concerts):
+    """
+    Computes `performances_by_date` for many concerts at once and attaches
+    the result to each concert, so that listing pages make the same number
+    of queries no matter how many concerts, dates, works or performers
+    they show.
+
+    The following queries are made:
+        * view restrictions, unless cached
+        * concert dates (also used to prefetch `concert.concert_date`)
+        * performances of every concert, with compositions and composers
+        * performance dates
+        * performers, with people and instruments
+    """
+    concerts = [c for c in concerts
+                if not hasattr(c, '_performances_by_date')]
+    if not concerts:
+        return
+
+    paths = restricted_paths()
+    prefetch_related_objects(concerts, 'concert_date')
+
+    performances = [
+        p for p in Performance.objects.live()
+        .filter(reduce(or_, (
+            Performance.objects.descendant_of_q(c) for c in concerts)))
+        .select_related('composition__composer')
+        .order_by('path')
+        if is_live_public(p, paths)
+    ]
+    performance_ids = [p.id for p in performances]
+
+    performances_by_date = defaultdict(list)
+    PerformanceDate = Performance.performance_date.through
+    performance_dates = PerformanceDate.objects\
+        .filter(performance__in=performance_ids)\
+        .values_list('performance_id', 'concertdate_id')
+    dates_by_performance = defaultdict(set)
+    for performance_id, date_id in performance_dates:
+        dates_by_performance[performance_id].add(date_id)
+    for p in performances:
+        for date_id in dates_by_performance[p.id]:
+            performances_by_date[date_id].append(p)
+
+    performers = defaultdict(list)
+    for performer in Performer.objects\
+            .filter(performance__in=performance_ids)\
+            .select_related('person', 'instrument')\
+            .order_by('sort_order'):
+        if is_live_public(performer.person, paths):
+            performers[performer.performance_id].append({
+                'name': performer.person.title,
+                'url': performer.person.url,
+                'instrument': performer.instrument.instrument
+            })
+
+    for concert in concerts:
+        program_by_date = list()
+        for cd in concert.concert_date.all():
+            program = list()
+            for p in performances_by_date[cd.id]:
+                cmpsr = p.composition.composer
+                program.append({
+                    'composer': cmpsr if is_live_public(cmpsr, paths)
+                    else 'Anon.',
+                    'composition': p.composition.title,
+                    'supplemental_text': p.supplemental_text,
+                    'performers': performers[p.id]
+                })
+
+            program_by_date.append({
+                'date': cd.date,
+                'program': program
+            })
+        concert._performances_by_date = program_by_date
@@ -0,0 +1,240 @@
+"""Rendition pre-rendering
+
+Generating a rendition means fetching the original image from storage,
+resizing it and uploading the result, which is too slow to do while serving
+a page. Instead, the filter specs the templates use are collected from their
+`image` and `responsiveimage` tags, by the name of the image field they
+display, e.g. `concert_image`. Templates included by name are followed, but
+those included by a variable, and the templates of StreamField blocks, can't
+be known ahead of time. When a page is published, or an image is saved, the
+renditions its image fields need are generated in the background.
+
+Templates look renditions up in bulk too. `get_renditions` finds the
+renditions of many image and filter spec pairs in one query, and generates
+any that are missing one by one, as `get_rendition` would. Pages call
+`prefetch_renditions` with the images their template displays before it is
+rendered, and the `responsiveimage` tag uses the renditions attached to each
+image, looking up any others it needs together.
+"""
+import logging
+from collections import defaultdict
+from functools import lru_cache
+from django.template.loader import get_template
+from django.template.loader_tags import IncludeNode
+from wagtail.images import get_image_model
+from wagtail.images.models import Filter, SourceImageIOError
+from wagtail.images.templatetags.wagtailimages_tags import ImageNode
+from .models import BlogPost, Concert, Home, Person
+from .tasks import run_in_background
+
+logger = logging.getLogger(__name__)
+
+PRERENDER_TEMPLATES = (
+    'main/home.html',
+    'main/concert.html',
+    'main/person.html',
+    'main/blog_post.html',
+    'main/blog_index.html',
+    'concert_card.html',
+    'home_concert_card.html',
+)
+
+PRERENDER_MODELS = (Home, Concert, Person, BlogPost)
+
+
+@lru_cache(maxsize=None)
+def get_filter(spec):
+    """Returns a Filter for a spec, shared by every lookup of that spec"""
+    return Filter(spec=spec)
+
+
+@lru_cache(maxsize=256)
+def parse_srcset(srcset):
+    """
+    Parses a srcset of filter specs and widths, e.g. "fill-833x306 833w,
+    fill-1208x446 1208w", into a tuple of (filter spec, width) pairs.
+    Raises ValueError if a source has no width.
+    """
+    sources = list()
+    for source in srcset.replace('"', '').split(','):
+        if source.strip():
+            try:
+                spec, width = source.split()[:2]
+            except ValueError:
+                raise ValueError(
+                    'srcset source "{}" should be a filter spec and a '
+                    'width'.format(source.strip()))
+            sources.append((spec, width))
+    return tuple(sources)
+
+
+def nodelist_rendition_specs(nodelist):
+    """
+    Returns the filter specs used by a compiled template's nodes, and by the
+    templates they include by name, by the name of the image field they are
+    used with
+    """
+    specs = defaultdict(set)
+    for node in nodelist.get_nodes_by_type(IncludeNode):
+        template_name = node.template.var
+        if isinstance(template_name, str):
+            for field, s in template_rendition_specs(template_name).items():
+                specs[field].update(s)
+    for node in nodelist.get_nodes_by_type(ImageNode):
+        lookups = getattr(node.image_expr.var, 'lookups', None)
+        if not lookups:
+            continue
+        field = lookups[-1]
+        specs[field].add(node.filter_spec)
+        # Variable srcsets can't be known ahead of time
+        srcset = node.attrs.get('srcset')
+        if isinstance(srcset, str):
+            specs[field].update(spec for spec, __ in parse_srcset(srcset))
+    return {field: sorted(s) for field, s in specs.items()}
+
+
+@lru_cache(maxsize=None)
+def template_rendition_specs(template_name):
+    """
+    Returns the filter specs used by a template, by the name of the image
+    field they are used with
+    """
+    template = get_template(template_name).template
+    return nodelist_rendition_specs(template.nodelist)
+
+
+@lru_cache(maxsize=None)
+def rendition_specs():
+    """
+    Returns the filter specs used by all of the pre-rendered templates, by
+    the name of the image field they are used with
+    """
+    specs = defaultdict(set)
+    for template_name in PRERENDER_TEMPLATES:
+        for field, s in template_rendition_specs(template_name).items():
+            specs[field].update(s)
+    return {field: sorted(s) for field, s in specs.items()}
+
+
+def image_fields(model):
+    """Returns the names of a model's image fields that are pre-rendered"""
+    specs = rendition_specs()
+    return [
+        field.name for field in model._meta.get_fields()
+        if field.many_to_one and field.name in specs and
+        issubclass(field.related_model, get_image_model())
+    ]
+
+
+def generate_renditions(image_id, specs):
+    """Generates an image's renditions for the given filter specs"""
+    try:
+        image = get_image_model().objects.get(pk=image_id)
+    except get_image_model().DoesNotExist:
+        return
+    get_renditions((image, spec) for spec in specs)
+
+
+def prerender_page(page):
+    """Queues generation of the renditions a page's images need"""
+    specs = rendition_specs()
+    for field in image_fields(type(page)):
+        image_id = getattr(page, field + '_id')
+        if image_id:
+            run_in_background(generate_renditions, image_id, specs[field])
+
+
+def prerender_image(image_id):
+    """Generates the renditions an image needs for the fields it is used in"""
+    specs = rendition_specs()
+    needed = set()
+    for model in PRERENDER_MODELS:
+        for field in image_fields(model):
+            if model.objects.filter(**{field + '_id': image_id}).exists():
+                needed.update(specs[field])
+    if needed:
+        generate_renditions(image_id, sorted(needed))
+
+
+def not_found_rendition(image):
+    """
+    A placeholder for a rendition of an image whose source file is missing,
+    which is routine in development with a copy of the production database
+    """
+    Rendition = image.get_rendition_model()
+    rendition = Rendition(image=image, width=0, height=0)
+    rendition.file.name = 'not-found'
+    return rendition
+
+
+def _generate_rendition(image, filter):
+    """
+    Generates a missing rendition with `get_rendition`, which only stores
+    it once if another request is generating it at the same time
+    """
+    try:
+        return image.get_rendition(filter)
+    except SourceImageIOError:
+        logger.warning('Image %s is missing its source file', image.pk)
+        return not_found_rendition(image)
+
+
+def get_renditions(pairs):
+    """
+    Returns the renditions of (image, filter spec) pairs, by (image ID,
+    filter spec). Renditions already attached to an image are reused, the
+    rest are looked up in one query, and any that don't exist yet are
+    generated. The renditions are attached to the images as
+    `renditions_by_spec`, keyed by filter spec, which is kept apart from the
+    `prefetched_renditions` that later versions of Wagtail attach.
+    """
+    pairs = [(image, spec) for image, spec in pairs if image]
+    renditions = dict()
+    wanted = list()
+    for image, spec in pairs:
+        prefetched = getattr(image, 'renditions_by_spec', {})
+        if spec in prefetched:
+            renditions[(image.pk, spec)] = prefetched[spec]
+        elif (image.pk, spec) not in renditions:
+            renditions[(image.pk, spec)] = None
+            wanted.append((image, spec))
+
+    if wanted:
+        filters = {spec: get_filter(spec) for __, spec in wanted}
+        Rendition = get_image_model().get_rendition_model()
+        found = {
+            (r.image_id, r.filter_spec, r.focal_point_key): r
+            for r in Rendition.objects.filter(
+                image_id__in={image.pk for image, __ in wanted},
+                filter_spec__in=filters)
+        }
+
+        for image, spec in wanted:
+            focal_point_key = filters[spec].get_cache_key(image)
+            rendition = found.get((image.pk, spec, focal_point_key))
+            if rendition:
+                # Rendition tags use the image for their alt text
+                rendition.image = image
+            else:
+                rendition = _generate_rendition(image, filters[spec])
+            renditions[(image.pk, spec)] = rendition
+
+    for image, spec in pairs:
+        if not hasattr(image, 'renditions_by_spec'):
+            image.renditions_by_spec = dict()
+        image.renditions_by_spec[spec] = renditions[(image.pk, spec)]
+    return renditions
+
+
+def prefetch_renditions(template_name, images_by_field):
+    """
+    Loads the renditions a template needs for its images, given by the name
+    of the image field they are displayed with, e.g.
+    `{'headshot': [person.headshot for person in people]}`
+    """
+    specs = template_rendition_specs(template_name)
+    get_renditions(
+        (image, spec)
+        for field, images in images_by_field.items()
+        for image in images
+        for spec in specs.get(field, ()))
@@ -0,0 +1,198 @@
+"""Signal handlers"""
+from django.db.models.signals import post_delete, post_save, pre_delete
+from wagtail.core.models import Page, PageViewRestriction
+from wagtail.core.signals import (
+    page_published, page_unpublished, post_page_move)
+from wagtail.images import get_image_model
+from wagtail.search import index
+from wagtailmenus.models import FlatMenu, FlatMenuItem, MainMenu, MainMenuItem
+from .autocomplete import autocomplete_tag
+from .caching import (
+    BLOG_TAG, CONCERTS_TAG, MENUS_TAG, PAGES_TAG, ROSTER_TAG, SEARCH_TAG,
+    concert_ids_for_compositions, concert_ids_for_images,
+    concert_ids_for_instruments,
+    concert_ids_for_people, concert_ids_for_performances, concert_tag,
+    page_ids_for_images, page_ids_for_instruments, page_tag,
+    purge_cache_tags)
+from .models import (
+    BlogPost, Composition, Concert, ConcertDate, InstrumentModel,
+    Performance, Performer, Person)
+from .privacy import clear_restricted_paths
+from .renditions import PRERENDER_MODELS, prerender_image, prerender_page
+from .tasks import run_in_background
+from chelseasymphony.search.suggest import (
+    SUGGEST_PAGE_MODELS, composition_suggestion, page_suggestion,
+    rebuild_suggestions, update_suggestion)
+
+# Saving only these fields of an image doesn't change its renditions
+IMAGE_METADATA_FIELDS = {'file_size', 'file_hash', 'title', 'collection'}
+
+
+def update_concert_date_range(sender, instance, **kwargs):
+    """Keep a concert's denormalized date range in step with its dates"""
+    Concert.update_date_range(instance.concert_id)
+
+
+def purge_page_cache_tags(sender, instance, **kwargs):
+    """
+    Purge the cached content that displays a page, and search results, as
+    the page's search entry changes with it
+    """
+    tags = [page_tag(instance.pk), SEARCH_TAG]
+    if instance.show_in_menus:
+        tags.append(MENUS_TAG)
+
+    if isinstance(instance, Concert):
+        tags += [concert_tag(instance.pk), CONCERTS_TAG]
+    elif isinstance(instance, Performance):
+        tags += map(concert_tag, concert_ids_for_performances([instance.pk]))
+    elif isinstance(instance, Person):
+        tags += map(concert_tag, concert_ids_for_people([instance.pk]))
+        tags.append(ROSTER_TAG)
+    elif isinstance(instance, BlogPost):
+        tags.append(BLOG_TAG)
+    purge_cache_tags(tags)
+
+
+def purge_snippet_cache_tags(sender, instance, **kwargs):
+    """Purge the cached content that displays a snippet or image"""
+    if isinstance(instance, ConcertDate):
+        tags = [concert_tag(instance.concert_id), CONCERTS_TAG]
+    elif isinstance(instance, Performer):
+        tags = map(concert_tag,
+                   concert_ids_for_performances([instance.performance_id]))
+    elif isinstance(instance, Composition):
+        tags = map(concert_tag, concert_ids_for_compositions([instance.pk]))
+    elif isinstance(instance, InstrumentModel):
+        tags = [ROSTER_TAG] + [
+            concert_tag(pk) for pk in
+            concert_ids_for_instruments([instance.pk])] + [
+            page_tag(pk) for pk in page_ids_for_instruments([instance.pk])]
+    else:
+        page_ids = page_ids_for_images([instance.pk])
+        tags = [page_tag(pk) for pk in page_ids] + [
+            concert_tag(pk) for pk in
+            concert_ids_for_images([instance.pk]) +
+            concert_ids_for_people(page_ids)]
+    purge_cache_tags(list(tags))
+
+
+def purge_all_pages(sender, **kwargs):
+    """
+    Purge every cached page, concert card, the roster and search
+    suggestions, for changes to the menus, the page tree or view
+    restrictions
+    """
+    purge_cache_tags([MENUS_TAG, PAGES_TAG, ROSTER_TAG])
+    rebuild_suggestions()
+
+
+def invalidate_restricted_paths(sender, **kwargs):
+    """Restricted paths change with view restrictions and page moves"""
+    clear_restricted_paths()
+
+
+def prerender_page_renditions(sender, instance, **kwargs):
+    """Generate a published page's renditions before it is requested"""
+    if isinstance(instance, PRERENDER_MODELS):
+        prerender_page(instance)
+
+
+def prerender_image_renditions(sender, instance, update_fields=None,
+                               **kwargs):
+    """Regenerate the renditions of an uploaded or re-cropped image"""
+    if update_fields and set(update_fields) <= IMAGE_METADATA_FIELDS:
+        return
+    run_in_background(prerender_image, instance.pk)
+
+
+def reindex_concerts(concert_ids):
+    for concert in Concert.objects.filter(pk__in=concert_ids):
+        index.insert_or_update_object(concert)
+    purge_cache_tags([SEARCH_TAG])
+
+
+def update_concert_search_entries(sender, instance, **kwargs):
+    """
+    Concerts are searched by their programs, so they are reindexed when
+    their performances, or the works performed, change
+    """
+    if isinstance(instance, Performance):
+        concert_ids = concert_ids_for_performances([instance.pk])
+    elif isinstance(instance, Composition):
+        concert_ids = concert_ids_for_compositions([instance.pk])
+    else:
+        return
+    if concert_ids:
+        run_in_background(reindex_concerts, concert_ids)
+
+
+def update_page_suggestion(sender, instance, **kwargs):
+    """Keep a person's or concert's search suggestion current"""
+    if isinstance(instance, SUGGEST_PAGE_MODELS):
+        suggestion = page_suggestion(instance) \
+            if kwargs.get('signal') is page_published else None
+        update_suggestion((instance._meta.model_name, instance.pk), suggestion)
+
+
+def update_composition_suggestion(sender, instance, **kwargs):
+    suggestion = composition_suggestion(instance) \
+        if kwargs.get('signal') is post_save else None
+    update_suggestion(('composition', instance.pk), suggestion)
+
+
+def purge_autocomplete(sender, instance, **kwargs):
+    """
+    Purge cached admin autocomplete results for a model, and for
+    compositions when a composer changes
+    """
+    tags = [autocomplete_tag(instance._meta.concrete_model)]
+    if isinstance(instance, Person):
+        tags.append(autocomplete_tag(Composition))
+    purge_cache_tags(tags)
+
+
+def register_signal_handlers():
+    post_save.connect(update_concert_date_range, sender=ConcertDate)
+    post_delete.connect(update_concert_date_range, sender=ConcertDate)
+
+    page_published.connect(purge_page_cache_tags)
+    page_unpublished.connect(purge_page_cache_tags)
+    for model in Page.__subclasses__():
+        pre_delete.connect(purge_page_cache_tags, sender=model)
+
+    for model in (ConcertDate, Performer, Composition, InstrumentModel,
+                  get_image_model()):
+        post_save.connect(purge_snippet_cache_tags, sender=model)
+        post_delete.connect(purge_snippet_cache_tags, sender=model)
+
+    page_published.connect(update_concert_search_entries)
+    page_unpublished.connect(update_concert_search_entries)
+    post_save.connect(update_concert_search_entries, sender=Composition)
+
+    page_published.connect(update_page_suggestion)
+    page_unpublished.connect(update_page_suggestion)
+    for model in SUGGEST_PAGE_MODELS:
+        pre_delete.connect(update_page_suggestion, sender=model)
+    post_save.connect(update_composition_suggestion, sender=Composition)
+    post_delete.connect(update_composition_suggestion, sender=Composition)
+
+    for signal in (page_published, page_unpublished, pre_delete):
+        signal.connect(purge_autocomplete, sender=Person)
+    for model in (Composition, InstrumentModel):
+        post_save.connect(purge_autocomplete, sender=model)
+        post_delete.connect(purge_autocomplete, sender=model)
+
+    page_published.connect(prerender_page_renditions)
+    post_save.connect(prerender_image_renditions, sender=get_image_model())
+
+    post_page_move.connect(invalidate_restricted_paths)
+    post_save.connect(invalidate_restricted_paths, sender=PageViewRestriction)
+    post_delete.connect(
+        invalidate_restricted_paths, sender=PageViewRestriction)
+
+    post_page_move.connect(purge_all_pages)
+    for model in (PageViewRestriction, MainMenu, MainMenuItem, FlatMenu,
+                  FlatMenuItem):
+        post_save.connect(purge_all_pages, sender=model)
+        post_delete.connect(purge_all_pages, sender=model)
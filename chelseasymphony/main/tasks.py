@@ -0,0 +1,138 @@
+"""Background tasks
+
+Work that shouldn't hold up a request, such as generating image renditions,
+is queued as a `BackgroundTask` row in the transaction that asks for it, and
+run in a small pool of worker threads once that transaction commits. With
+`BACKGROUND_TASK_WORKERS = 0` tasks run inline when the transaction commits
+instead, which is simpler to reason about in tests.
+
+Worker threads die with their process, so `manage.py run_background_tasks
+--loop`, which the Docker image runs alongside gunicorn, picks up the tasks
+they didn't get to: those still queued once due, and those whose worker
+didn't finish within `BACKGROUND_TASK_LEASE` seconds. A task that raises is
+logged and retried with backoff, up to `BACKGROUND_TASK_MAX_ATTEMPTS` times.
+A task may therefore run more than once, and should be safe to repeat.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from threading import Lock
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import BackgroundTask
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_TASK_WORKERS,
+                thread_name_prefix='background-task')
+        return _executor
+
+
+def retry_delay(attempts):
+    """Doubles the delay after each failed attempt, from a minute"""
+    return timedelta(minutes=2 ** (attempts - 1))
+
+
+def _lease():
+    return timezone.now() + timedelta(seconds=settings.BACKGROUND_TASK_LEASE)
+
+
+def _claim(pk):
+    """Leases a queued task to this worker, returning False if it's taken"""
+    return BackgroundTask.objects.filter(
+        pk=pk, status=BackgroundTask.QUEUED
+    ).update(status=BackgroundTask.RUNNING, leased_until=_lease()) == 1
+
+
+def _run(task):
+    """Runs a leased task, then deletes it, or records why it failed"""
+    try:
+        fn = import_string(task.task)
+        fn(*task.arguments['args'], **task.arguments['kwargs'])
+    except Exception as e:
+        logger.exception('Background task %s failed', task.task)
+        task.attempts += 1
+        task.last_error = str(e)
+        if task.attempts >= settings.BACKGROUND_TASK_MAX_ATTEMPTS:
+            task.status = BackgroundTask.FAILED
+        else:
+            task.status = BackgroundTask.QUEUED
+            task.next_attempt = timezone.now() + retry_delay(task.attempts)
+        task.leased_until = None
+        task.save(update_fields=[
+            'attempts', 'last_error', 'status', 'next_attempt',
+            'leased_until'])
+    else:
+        BackgroundTask.objects.filter(pk=task.pk).delete()
+
+
+def _run_queued(pk):
+    if _claim(pk):
+        _run(BackgroundTask.objects.get(pk=pk))
+
+
+def _run_in_thread(pk):
+    try:
+        _run_queued(pk)
+    except Exception:
+        # The task is left for `run_background_tasks`
+        logger.exception('Could not run background task %s', pk)
+    finally:
+        # Each worker thread has its own database connection
+        connections.close_all()
+
+
+def run_in_background(fn, *args, **kwargs):
+    """
+    Queues a call to `fn(*args, **kwargs)`, to be run off the request path
+    once the current transaction commits, or straight away outside of a
+    transaction. `fn` must be a module level function, and its arguments
+    JSON serialisable. Failures are logged and retried rather than raised.
+    """
+    task = BackgroundTask.objects.create(
+        task='{}.{}'.format(fn.__module__, fn.__qualname__),
+        arguments={'args': args, 'kwargs': kwargs})
+
+    def submit():
+        if settings.BACKGROUND_TASK_WORKERS:
+            _get_executor().submit(_run_in_thread, task.pk)
+        else:
+            _run_queued(task.pk)
+    transaction.on_commit(submit)
+    return task
+
+
+def run_queued_tasks(batch_size=None):
+    """
+    Runs a batch of the tasks that are due, or whose lease has expired, and
+    returns the number run. Failed tasks aren't due again until their
+    backoff has passed.
+    """
+    batch_size = batch_size or settings.BACKGROUND_TASK_BATCH_SIZE
+    now = timezone.now()
+    with transaction.atomic():
+        # Concurrent runners each take a different batch, and commit their
+        # leases before running anything
+        batch = list(
+            BackgroundTask.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=BackgroundTask.QUEUED, next_attempt__lte=now) |
+                Q(status=BackgroundTask.RUNNING, leased_until__lt=now))
+            .order_by('next_attempt')[:batch_size])
+        BackgroundTask.objects.filter(pk__in=[t.pk for t in batch]).update(
+            status=BackgroundTask.RUNNING, leased_until=_lease())
+    for task in batch:
+        _run(task)
+    return len(batch)
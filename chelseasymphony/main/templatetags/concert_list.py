@@ -1,8 +1,17 @@
 from django import template
+from chelseasymphony.main.caching import render_concert_cards
 
 register = template.Library()
 
 
-@register.inclusion_tag('concert_list.html')
-def list_concerts(concerts):
-    return {'concerts': concerts}
+@register.inclusion_tag('concert_list.html', takes_context=True)
+def list_concerts(context, concerts):
+    # Cards are cached per concert; programs are only built, in bulk, for
+    # the cards that need rendering
+    return {'cards': render_concert_cards(concerts, context.get('request'))}
+
+
+@register.simple_tag(takes_context=True)
+def concert_cards(context, concerts, template_name):
+    return render_concert_cards(
+        concerts, context.get('request'), template_name)
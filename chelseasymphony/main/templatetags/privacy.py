@@ -0,0 +1,10 @@
+from django import template
+from chelseasymphony.main.privacy import is_live_public
+
+register = template.Library()
+
+
+@register.filter
+def live_public(page):
+    """Usage: {% if person|live_public %}"""
+    return is_live_public(page)
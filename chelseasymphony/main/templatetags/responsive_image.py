@@ -1,10 +1,13 @@
 # Largely taken from
 # https://gist.github.com/coredumperror/41f9f8fe511ac4e88547487d6d43c69b
+from copy import copy
+
 from django import template
 
-from wagtail.images.models import SourceImageIOError
 from wagtail.images.templatetags.wagtailimages_tags import ImageNode
 
+from chelseasymphony.main.renditions import get_renditions, parse_srcset
+
 register = template.Library()
 
 @register.tag(name="responsiveimage")
@@ -14,7 +17,7 @@ def responsiveimage(parser, token):
     filter_spec = bits[1]
     remaining_bits = bits[2:]
 
-    if remaining_bits[-2] == 'as':
+    if len(remaining_bits) >= 2 and remaining_bits[-2] == 'as':
         attrs = _parse_attrs(remaining_bits[:-2])
         # token is of the form {% responsiveimage self.photo max-320x200 srcset="filter_spec xyzw" [ attr="val" ... ] as img %}
         return ResponsiveImageNode(image_expr, filter_spec, attrs=attrs, output_var_name=remaining_bits[-1])
@@ -47,6 +50,30 @@ def _parse_attrs(bits):
     return attrs
 
 class ResponsiveImageNode(ImageNode, template.Node):
+    def __init__(self, image_expr, filter_spec, output_var_name=None, attrs={}):
+        super().__init__(image_expr, filter_spec, output_var_name=output_var_name, attrs=attrs)
+
+        # A literal srcset is parsed once, when the template is compiled, into
+        # (filter spec, width) pairs. A variable srcset is parsed when it is
+        # rendered, and the parse of each value is memoized.
+        srcset = attrs.get('srcset')
+        if isinstance(srcset, str):
+            try:
+                self.sources = parse_srcset(srcset)
+            except ValueError as e:
+                raise template.TemplateSyntaxError(
+                    '"responsiveimage" tag has an invalid srcset: '
+                    '{}'.format(e))
+        elif srcset is None:
+            self.sources = ()
+        else:
+            self.sources = None
+
+    def get_sources(self, context):
+        if self.sources is not None:
+            return self.sources
+        return parse_srcset(self.attrs['srcset'].resolve(context))
+
     def render(self, context):
         try:
             image = self.image_expr.resolve(context)
@@ -56,58 +83,25 @@ class ResponsiveImageNode(ImageNode, template.Node):
         if not image:
             return ''
 
-        try:
-            rendition = image.get_rendition(self.filter)
-        except SourceImageIOError:
-            # It's fairly routine for people to pull down remote databases to their
-            # local dev versions without retrieving the corresponding image files.
-            # In such a case, we would get a SourceImageIOError at the point where we try to
-            # create the resized version of a non-existent image. Since this is a
-            # bit catastrophic for a missing image, we'll substitute a dummy
-            # Rendition object so that we just output a broken link instead.
-            Rendition = image.renditions.model  # pick up any custom Image / Rendition classes that may be in use
-            rendition = Rendition(image=image, width=0, height=0)
-            rendition.file.name = 'not-found'
-
-        # Parse srcset format into array of renditions.
-        try:
-            try:
-                # Assume it's a Variable object, and try to resolve it against the context.
-                srcset = self.attrs['srcset'].resolve(context)
-            except AttributeError:
-                # It's not a Variable, so assume it's a string.
-                srcset = self.attrs['srcset']
-
-            # Parse each src from the srcset.
-            raw_sources = srcset.replace('"', '').split(',')
-
-            srcset_renditions = []
-            widths = []
-            newsrcseturls = []
-
-            for source in raw_sources:
-                flt = source.strip().split(' ')[0]
-                width = source.strip().split(' ')[1]
-
-                # cache widths to be re-appended after filter has been converted to URL
-                widths.append(width)
-
-                try:
-                    srcset_renditions.append(image.get_rendition(flt))
-                except SourceImageIOError:
-                    # pick up any custom Image / Rendition classes that may be in use
-                    TmpRendition = image.renditions.model
-                    tmprend = TmpRendition(image=image, width=0, height=0)
-                    tmprend.file.name = 'not-found'
-
-            for index, rend in enumerate(srcset_renditions):
-                newsrcseturls.append(' '.join([rend.url, widths[index]]))
-
-        except KeyError:
-            newsrcseturls = []
-            pass
+        sources = self.get_sources(context)
+
+        # Look up the rendition and every srcset rendition together. Images
+        # whose renditions were prefetched for the page make no queries, and
+        # images missing their source file get a placeholder rendition, as
+        # is routine when a production database is pulled down to a local
+        # dev version without the corresponding image files.
+        renditions = get_renditions(
+            [(image, self.filter_spec)] +
+            [(image, flt) for flt, __ in sources])
+        rendition = renditions[(image.pk, self.filter_spec)]
+        newsrcseturls = [
+            renditions[(image.pk, flt)].url + ' ' + width
+            for flt, width in sources
+        ]
 
         if self.output_var_name:
+            # The rendition is shared with other tags displaying the image
+            rendition = copy(rendition)
             rendition.srcset = ', '.join(newsrcseturls)
 
             # return the rendition object in the given variable
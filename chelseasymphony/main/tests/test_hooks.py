@@ -1,12 +1,16 @@
 """Tests the PayPal donation form implementation"""
 import random
 import string
+from unittest import mock
 from django.core import mail
 from django.test import TestCase
 from django.test.utils import override_settings
+from django.utils import timezone
 from paypal.standard.ipn.tests.test_ipn import MockedPostbackMixin
 from six import text_type
 from six.moves.urllib.parse import urlencode
+from chelseasymphony.main.models import BackgroundTask
+from chelseasymphony.main.tasks import run_queued_tasks
 from chelseasymphony.main.wagtail_hooks import (
     get_adjusted_donation
 )
@@ -18,9 +22,10 @@ CHARSET = "windows-1252"
 @override_settings(PAYPAL_ACCT_EMAIL='email-facilitator@gmail.com')
 class DonationEmailTest(MockedPostbackMixin, TestCase):
     """Tests the donation form"""
-    def paypal_post(self, params):
+    def paypal_post(self, params, send_queued=True):
         """
-        Does an HTTP POST the way that PayPal does, using the params given.
+        Does an HTTP POST the way that PayPal does, using the params given,
+        then sends the mail it queued unless `send_queued` is False.
         """
         # Taken from paypal.standard.ipn.tests.test_ipn, POST path modified
         # We build params into a bytestring ourselves, to avoid some encoding
@@ -32,11 +37,14 @@ class DonationEmailTest(MockedPostbackMixin, TestCase):
         byte_params = {
             cond_encode(k): cond_encode(v) for k, v in params.items()}
         post_data = urlencode(byte_params)
-        return self.client.post(
+        response = self.client.post(
             "/paypal/",
             post_data,
             content_type='application/x-www-form-urlencoded'
         )
+        if send_queued:
+            run_queued_tasks()
+        return response
 
     @staticmethod
     def generate_params(amount, waive_donor_incentive=False):
@@ -238,3 +246,37 @@ class DonationEmailTest(MockedPostbackMixin, TestCase):
         self.assertIn(
             'For your records: Your recurring donation', mail.outbox[0].body)
         self.assertIn('was $100.00', mail.outbox[0].body)
+
+    def test_donation_email_queued(self):
+        """
+        Donation emails are queued rather than sent while handling the IPN,
+        and only once for each transaction
+        """
+        params = self.generate_params('3.00')
+        self.paypal_post(params, send_queued=False)
+        self.assertEqual(len(mail.outbox), 0)
+        task = BackgroundTask.objects.get()
+        self.assertEqual(
+            task.task, 'chelseasymphony.main.mail.send_queued_email')
+        self.assertEqual(task.arguments['args'][3], ['email@gmail.com'])
+
+        # PayPal resends IPNs that it doesn't think were received
+        self.paypal_post(params, send_queued=False)
+        self.assertEqual(BackgroundTask.objects.count(), 1)
+
+        self.assertEqual(run_queued_tasks(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(BackgroundTask.objects.exists())
+
+    def test_queued_mail_retry(self):
+        """Mail that fails to send is left queued to be retried later"""
+        self.paypal_post(self.generate_params('3.00'), send_queued=False)
+        with mock.patch('django.core.mail.EmailMessage.send',
+                        side_effect=OSError('Connection refused')):
+            run_queued_tasks()
+        task = BackgroundTask.objects.get()
+        self.assertEqual(task.status, BackgroundTask.QUEUED)
+        self.assertEqual(task.attempts, 1)
+        self.assertEqual(task.last_error, 'Connection refused')
+        self.assertGreater(task.next_attempt, timezone.now())
+        self.assertEqual(len(mail.outbox), 0)
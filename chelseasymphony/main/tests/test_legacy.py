@@ -0,0 +1,287 @@
+from contextlib import redirect_stdout
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+import json
+from tempfile import TemporaryDirectory
+from threading import Thread
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.timezone import make_aware
+from PIL import Image
+from wagtail.core.models import Page, PageLogEntry
+from wagtail.images import get_image_model
+from chelseasymphony.main.bulk_pages import place_child
+from chelseasymphony.main.legacy import (
+    ENDPOINTS, LegacySite, SyncState, get_wagtail_image, iter_array)
+from chelseasymphony.main.models import (
+    BlogPost, Concert, ConcertPerformer, Performance, Performer, Person)
+from .factories import PersonFactory
+from .test_models import create_base_site
+
+
+def png():
+    out = BytesIO()
+    Image.new('RGB', (4, 4)).save(out, 'PNG')
+    return out.getvalue()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves recorded payloads, and images, from `responses` by path"""
+    responses = {}
+
+    def do_GET(self):
+        body = self.responses.get(self.path)
+        self.send_response(200 if body is not None else 404)
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def payload(*nodes):
+    return json.dumps({'nodes': [{'node': node} for node in nodes]}).encode()
+
+
+class StubServerTest(TestCase):
+    """Runs a `StubHandler` server for the tests of a class"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.site = LegacySite(
+            'http://127.0.0.1:{}'.format(cls.server.server_port))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+
+class LegacySiteTest(StubServerTest):
+    def setUp(self):
+        StubHandler.responses = {
+            path: json.dumps({'nodes': [{'node': {'name': name}}]}).encode()
+            for name, path in ENDPOINTS.items()
+        }
+        StubHandler.responses['/files/new.png'] = png()
+        StubHandler.responses['/files/old.png'] = png()
+
+    def test_fetch(self):
+        """Payloads are fetched concurrently, and returned by name"""
+        payloads = self.site.fetch('people', 'headshots')
+        self.assertEqual(
+            {name: list(nodes) for name, nodes in payloads.items()}, {
+                'people': [{'name': 'people'}],
+                'headshots': [{'name': 'headshots'}],
+            })
+
+    def test_iter_array(self):
+        """Nodes are parsed one at a time, across chunks"""
+        payload = json.dumps({'view': {'nodes': 0}, 'nodes': [
+            {'node': {'title': 'Dvořák {}'.format(i)}} for i in range(5)
+        ]}, ensure_ascii=False).encode()
+        chunks = [payload[i:i + 3] for i in range(0, len(payload), 3)]
+        self.assertEqual(
+            list(iter_array(chunks)), json.loads(payload)['nodes'])
+        with self.assertRaises(ValueError):
+            list(iter_array([payload[:-10]]))
+
+    def test_replay(self):
+        """Spooled payloads and images are imported again offline"""
+        with TemporaryDirectory() as spool_dir:
+            site = LegacySite(self.site.base_url, spool_dir=spool_dir)
+            site.fetch('people')
+            site.download_images(['/files/new.png'])
+
+            StubHandler.responses = {}
+            site = LegacySite(
+                self.site.base_url, spool_dir=spool_dir, replay=True)
+            self.assertEqual(
+                list(site.fetch('people')['people']), [{'name': 'people'}])
+            images = site.download_images(['/files/new.png'])
+            self.assertEqual(
+                get_wagtail_image('/files/new.png', images).title, 'new.png')
+            with self.assertRaises(FileNotFoundError):
+                site.fetch('headshots')
+
+    def test_download_images(self):
+        """
+        Images are downloaded unless they were imported before, and created
+        from what was downloaded
+        """
+        get_image_model().objects.create(
+            title='old.png', file=SimpleUploadedFile('old.png', png()))
+        images = self.site.download_images(
+            ['/files/new.png', '/files/old.png', '/files/missing.png', None])
+        self.assertEqual(images.keys(), {
+            '/files/new.png', '/files/missing.png'})
+        self.assertIsNone(images['/files/missing.png'])
+        with open(images['/files/new.png'], 'rb') as f:
+            self.assertEqual(
+                f.read(), StubHandler.responses['/files/new.png'])
+
+        image = get_wagtail_image('/files/new.png', images)
+        self.assertEqual(image.title, 'new.png')
+        self.assertIsNone(get_wagtail_image('/files/missing.png', images))
+
+
+class SyncStateTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_base_site()
+        cls.synced = PersonFactory(legacy_id=1)
+        cls.edited = PersonFactory(legacy_id=2)
+
+    def test_diff(self):
+        """
+        Nodes are new, changed or skipped by their record's content hash,
+        and a sync that stops part way resumes from its records
+        """
+        nodes = [{'uid': str(i), 'name': str(i)} for i in range(1, 4)]
+        state = SyncState('people', Person)
+        new, changed = state.diff(nodes, lambda n: n['uid'], dict)
+        self.assertEqual(new, [nodes[2]])
+        self.assertEqual(changed, {
+            self.synced.pk: nodes[0], self.edited.pk: nodes[1]})
+        state.record(['1', '2'], 'updated')
+
+        nodes[1]['name'] = 'edited'
+        state = SyncState('people', Person)
+        with self.assertNumQueries(0):
+            new, changed = state.diff(nodes, lambda n: n['uid'], dict)
+        self.assertEqual(new, [nodes[2]])
+        self.assertEqual(changed, {self.edited.pk: nodes[1]})
+        state.record(['2'], 'updated')
+        self.assertEqual(
+            state.report(), '0 created, 1 updated, 1 skipped')
+
+
+class BulkImportTest(StubServerTest):
+    def setUp(self):
+        create_base_site()
+        person = {
+            'biography': 'Plays the viola', 'orchestra_admin_position': '',
+            'active_roster': 'Yes', 'instrument': 'Viola'}
+        titles = {10: 'Autumn Gala', 11: 'Winter Lights', 12: 'Serenade'}
+        StubHandler.responses = {
+            path: payload() for path in ENDPOINTS.values()}
+        StubHandler.responses.update({
+            ENDPOINTS['people']: payload(
+                dict(person, uid='1', name='Clara Schumann',
+                     first_name='Clara', last_name='Schumann'),
+                dict(person, uid='2', name='Leonard Bernstein',
+                     first_name='Leonard', last_name='Bernstein')),
+            ENDPOINTS['concerts']: payload(*(
+                {'nid': str(nid), 'title': title, 'promo_copy': '',
+                 'body': 'Program notes', 'concert_location': '',
+                 'concert_season': '2019-2020',
+                 'path': '/concerts/{}'.format(nid)}
+                for nid, title in titles.items())),
+            ENDPOINTS['concert_dates']: payload(*(
+                {'nid': str(nid), 'concert_date':
+                    '2019-11-0{0}T20:00:00, 2019-11-0{1}T15:00:00'.format(
+                        nid - 9, nid - 8)}
+                for nid in (10, 11, 12))),
+            ENDPOINTS['concert_performances']: payload(
+                {'nid': '10', 'performance_id': '100', 'program_order': '1',
+                 'composition': 'Symphonie fantastique',
+                 'composer': 'Hector Berlioz', 'conductor_uid': '2',
+                 'performance_date': '2019-11-01, 2019-11-02'},
+                {'nid': '10', 'performance_id': '101', 'program_order': '2',
+                 'composition': 'Piano Concerto', 'composer': 'Clara Schumann',
+                 'conductor_uid': '2', 'performance_date': '2019-11-02'}),
+            ENDPOINTS['concert_soloists']: payload(
+                {'performance_id': '101', 'uid': '1', 'soloist': 'Clara',
+                 'instrument': 'Piano'}),
+            ENDPOINTS['blog_posts']: payload(
+                {'nid': '20', 'title': 'Season announcement', 'body': 'News',
+                 'promo_copy': '', 'author_uid': '2',
+                 'post_date': '2019-09-01', 'path': '/blog/20'}),
+        })
+
+    def run_import(self):
+        with redirect_stdout(StringIO()):
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command(
+                    'import', '--bulk', '--batch-size', '2',
+                    '--base-url', self.site.base_url)
+
+    def test_place_child(self):
+        """
+        Pages are placed where `add_child()` would put them, including past
+        the last single character step
+        """
+        parent = Page.get_first_root_node().add_child(
+            title='Parent', slug='parent')
+        last_path = None
+        for i in range(len(Page.alphabet) + 1):
+            placed = Page(title='Placed')
+            place_child(placed, parent, last_path)
+            added = parent.add_child(
+                title='Added', slug='added-{}'.format(i))
+            self.assertEqual(
+                (placed.path, placed.depth), (added.path, added.depth))
+            last_path = added.path
+
+    def test_bulk_import(self):
+        """
+        Pages created in bulk make a sound tree, are published with one
+        revision each, and have their dates and programs
+        """
+        self.run_import()
+        self.assertEqual(Page.find_problems(), ([], [], [], [], []))
+        for page in Page.objects.filter(depth__gt=2):
+            parent = page.get_parent()
+            self.assertEqual(page.url_path, parent.url_path + page.slug + '/')
+            self.assertEqual(page.numchild, page.get_children().count())
+            revision = page.revisions.get()
+            self.assertEqual(page.live_revision, revision)
+            self.assertTrue(page.live)
+            self.assertEqual(
+                list(PageLogEntry.objects.filter(page=page).order_by('pk')
+                     .values_list('action', 'revision')),
+                [('wagtail.create', None), ('wagtail.publish', revision.pk)])
+
+        self.assertEqual(Person.objects.count(), 3)
+        self.assertEqual(Concert.objects.count(), 3)
+        self.assertEqual(BlogPost.objects.get().author.legacy_id, 2)
+        concert = Concert.objects.get(legacy_id=10)
+        dates = [make_aware(datetime(2019, 11, 1, 20)),
+                 make_aware(datetime(2019, 11, 2, 15))]
+        self.assertEqual(
+            [d.date for d in concert.concert_date.order_by('date')], dates)
+        self.assertEqual(
+            (concert.first_date, concert.last_date, concert.date_count),
+            (dates[0], dates[1], 2))
+
+        symphony, concerto = Performance.objects.child_of(concert)\
+            .order_by('path')
+        self.assertEqual(str(symphony.composition), 'Symphonie fantastique')
+        self.assertEqual(
+            symphony.composition.composer.last_name, 'Berlioz')
+        self.assertEqual(symphony.conductor.last_name, 'Bernstein')
+        self.assertEqual(symphony.performance_date.count(), 2)
+        self.assertEqual(
+            [d.date for d in concerto.performance_date.all()], [dates[1]])
+        self.assertEqual(
+            Performer.objects.get(performance=concerto).person.legacy_id, 1)
+        self.assertEqual(
+            ConcertPerformer.objects.get(concert=concert).person.legacy_id,
+            1)
+
+        # Pages are indexed a batch at a time
+        self.assertEqual(
+            list(Concert.objects.live().search('Serenade')),
+            [Concert.objects.get(legacy_id=12)])
+
+        # Nothing is created again
+        self.run_import()
+        self.assertEqual(Page.find_problems(), ([], [], [], [], []))
+        self.assertEqual(Concert.objects.count(), 3)
+        self.assertEqual(Person.objects.count(), 3)
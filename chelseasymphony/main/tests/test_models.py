@@ -1,19 +1,44 @@
 from datetime import (
     datetime, timedelta
 )
+from io import StringIO
+import shutil
+import tempfile
+from unittest import mock
+from django.utils import timezone
 from django.utils.timezone import get_current_timezone
 from django.apps import apps
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.template import Context, Template, TemplateSyntaxError
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils.text import slugify
 from wagtail.tests.utils import WagtailPageTests
-from wagtail.core.models import Page, Site
+from wagtail.core.models import Page, PageViewRestriction, Site
+from wagtail.search.models import QueryDailyHits
 from chelseasymphony.main.models import (
     Home, BasicPage, ConcertDate, ConcertIndex, Concert,
     Performance, Performer, Composition, Person, PersonIndex,
     InstrumentModel, BlogPost, BlogIndex, ActiveRosterMusician,
-    Donate, FormPage, NewMemberRequestPage
+    Donate, FormPage, NewMemberRequest, NewMemberRequestPage, BackgroundTask
 )
+from chelseasymphony.main.privacy import live_public_ids
+from chelseasymphony.main.profiling import (
+    RequestProfile, get_report, reset_report)
+from chelseasymphony.main.renditions import (
+    nodelist_rendition_specs, rendition_specs, template_rendition_specs)
+from chelseasymphony.main.tasks import run_in_background, run_queued_tasks
+from chelseasymphony.main.uploads import limits_uploads
+from chelseasymphony.main.templatetags.responsive_image import (
+    ResponsiveImageNode)
+from chelseasymphony.search.hits import flush_hits, write_hits
+from chelseasymphony.search.results import cache_stats, reset_cache_stats
+from chelseasymphony.search.suggest import PrefixIndex, suggest
 from chelseasymphony.main.tests.factories import (
-    PersonFactory, ConcertFactory, BlogPostFactory
+    PersonFactory, ConcertFactory, BlogPostFactory, PerformanceFactory
 )
 
 from faker import Factory
@@ -233,6 +258,92 @@ class ConcertIndexTest(WagtailPageTests):
     def test_context(self):
         assert(True)
 
+    @override_settings(CONCERT_CARD_CACHE_TIMEOUT=0)
+    def test_list_concerts_query_count(self):
+        """
+        Concert listings build every program and look up every rendition
+        in bulk, so the number of queries does not grow with the number of
+        concerts
+        """
+        listing = Template(
+            '{% load concert_list %}{% list_concerts concerts %}')
+
+        def render_listing():
+            concerts = Concert.objects.future_concerts().live().public()
+            with CaptureQueriesContext(connection) as ctx:
+                listing.render(Context({'concerts': concerts}))
+            return len(ctx.captured_queries)
+
+        create_future_concerts(self.c_idx)
+        render_listing()
+        num_queries = render_listing()
+
+        ConcertFactory(parent=self.c_idx)
+        render_listing()
+        self.assertEqual(render_listing(), num_queries)
+
+    def test_concert_card_cache(self):
+        """
+        Concert cards are rendered once, and again after what they display
+        changes
+        """
+        listing = Template(
+            '{% load concert_list %}{% list_concerts concerts %}')
+
+        def render_listing():
+            concerts = Concert.objects.future_concerts().live().public()
+            with CaptureQueriesContext(connection) as ctx:
+                html = listing.render(Context({'concerts': concerts}))
+            return html, ctx
+
+        c1, c2, c3, c4 = create_future_concerts(self.c_idx)
+        html, __ = render_listing()
+        self.assertIn(c1.title, html)
+
+        # Only the concerts themselves are queried for cached cards
+        __, ctx = render_listing()
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        performance = Performance.objects.child_of(c1).first()
+        composition = performance.composition
+        composition.title = 'A New Work'
+        composition.save()
+        html, __ = render_listing()
+        self.assertIn('A New Work', html)
+
+        performer = performance.performer.first().person
+        self.assertIn(performer.title, html)
+        performer.unpublish()
+        html, __ = render_listing()
+        self.assertNotIn(performer.title, html)
+
+        c2.title = 'A New Title'
+        c2.save_revision().publish()
+        html, __ = render_listing()
+        self.assertIn('A New Title', html)
+
+    def test_concert_card_view_restriction(self):
+        """
+        Cached concert cards stop showing a performer once their page is
+        restricted
+        """
+        listing = Template(
+            '{% load concert_list %}{% list_concerts concerts %}')
+
+        def render_listing():
+            concerts = Concert.objects.future_concerts().live().public()
+            return listing.render(Context({'concerts': concerts}))
+
+        c1, c2, c3, c4 = create_future_concerts(self.c_idx)
+        performer = Performance.objects.child_of(c1).first()\
+            .performer.first().person
+        self.assertIn(performer.title, render_listing())
+
+        PageViewRestriction.objects.create(
+            page=performer, restriction_type=PageViewRestriction.PASSWORD,
+            password='secret')
+        self.assertNotIn(performer.title, render_listing())
+
 
 class ConcertTest(WagtailPageTests):
     @classmethod
@@ -283,6 +394,84 @@ class ConcertTest(WagtailPageTests):
             for performer in p.performer.all():
                 assert performer.person.title in performer_names
 
+    def test_get_context_query_count(self):
+        """
+        The program is assembled from a fixed number of queries, no matter
+        how many performances and performers a concert has
+        """
+        request = RequestFactory().get(self.c2.get_url())
+        # Warm the site root paths cache used when building URLs
+        self.c2.get_context(request)
+        with CaptureQueriesContext(connection) as ctx:
+            self.c2.get_context(request)
+        self.assertLessEqual(len(ctx.captured_queries), 8)
+
+        PerformanceFactory(parent=self.c2)
+        PerformanceFactory(parent=self.c2)
+        # Generate the new headshots' renditions
+        self.c2.get_context(request)
+        with CaptureQueriesContext(connection) as more_ctx:
+            context = self.c2.get_context(request)
+        self.assertEqual(len(context['program']), 6)
+        self.assertEqual(
+            len(more_ctx.captured_queries), len(ctx.captured_queries))
+
+    @override_settings(BACKGROUND_TASK_WORKERS=0)
+    def test_prerender_renditions(self):
+        """Publishing a concert generates the renditions of its image"""
+        specs = rendition_specs()['concert_image']
+        self.assertIn('fill-926x354', specs)
+        self.assertIn('fill-1208x446', specs)
+
+        image = self.c1.concert_image
+        image.renditions.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.c1.save_revision().publish()
+        self.assertEqual(
+            set(image.renditions.values_list('filter_spec', flat=True)),
+            set(specs))
+
+    def test_included_rendition_specs(self):
+        """
+        Templates included by name contribute their filter specs, and those
+        included by a variable are skipped
+        """
+        template = Template(
+            '{% include "concert_card.html" %}{% include template_name %}'
+            '{% load wagtailimages_tags %}{% image page.headshot fill-9x9 %}')
+        specs = nodelist_rendition_specs(template.nodelist)
+        self.assertEqual(
+            specs['concert_image'],
+            template_rendition_specs('concert_card.html')['concert_image'])
+        self.assertEqual(specs['headshot'], ['fill-9x9'])
+
+    def test_responsive_image_srcset(self):
+        """
+        Literal srcsets are parsed when the template is compiled, and render
+        the same as variable ones
+        """
+        srcset = 'fill-50x50 50w, fill-80x80 80w'
+        literal = Template(
+            '{% load responsive_image %}{% responsiveimage image fill-100x100 '
+            'srcset="' + srcset + '" %}')
+        variable = Template(
+            '{% load responsive_image %}'
+            '{% responsiveimage image fill-100x100 srcset=srcset %}')
+        node = literal.nodelist.get_nodes_by_type(ResponsiveImageNode)[0]
+        self.assertEqual(
+            node.sources, (('fill-50x50', '50w'), ('fill-80x80', '80w')))
+
+        context = {'image': self.c1.concert_image, 'srcset': srcset}
+        html = literal.render(Context(context))
+        self.assertIn('fill-80x80', html)
+        self.assertEqual(html, variable.render(Context(context)))
+
+        # A malformed literal srcset is a template error
+        with self.assertRaises(TemplateSyntaxError):
+            Template(
+                '{% load responsive_image %}{% responsiveimage image '
+                'fill-100x100 srcset="fill-50x50, fill-80x80 80w" %}')
+
     def test_performances_by_date(self):
         """
         The performances_by_date method should return a dict that looks like:
@@ -315,6 +504,39 @@ class ConcertTest(WagtailPageTests):
         assert 'url' in a_performer
         assert 'instrument' in a_performer
 
+    def test_date_range(self):
+        """
+        The denormalized date range follows changes to concert dates, however
+        they are made
+        """
+        c = ConcertFactory(parent=self.c_idx)
+        dates = [d.date for d in c.concert_date.all()]
+        c.refresh_from_db()
+        self.assertEqual(c.first_date, min(dates))
+        self.assertEqual(c.last_date, max(dates))
+        self.assertEqual(c.date_count, len(dates))
+
+        later = max(dates) + timedelta(days=1)
+        ConcertDate.objects.create(concert=c, date=later)
+        c.refresh_from_db()
+        self.assertEqual(c.last_date, later)
+        self.assertEqual(c.date_count, len(dates) + 1)
+
+        # A stale instance does not overwrite the date range when saved
+        stale = Concert.objects.get(pk=c.pk)
+        ConcertDate.objects.filter(concert=c, date=later).delete()
+        stale.save()
+        c.refresh_from_db()
+        self.assertEqual(c.last_date, max(dates))
+        self.assertEqual(c.date_count, len(dates))
+
+        # The backfill command repairs out of sync concerts
+        Concert.objects.filter(pk=c.pk).update(
+            first_date=None, last_date=None, date_count=0)
+        call_command('backfill_concert_dates', stdout=StringIO())
+        c.refresh_from_db()
+        self.assertEqual(c.first_date, min(dates))
+
     def test_clean(self):
         # test that the calculated_season value gets assigned to self.season
         c = ConcertFactory()
@@ -415,6 +637,29 @@ class PerformanceTest(WagtailPageTests):
         )
 
 
+class CompositionTest(WagtailPageTests):
+    @classmethod
+    def setUpTestData(cls):
+        cls.homepage, cls.c_idx, cls.p_idx, cls.b_idx = create_base_site()
+        cls.composer = PersonFactory()
+
+    def test_plain_title(self):
+        """The plain title and sort key are kept in step with the title"""
+        composition = Composition.objects.create(
+            title='<p><i>Études</i> No. 10 &amp; 11</p>',
+            composer=self.composer)
+        self.assertEqual(composition.plain_title, 'Études No. 10 & 11')
+        self.assertEqual(str(composition), 'Études No. 10 & 11')
+        self.assertEqual(
+            composition.sort_title, 'etudes no. 00000010 & 00000011')
+
+        composition.title = '<p>"Eroica"</p>'
+        composition.save(update_fields=['title'])
+        composition.refresh_from_db()
+        self.assertEqual(composition.plain_title, '"Eroica"')
+        self.assertEqual(composition.sort_title, 'eroica"')
+
+
 class PersonTest(WagtailPageTests):
     def test_parent_page_types(self):
         self.assertAllowedParentPageTypes(
@@ -429,7 +674,91 @@ class PersonTest(WagtailPageTests):
         )
 
 
+class PrivacyTest(WagtailPageTests):
+    @classmethod
+    def setUpTestData(cls):
+        cls.homepage, cls.c_idx, cls.p_idx, cls.b_idx = create_base_site()
+        cls.people = [PersonFactory() for i in range(4)]
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_live_public(self):
+        """
+        Privacy is resolved from cached restricted paths, and agrees with
+        get_view_restrictions
+        """
+        p1, p2, p3, p4 = self.people
+        p2.unpublish()
+        restriction = PageViewRestriction.objects.create(
+            page=p3, restriction_type=PageViewRestriction.PASSWORD,
+            password='secret')
+
+        for person in self.people:
+            person.refresh_from_db()
+        with self.assertNumQueries(1):
+            self.assertEqual(live_public_ids(self.people), {p1.pk, p4.pk})
+            privacy = [p.is_live_public() for p in self.people]
+        self.assertEqual(privacy, [
+            p.live and not p.get_view_restrictions() for p in self.people])
+        self.assertEqual(
+            set(Person.objects.filter(pk__in=[p.pk for p in self.people])
+                .live_public()),
+            {p1, p4})
+        template = Template(
+            '{% load privacy %}{% if p|live_public %}yes{% endif %}')
+        self.assertEqual(template.render(Context({'p': p3})), '')
+        self.assertEqual(template.render(Context({'p': p4})), 'yes')
+
+        restriction.delete()
+        self.assertTrue(Person.objects.get(pk=p3.pk).is_live_public())
+
+
 class PersonIndexTest(WagtailPageTests):
+    @classmethod
+    def setUpTestData(cls):
+        cls.homepage, cls.c_idx, cls.p_idx, cls.b_idx = create_base_site()
+        for i in range(20):
+            PersonFactory()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_build_roster(self):
+        """The roster matches one built an instrument at a time"""
+        Person.objects.first().unpublish()
+        expected = dict()
+        for i in InstrumentModel.objects.filter(show_on_roster=True)\
+                .order_by('weight'):
+            expected[i.instrument] = [
+                {'title': m.title} for m in Person.objects.filter(
+                    instrument__pk=i.pk, active_roster=True)
+                .live().public().order_by('last_name', 'first_name')]
+
+        with self.assertNumQueries(2):
+            self.assertEqual(PersonIndex.build_roster(), expected)
+
+    def test_roster_cache(self):
+        """The cached roster is rebuilt when people or instruments change"""
+        request = RequestFactory().get(self.p_idx.url)
+        self.p_idx.get_context(request)
+        with self.assertNumQueries(0):
+            self.p_idx.get_context(request)
+
+        person = Person.objects.live().first()
+        person.unpublish()
+        roster = self.p_idx.get_context(request)['roster']
+        self.assertNotIn(
+            {'title': person.title},
+            [m for musicians in roster.values() for m in musicians])
+
+        instrument = person.instrument.first()
+        instrument.instrument = 'Theremin'
+        instrument.show_on_roster = True
+        instrument.save()
+        self.assertIn('Theremin', self.p_idx.get_context(request)['roster'])
+
     def test_parent_page_types(self):
         self.assertAllowedParentPageTypes(
             PersonIndex,
@@ -468,3 +797,411 @@ class ActiveRosterMusicianTest(WagtailPageTests):
 
     def test_get_queryset(self):
         pass
+
+
+@override_settings(BACKGROUND_TASK_WORKERS=0)
+class SearchTest(WagtailPageTests):
+    @classmethod
+    def setUpTestData(cls):
+        cls.homepage, cls.c_idx, cls.p_idx, cls.b_idx = create_base_site()
+        cls.c1, cls.c2, cls.c3, cls.c4 = create_future_concerts(cls.c_idx)
+
+    def setUp(self):
+        # Clear hits counted, and results cached, by other tests
+        flush_hits()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_search_program(self):
+        """
+        Concerts are found by the works they perform, and results are the
+        specific pages
+        """
+        composition = Performance.objects.child_of(self.c2).first()\
+            .composition
+        composition.title = 'Symphonie fantastique'
+        with self.captureOnCommitCallbacks(execute=True):
+            composition.save()
+
+        response = self.client.get('/search/', {'query': 'fantastique'})
+        results = list(response.context['search_results'])
+        self.assertEqual(results, [self.c2])
+        self.assertIsInstance(results[0], Concert)
+
+    def test_search_cache(self):
+        """
+        Results are cached per normalised query, and shared by every page of
+        results, until a page is published
+        """
+        reset_cache_stats()
+        self.client.get('/search/', {'query': self.c1.title})
+        self.client.get('/search/', {'query': self.c1.title.upper() + ' '})
+        self.client.get('/search/', {'query': self.c1.title, 'page': 2})
+        self.assertEqual(cache_stats(), {'hits': 2, 'misses': 1})
+
+        self.c3.title = self.c1.title
+        self.c3.save_revision().publish()
+        response = self.client.get('/search/', {'query': self.c1.title})
+        self.assertIn(self.c3, list(response.context['search_results']))
+        self.assertEqual(cache_stats(), {'hits': 2, 'misses': 2})
+
+    def test_suggest(self):
+        """
+        Suggestions match the start of any word in a title, are answered
+        without queries, and follow publishing
+        """
+        self.c1.title = 'Ein Heldenleben'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.c1.save_revision().publish()
+        self.client.get('/search/suggest/', {'query': 'x'})
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/search/suggest/', {'query': 'HELD'})
+        self.assertEqual(response.json()['results'], [{
+            'type': 'concert', 'title': 'Ein Heldenleben',
+            'url': self.c1.get_url()}])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.c1.unpublish()
+        response = self.client.get('/search/suggest/', {'query': 'held'})
+        self.assertEqual(response.json()['results'], [])
+
+    def test_suggestion_changes(self):
+        """
+        Changes to suggestions are applied to the index without rebuilding
+        it, in the order they were made
+        """
+        suggest('x')
+        with mock.patch('chelseasymphony.search.suggest.build_suggestions',
+                        side_effect=AssertionError('Index rebuilt')):
+            self.c2.title = 'Das Lied von der Erde'
+            with self.captureOnCommitCallbacks(execute=True):
+                self.c2.save_revision().publish()
+            self.assertEqual(
+                [s['title'] for s in suggest('lied')],
+                ['Das Lied von der Erde'])
+
+        index = PrefixIndex()
+        index.update(('person', 1), {'title': 'Alma Mahler'}, 2)
+        index.update(('person', 1), {'title': 'Alma Schindler'}, 1)
+        self.assertEqual(index.search('schindler'), [])
+        self.assertEqual(
+            index.search('mahler'), [{'title': 'Alma Mahler'}])
+
+    @override_settings(SEARCH_HIT_FLUSH_SIZE=2)
+    def test_search_hits(self):
+        """Search hits are written in batches"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get('/search/', {'query': 'Mahler'})
+        self.assertFalse(QueryDailyHits.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get('/search/', {'query': 'mahler'})
+        self.assertEqual(
+            QueryDailyHits.objects.get(query__query_string='mahler').hits, 2)
+
+
+@override_settings(BACKGROUND_TASK_WORKERS=0, BACKGROUND_TASK_MAX_ATTEMPTS=2)
+class BackgroundTaskTest(TestCase):
+    def test_unfinished_tasks(self):
+        """
+        Tasks that were queued but never run, or whose worker stopped while
+        running them, are run by `run_queued_tasks`
+        """
+        # Never run, as the test's transaction never commits
+        run_in_background(write_hits, {'mahler': 2})
+        task = run_in_background(write_hits, {'bruckner': 1})
+        BackgroundTask.objects.filter(pk=task.pk).update(
+            status=BackgroundTask.RUNNING,
+            leased_until=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(run_queued_tasks(), 2)
+        self.assertEqual(run_queued_tasks(), 0)
+        self.assertFalse(BackgroundTask.objects.exists())
+        self.assertEqual(
+            QueryDailyHits.objects.get(query__query_string='mahler').hits, 2)
+        self.assertEqual(
+            QueryDailyHits.objects.get(query__query_string='bruckner').hits,
+            1)
+
+    def test_retry(self):
+        """Failed tasks are retried later, a limited number of times"""
+        with mock.patch('chelseasymphony.search.hits.write_hits',
+                        side_effect=OSError('Disk full')):
+            with self.captureOnCommitCallbacks(execute=True):
+                run_in_background(write_hits, {'mahler': 2})
+            task = BackgroundTask.objects.get()
+            self.assertEqual(task.status, BackgroundTask.QUEUED)
+            self.assertEqual(task.attempts, 1)
+            self.assertGreater(task.next_attempt, timezone.now())
+
+            # Not due until the backoff has passed
+            self.assertEqual(run_queued_tasks(), 0)
+
+            task.next_attempt = timezone.now() - timedelta(seconds=1)
+            task.save()
+            self.assertEqual(run_queued_tasks(), 1)
+            task.refresh_from_db()
+            self.assertEqual(task.status, BackgroundTask.FAILED)
+            self.assertEqual(task.last_error, 'Disk full')
+        self.assertFalse(QueryDailyHits.objects.exists())
+
+
+class AdminAutocompleteTest(WagtailPageTests):
+    @classmethod
+    def setUpTestData(cls):
+        cls.homepage, cls.c_idx, cls.p_idx, cls.b_idx = create_base_site()
+        cls.composer = PersonFactory(
+            first_name='Ludwig', last_name='Beethoven')
+        cls.composition = Composition.objects.create(
+            title='<p>Symphony No. <i>5</i></p>', composer=cls.composer)
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def search(self, query):
+        return self.client.get('/admin/autocomplete/search/', {
+            'type': 'main.Composition', 'query': query}).json()['items']
+
+    def test_search(self):
+        """
+        Every word must match the title or composer, and labels are
+        built without loading composers one by one
+        """
+        with CaptureQueriesContext(connection) as one:
+            items = self.search('beeth SYMPH')
+        self.assertEqual(items, [{
+            'pk': self.composition.pk,
+            'title': self.composition.autocomplete_label()}])
+        self.assertEqual(self.search('mozart symph'), [])
+
+        Composition.objects.create(
+            title='Symphony No. 7', composer=self.composer)
+        with CaptureQueriesContext(connection) as two:
+            self.assertEqual(len(self.search('beethoven')), 2)
+        self.assertEqual(len(two), len(one))
+
+    def test_purge(self):
+        """Cached results are purged when a composition is saved"""
+        self.search('symph')
+        self.composition.title = 'Egmont'
+        self.composition.save()
+        self.assertEqual(self.search('symph'), [])
+
+
+class AdminListingTest(WagtailPageTests):
+    @classmethod
+    def setUpTestData(cls):
+        cls.homepage, cls.c_idx, cls.p_idx, cls.b_idx = create_base_site()
+        cls.add_rows()
+
+    @classmethod
+    def add_rows(cls):
+        concert = ConcertFactory(parent=cls.c_idx)
+        BlogPostFactory(parent=cls.b_idx)
+        for composer in Person.objects.all()[:2]:
+            Composition.objects.create(title='Op. 1', composer=composer)
+        return concert
+
+    def listing_queries(self, url):
+        # The first request generates any missing thumbnails
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_listing_queries(self):
+        """Listings take the same number of queries at any length"""
+        urls = ('/admin/main/concert/', '/admin/main/person/',
+                '/admin/main/composition/', '/admin/main/blogpost/')
+        before = [self.listing_queries(url) for url in urls]
+        concert = self.add_rows()
+        self.assertEqual(
+            [self.listing_queries(url) for url in urls], before)
+
+        response = self.client.get('/admin/main/concert/')
+        self.assertContains(response, concert.url)
+        self.assertContains(response, '; '.join(
+            d.date.astimezone(TZ).strftime('%a, %b %d, %-I:%M %p, %Y')
+            for d in concert.concert_date.all()))
+
+
+class NewMemberRequestPageTest(WagtailPageTests):
+    @classmethod
+    def setUpTestData(cls):
+        cls.homepage, cls.c_idx, cls.p_idx, cls.b_idx = create_base_site()
+        cls.page = NewMemberRequestPage(
+            title='Join', slug='join', body=[], thank_you_text=[])
+        cls.homepage.add_child(instance=cls.page)
+        cls.page.save_revision().publish()
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(
+            MEDIA_ROOT=media_root, BACKGROUND_TASK_WORKERS=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def post(self, resume):
+        return self.client.post(self.page.url, {
+            'first_name': 'Gustav',
+            'last_name': 'Mahler',
+            'email': 'gustav@example.org',
+            'instrument': NewMemberRequest.VIOLA,
+            'resume': resume,
+            'source': NewMemberRequest.SEARCH,
+            'read_policies': 'on',
+        })
+
+    def test_resume_upload(self):
+        """
+        The resume is stored with the request, and only the emails the
+        request sends are left to the background
+        """
+        resume = SimpleUploadedFile('resume.pdf', b'%PDF-1.4 resume')
+        response = self.post(resume)
+        self.assertEqual(response.status_code, 200)
+        member_request = NewMemberRequest.objects.get()
+        self.assertTrue(member_request.resume.name.startswith('resumes/'))
+        with member_request.resume.open() as f:
+            self.assertEqual(f.read(), b'%PDF-1.4 resume')
+        self.assertEqual(run_queued_tasks(), 2)
+
+    def test_upload_limit_scope(self):
+        """Only uploads to the public site are limited in size"""
+        factory = RequestFactory()
+        with self.assertNumQueries(0):
+            self.assertTrue(limits_uploads(factory.post(self.page.url)))
+        self.assertFalse(
+            limits_uploads(factory.post('/admin/documents/multiple/add/')))
+
+    @override_settings(FILE_UPLOAD_MAX_SIZE=10)
+    def test_resume_too_large(self):
+        """Files over the maximum upload size are rejected"""
+        resume = SimpleUploadedFile('resume.pdf', b'%PDF-1.4 resume')
+        response = self.post(resume)
+        self.assertContains(response, 'Please upload a file smaller than')
+        self.assertFalse(NewMemberRequest.objects.exists())
+
+
+@override_settings(PAGE_CACHE_ENABLED=True)
+class PageCacheTest(WagtailPageTests):
+    @classmethod
+    def setUpTestData(cls):
+        cls.homepage, cls.c_idx, cls.p_idx, cls.b_idx = create_base_site()
+        cls.c1, cls.c2, cls.c3, cls.c4 = create_future_concerts(cls.c_idx)
+
+    def setUp(self):
+        cache.clear()
+
+    def assertCache(self, url, status):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get('X-Page-Cache'), status)
+        return response
+
+    def test_hit_and_miss(self):
+        for url in (self.homepage.url, self.c_idx.url, self.c1.url):
+            first = self.assertCache(url, 'MISS')
+            second = self.assertCache(url, 'HIT')
+            self.assertEqual(first.content, second.content)
+
+    def test_purge(self):
+        """Changes purge exactly the pages that display them"""
+        for url in (self.c_idx.url, self.c1.url, self.c2.url):
+            self.assertCache(url, 'MISS')
+
+        composition = Performance.objects.child_of(self.c1).first()\
+            .specific.composition
+        composition.title = 'A New Work'
+        composition.save()
+        self.assertIn(
+            'A New Work',
+            self.assertCache(self.c_idx.url, 'MISS').content.decode())
+        self.assertCache(self.c1.url, 'MISS')
+        self.assertCache(self.c2.url, 'HIT')
+
+        person = Performer.objects.filter(
+            performance__in=Performance.objects.child_of(self.c2))\
+            .first().person
+        person.first_name, person.last_name = 'A New', 'Name'
+        person.save_revision().publish()
+        self.assertCache(self.c1.url, 'HIT')
+        self.assertIn(
+            'A New Name',
+            self.assertCache(self.c2.url, 'MISS').content.decode())
+
+        ConcertFactory(parent=self.c_idx)
+        self.assertCache(self.c_idx.url, 'MISS')
+        self.assertCache(self.c1.url, 'HIT')
+
+    def test_authenticated(self):
+        self.login()
+        response = self.client.get(self.c1.url)
+        self.assertNotIn('X-Page-Cache', response)
+
+    def test_query_parameters(self):
+        """Only the query parameters pages read have their own entries"""
+        self.assertCache(self.c1.url, 'MISS')
+        self.assertCache(self.c1.url + '?utm_source=x&cb=1', 'HIT')
+        with override_settings(PAGE_CACHE_QUERY_PARAMS=('page',)):
+            self.assertCache(self.c1.url + '?page=2&utm_source=x', 'MISS')
+            self.assertCache(self.c1.url + '?utm_source=y&page=2', 'HIT')
+
+
+@override_settings(QUERY_PROFILE_ENABLED=True)
+class QueryBudgetTest(WagtailPageTests):
+    @classmethod
+    def setUpTestData(cls):
+        cls.homepage, cls.c_idx, cls.p_idx, cls.b_idx = create_base_site()
+        cls.c1, cls.c2, cls.c3, cls.c4 = create_future_concerts(cls.c_idx)
+        cls.blog_post = BlogPostFactory(parent=cls.b_idx)
+        cls.blog_post.save_revision().publish()
+        cls.donate = Donate(title='Donate', slug='donate')
+        cls.homepage.add_child(instance=cls.donate)
+        cls.donate.save_revision().publish()
+
+    def test_query_budget(self):
+        """Pages stay within the query budgets set in QUERY_BUDGETS"""
+        person = Person.objects.live().first()
+        pages = {
+            'Home': self.homepage.url,
+            'ConcertIndex.upcoming_concerts': self.c_idx.url,
+            'ConcertIndex.concerts_by_season':
+                self.c_idx.url + self.c1.season + '/',
+            'ConcertIndex.get_concert': self.c1.url,
+            'Person': person.url,
+            'PersonIndex': self.p_idx.url,
+            'BlogIndex': self.b_idx.url,
+            'BlogPost': self.blog_post.url,
+            'Donate.donation_form': self.donate.url,
+        }
+        for label, url in pages.items():
+            # The first request warms the caches, as in production
+            self.client.get(url)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            profile = response.wsgi_request.profile
+            self.assertEqual(profile.label, label)
+            self.assertIsNone(profile.over_budget())
+
+    def test_report(self):
+        """Recorded profiles are aggregated per label"""
+        reset_report()
+        for count in (3, 5):
+            profile = RequestProfile()
+            profile.label = 'Home'
+            profile.queries['SELECT 1', '()'] = count
+            profile.record()
+        stats = get_report()['Home']
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['queries'], 8)
+        self.assertEqual(stats['max_queries'], 5)
+        self.assertEqual(stats['duplicates'], 6)
+        self.assertEqual(stats['rendition_queries'], 0)
+        reset_report()
+        self.assertEqual(get_report(), {})
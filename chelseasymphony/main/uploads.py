@@ -0,0 +1,46 @@
+"""File uploads
+
+Uploaded files are streamed to a temporary file on disk as they are
+received. Files posted to the public site, where only the member request
+form takes them, are dropped as soon as they grow past
+`FILE_UPLOAD_MAX_SIZE`, so neither memory nor disk use is unbounded; uploads
+to the admin are not limited. The names of the fields whose files were
+dropped are recorded on the request as `oversized_uploads`.
+"""
+from django.conf import settings
+from django.core.files.uploadhandler import (
+    SkipFile, TemporaryFileUploadHandler)
+
+# Uploads to these paths aren't limited in size
+ADMIN_PATHS = ('/admin/', '/django-admin/')
+
+
+def limits_uploads(request):
+    """Returns whether a request posts to the public site"""
+    return not request.path.startswith(ADMIN_PATHS)
+
+
+class BoundedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams uploads to temporary files, and skips any file posted to the
+    public site that is larger than `FILE_UPLOAD_MAX_SIZE`
+    """
+    def handle_raw_input(self, *args, **kwargs):
+        self.max_size = settings.FILE_UPLOAD_MAX_SIZE \
+            if limits_uploads(self.request) else None
+        return super().handle_raw_input(*args, **kwargs)
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        max_size = self.max_size
+        if max_size is not None and self.received > max_size:
+            self.file.close()
+            if not hasattr(self.request, 'oversized_uploads'):
+                self.request.oversized_uploads = list()
+            self.request.oversized_uploads.append(self.field_name)
+            raise SkipFile()
+        return super().receive_data_chunk(raw_data, start)
@@ -3,22 +3,27 @@ from django.conf.urls import include, url
 from django.contrib import admin
 
 from wagtail.admin import urls as wagtailadmin_urls
+from wagtail.admin.auth import require_admin_access
 from wagtail.core import urls as wagtail_urls
 from wagtail.documents import urls as wagtaildocs_urls
 
 from chelseasymphony.search import views as search_views
 from chelseasymphony.main.views import NextEventView
+from chelseasymphony.main import autocomplete
 
 from wagtailautocomplete.urls.admin import urlpatterns as autocomplete_admin_urls
 
 urlpatterns = [
     url(r'^django-admin/', admin.site.urls),
 
+    url(r'^admin/autocomplete/search/',
+        require_admin_access(autocomplete.search)),
     url(r'^admin/autocomplete/', include(autocomplete_admin_urls)),
     url(r'^admin/', include(wagtailadmin_urls)),
     url(r'^documents/', include(wagtaildocs_urls)),
 
     url(r'^search/$', search_views.search, name='search'),
+    url(r'^search/suggest/$', search_views.suggestions, name='suggest'),
 
     url(r'^paypal/', include('paypal.standard.ipn.urls')),
 
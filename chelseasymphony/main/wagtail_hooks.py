@@ -2,30 +2,38 @@
 from bisect import bisect
 from decimal import Decimal, localcontext
 import logging
-from django.core.mail import send_mail
-from django.db.models import Min
+from django.db.models import Prefetch
+from django.forms.utils import flatatt
 from django.http import HttpResponseRedirect
 from django.template.loader import get_template
 from django.template import Context
+from django.utils.safestring import mark_safe
 from django.utils.timezone import localtime
 from django.conf import settings
 from wagtail.admin.action_menu import ActionMenuItem
 from wagtail.core import hooks
+from wagtail.core.models import UserPagePermissionsProxy
 from wagtail.contrib.modeladmin.helpers import (
-    PermissionHelper, PageButtonHelper
+    PermissionHelper, PagePermissionHelper, PageButtonHelper
 )
 from wagtail.contrib.modeladmin.mixins import ThumbnailMixin
 from wagtail.contrib.modeladmin.options import (
     ModelAdmin, modeladmin_register
 )
+from wagtail.images import get_image_model
 from paypal.standard.models import ST_PP_COMPLETED
 from paypal.standard.ipn.signals import (
     valid_ipn_received, invalid_ipn_received
 )
 from paypal.standard.ipn.models import PayPalIPN
+from .caching import PAGE_CACHE_MODELS, page_cache_tags
+from .mail import queue_mail
+from .privacy import is_live_public
+from .profiling import profile_label
+from .renditions import get_filter
 from .models import (
     Person, Composition, InstrumentModel, Concert, ConcertIndex,
-    ConcertDate, Performance, NewMemberRequest, BlogPost
+    Performance, NewMemberRequest, BlogPost
 )
 logger = logging.getLogger('django.server')
 
@@ -41,6 +49,39 @@ class ProtectModelPermissionHelper(PermissionHelper):
         return False
 
 
+class ListingPermissionHelper(PagePermissionHelper):
+    """
+    Checks the permissions of a listing's rows against the user's page
+    permissions, loaded once per request, and looks each parent page up
+    once, rather than querying for every row
+    """
+    @staticmethod
+    def listing_permissions(user):
+        # request.user is loaded for each request, so this doesn't outlive it
+        if not hasattr(user, '_listing_permissions'):
+            user._listing_permissions = (UserPagePermissionsProxy(user), {})
+        return user._listing_permissions
+
+    def permissions_for(self, user, obj):
+        return self.listing_permissions(user)[0].for_page(obj)
+
+    def user_can_edit_obj(self, user, obj):
+        return self.permissions_for(user, obj).can_edit()
+
+    def user_can_delete_obj(self, user, obj):
+        return self.permissions_for(user, obj).can_delete()
+
+    def user_can_publish_obj(self, user, obj):
+        return obj.live and self.permissions_for(user, obj).can_unpublish()
+
+    def user_can_copy_obj(self, user, obj):
+        perms, parents = self.listing_permissions(user)
+        parent_path = obj.path[:-obj.steplen]
+        if parent_path not in parents:
+            parents[parent_path] = obj.get_parent()
+        return perms.for_page(parents[parent_path]).can_publish_subpage()
+
+
 class ConcertButtonHelper(PageButtonHelper):
     """Override to add 'View Live' and 'Explore' buttons"""
     def get_buttons_for_obj(self, obj, exclude=None, classnames_add=None,
@@ -50,7 +91,8 @@ class ConcertButtonHelper(PageButtonHelper):
 
         extra_btns = [
             {
-                'url': obj.get_url(),
+                # The request caches the sites' root paths
+                'url': obj.get_url(request=self.request),
                 'label': 'View Live',
                 'classname': 'button button-small button-secondary',
                 'title': 'View Live'
@@ -68,6 +110,7 @@ class ConcertButtonHelper(PageButtonHelper):
 class ConcertAdmin(ModelAdmin):
     """Creates admin page for concerts"""
     button_helper_class = ConcertButtonHelper
+    permission_helper_class = ListingPermissionHelper
 
     model = Concert
     menu_label = 'Concerts'
@@ -80,17 +123,14 @@ class ConcertAdmin(ModelAdmin):
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.annotate(
-            first_date=Min('concert_date__date')).\
-            order_by('-first_date')
+        return qs.order_by('-first_date').prefetch_related('concert_date')\
+            .prefetch_workflow_states()
 
     def concert_dates(self, obj):
-        dates = ConcertDate.objects.\
-            filter(concert=obj.id).order_by('date')
-
         return '; '.join(
             [localtime(d.date).
-             strftime('%a, %b %d, %-I:%M %p, %Y') for d in dates])
+             strftime('%a, %b %d, %-I:%M %p, %Y')
+             for d in obj.concert_date.all()])
 
 
 class ViewLiveButtonHelper(PageButtonHelper):
@@ -102,7 +142,8 @@ class ViewLiveButtonHelper(PageButtonHelper):
 
         extra_btns = [
             {
-                'url': obj.get_url(),
+                # The request caches the sites' root paths
+                'url': obj.get_url(request=self.request),
                 'label': 'View Live',
                 'classname': 'button button-small button-secondary',
                 'title': 'View Live'
@@ -114,6 +155,7 @@ class ViewLiveButtonHelper(PageButtonHelper):
 class PersonAdmin(ThumbnailMixin, ModelAdmin):
     """Creates admin page for people"""
     button_helper_class = ViewLiveButtonHelper
+    permission_helper_class = ListingPermissionHelper
 
     model = Person
     menu_label = 'People'
@@ -128,6 +170,33 @@ class PersonAdmin(ThumbnailMixin, ModelAdmin):
     search_fields = ('first_name', 'last_name')
     ordering = ('last_name',)
 
+    def get_queryset(self, request):
+        Rendition = get_image_model().get_rendition_model()
+        return super().get_queryset(request).select_related('headshot')\
+            .prefetch_related(
+                'instrument',
+                Prefetch('headshot__renditions',
+                         queryset=Rendition.objects.filter(
+                             filter_spec=self.thumb_image_filter_spec)))\
+            .prefetch_workflow_states()
+
+    def admin_thumb(self, obj):
+        """Uses the headshot's prefetched thumbnail, if it has one"""
+        image = obj.headshot
+        if image:
+            key = get_filter(self.thumb_image_filter_spec).get_cache_key(image)
+            for rendition in image.renditions.all():
+                if rendition.focal_point_key == key:
+                    return mark_safe('<img{}>'.format(flatatt({
+                        'src': rendition.url,
+                        'width': self.thumb_image_width,
+                        'class': self.thumb_classname,
+                    })))
+        return super().admin_thumb(obj)
+
+    admin_thumb.short_description = ThumbnailMixin.admin_thumb.\
+        short_description
+
     def instrument_list(self, obj):
         return ', '.join([i.instrument for i in obj.instrument.all()])
 
@@ -142,12 +211,17 @@ class CompositionAdmin(ModelAdmin):
     menu_order = 210
     exclude_from_explorer = True
     list_display = ('display_title', 'composer')
-    search_fields = ('title', 'composer__title')
+    ordering = ('sort_title',)
+    search_fields = ('plain_title', 'composer__title')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('composer')
 
 
 class BlogPostAdmin(ModelAdmin):
     """Creates admin page for blog posts"""
     button_helper_class = ViewLiveButtonHelper
+    permission_helper_class = ListingPermissionHelper
 
     model = BlogPost
     menu_label = 'Blog Posts'
@@ -158,6 +232,10 @@ class BlogPostAdmin(ModelAdmin):
     search_fields = ('title', 'author', 'promo_copy', 'body')
     ordering = ('-date', )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('author')\
+            .prefetch_workflow_states()
+
 
 class InstrumentAdmin(ModelAdmin):
     """Creates admin page for instruments"""
@@ -216,13 +294,30 @@ def order_concerts(parent_page, pages, request):
     This orders concerts by the first concert date
     """
     if isinstance(parent_page, ConcertIndex):
-        pages = pages.annotate(
-            first_date=Min('concert__concert_date__date')).\
-            order_by('-first_date')
+        pages = pages.order_by('-concert__first_date')
 
     return pages
 
 
+@hooks.register('before_serve_page')
+def mark_page_cacheable(page, request, serve_args, serve_kwargs):
+    """
+    Mark requests for public pages of the cached page types as cacheable,
+    tagged with the content the page displays. Views and template tags add
+    the tags of any other content they display.
+    """
+    if isinstance(page, PAGE_CACHE_MODELS) and is_live_public(page):
+        request.page_cache_tags = page_cache_tags(page)
+
+
+@hooks.register('before_serve_page')
+def label_profiled_request(page, request, serve_args, serve_kwargs):
+    """Label request profiles with the page type and route served"""
+    profile = getattr(request, 'profile', None)
+    if profile is not None:
+        profile.label = profile_label(page, serve_args)
+
+
 @hooks.register('after_create_page')
 def redirect_pages_to_admin(request, page):
     """Redirect on page creation
@@ -296,6 +391,23 @@ def get_adjusted_donation(amount: str) -> str:
     return str(amt - adjustments[bisect(breakpoints, amt)])
 
 
+def is_duplicate_ipn(ipn_obj):
+    """
+    Returns whether an IPN repeats one already received for the same
+    transaction, or subscription, and payment status
+    """
+    if ipn_obj.txn_id:
+        ids = {'txn_id': ipn_obj.txn_id}
+    elif ipn_obj.subscr_id:
+        ids = {'subscr_id': ipn_obj.subscr_id}
+    else:
+        return False
+    return PayPalIPN.objects.filter(
+        flag=False, txn_type=ipn_obj.txn_type,
+        payment_status=ipn_obj.payment_status, **ids
+    ).exclude(pk=ipn_obj.pk).exists()
+
+
 def handle_donation(sender, **kwargs):
     ipn_obj = sender
     waive_donor_incentive = None
@@ -318,6 +430,12 @@ def handle_donation(sender, **kwargs):
         'adjusted_donation': adjusted_donation,
     }
 
+    # PayPal may deliver an IPN more than once, so only one email is queued
+    # for each transaction
+    if is_duplicate_ipn(ipn_obj):
+        logger.info('A duplicate IPN was received')
+        return
+
     if ipn_obj.payment_status == ST_PP_COMPLETED:
         if ipn_obj.receiver_email != settings.PAYPAL_ACCT_EMAIL:
             logger.info('An invalid payment request was made')
@@ -326,7 +444,7 @@ def handle_donation(sender, **kwargs):
         # send email for one-time donation
         if ipn_obj.txn_type == 'web_accept':
             plaintext = get_template('main/email/donation_confirmation.txt')
-            send_mail(
+            queue_mail(
                 'Thank you for your donation',
                 plaintext.render(ctx),
                 settings.DONATION_EMAIL_ADDR,
@@ -338,7 +456,7 @@ def handle_donation(sender, **kwargs):
         if ipn_obj.txn_type == 'subscr_payment':
             plaintext = get_template(
                 'main/email/recurring_donation_confirmation.txt')
-            send_mail(
+            queue_mail(
                 'Thank you for your donation',
                 plaintext.render(ctx),
                 settings.DONATION_EMAIL_ADDR,
@@ -349,7 +467,7 @@ def handle_donation(sender, **kwargs):
     # send mail for new recurring donation signup
     if ipn_obj.txn_type == 'subscr_signup':
         plaintext = get_template('main/email/recurring_donation_welcome.txt')
-        send_mail(
+        queue_mail(
             'Thank you for your recurring donation',
             plaintext.render(ctx),
             settings.DONATION_EMAIL_ADDR,
@@ -0,0 +1,64 @@
+"""Search hit recording
+
+Recording a search hit with `Query.add_hit()` takes several queries, so
+hits are counted in memory and written in batches instead: once
+`SEARCH_HIT_FLUSH_SIZE` hits have been counted, or `SEARCH_HIT_FLUSH_INTERVAL`
+seconds have passed since the last write. Batches are written in the
+background. Hits are only used to rank popular queries, so losing the last
+few counted when a process restarts doesn't matter.
+"""
+from collections import Counter
+from threading import Lock
+from time import monotonic
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from wagtail.search.models import Query, QueryDailyHits
+from wagtail.search.utils import normalise_query_string
+from chelseasymphony.main.tasks import run_in_background
+
+_hits = Counter()
+_lock = Lock()
+_last_flush = monotonic()
+
+
+def record_hit(query_string):
+    """Counts a search for `query_string`, flushing the counts when due"""
+    global _last_flush
+    query_string = normalise_query_string(query_string)
+    if not query_string:
+        return
+    with _lock:
+        _hits[query_string] += 1
+        due = sum(_hits.values()) >= settings.SEARCH_HIT_FLUSH_SIZE or \
+            monotonic() - _last_flush >= settings.SEARCH_HIT_FLUSH_INTERVAL
+        if not due:
+            return
+        hits = _take_hits()
+        _last_flush = monotonic()
+    run_in_background(write_hits, hits)
+
+
+def _take_hits():
+    hits = dict(_hits)
+    _hits.clear()
+    return hits
+
+
+def write_hits(hits, date=None):
+    """Adds counted hits, by query string, to today's hits of each query"""
+    date = date or timezone.now().date()
+    for query_string, count in hits.items():
+        query = Query.get(query_string)
+        daily_hits, __ = QueryDailyHits.objects.get_or_create(
+            query=query, date=date)
+        QueryDailyHits.objects.filter(pk=daily_hits.pk)\
+            .update(hits=F('hits') + count)
+
+
+def flush_hits():
+    """Writes any counted hits now"""
+    with _lock:
+        hits = _take_hits()
+    if hits:
+        write_hits(hits)
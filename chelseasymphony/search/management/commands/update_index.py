@@ -0,0 +1,11 @@
+from wagtail.search.management.commands.update_index import (
+    Command as UpdateIndexCommand)
+from chelseasymphony.main.caching import SEARCH_TAG, purge_cache_tags
+
+
+class Command(UpdateIndexCommand):
+    """Wagtail's update_index, which also purges cached search results"""
+
+    def handle(self, **options):
+        super().handle(**options)
+        purge_cache_tags([SEARCH_TAG])
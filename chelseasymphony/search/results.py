@@ -0,0 +1,67 @@
+"""Search result caching
+
+The IDs of the pages a query finds are cached in rank order, under the
+query's normalised form, so that repeated searches and every page of a
+query's results are served without searching again. They are cached under
+`SEARCH_TAG`, which is purged whenever the search index changes: when pages
+are published, unpublished or deleted, when concerts are reindexed for
+changes to their programs, and by `manage.py update_index`.
+
+Cache hits and misses are counted, and reported by `manage.py query_report`.
+"""
+from hashlib import md5
+from django.conf import settings
+from django.core.cache import cache
+from wagtail.core.models import Page
+from wagtail.search.utils import normalise_query_string
+from chelseasymphony.main.caching import SEARCH_TAG, get_or_build
+from chelseasymphony.main.models import BasicPage, BlogPost, Concert, Person
+
+# Page types that are searched. Compositions are found through the concerts
+# that perform them, whose search entries include their programs.
+SEARCH_MODELS = (Concert, Person, BlogPost, BasicPage)
+
+HITS_KEY = 'search-cache:hits'
+MISSES_KEY = 'search-cache:misses'
+
+
+def _count(key):
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The counter was evicted in between
+        cache.set(key, 1, timeout=None)
+
+
+def search_result_ids(query_string):
+    """Returns the IDs of the live pages that match a query, by rank"""
+    query_string = normalise_query_string(query_string)
+    if not query_string:
+        return []
+
+    built = []
+
+    def build():
+        built.append(True)
+        results = Page.objects.live().type(*SEARCH_MODELS)\
+            .search(query_string)
+        return [page.pk for page in results]
+
+    ids = get_or_build(
+        'search-results:{}'.format(md5(query_string.encode()).hexdigest()),
+        [SEARCH_TAG], build,
+        timeout=getattr(settings, 'SEARCH_CACHE_TIMEOUT', None))
+    _count(MISSES_KEY if built else HITS_KEY)
+    return ids
+
+
+def cache_stats():
+    """Returns the search cache's hit and miss counts"""
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    return {'hits': counts.get(HITS_KEY, 0),
+            'misses': counts.get(MISSES_KEY, 0)}
+
+
+def reset_cache_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
@@ -0,0 +1,203 @@
+"""Search-as-you-type suggestions
+
+Suggestions are looked up in an in-memory prefix index of the titles of
+live, public people and concerts, and of compositions, so that lookups don't
+touch the database. Each title is indexed under every word in it, so "mahl"
+finds "Gustav Mahler", and the keys are kept in a sorted list, which is
+searched by bisection.
+
+Each process builds its index the first time it is used, and then keeps it
+up to date incrementally. When a person or concert is published, unpublished
+or deleted, or a composition is saved or deleted, its new suggestion is
+recorded as a `SuggestionChange`, and `SUGGEST_CHANGES_TAG` is purged once
+that commits. Every process, including the one that made the change, sees
+the tag's version change and applies the changes made since it last looked.
+Each entry keeps the ID of the change that set it, so changes that commit
+out of order, or are seen twice, are applied correctly.
+
+When pages move or view restrictions change, the changes recorded so far
+are discarded and `SUGGEST_TAG` is purged, and every process rebuilds its
+index.
+"""
+from bisect import bisect_left, insort
+from datetime import timedelta
+from threading import Lock
+from unicodedata import combining, normalize
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlencode
+from chelseasymphony.main.caching import (
+    SUGGEST_CHANGES_TAG, SUGGEST_TAG, purge_cache_tags, tag_versions)
+from chelseasymphony.main.models import (
+    Composition, Concert, Person, SuggestionChange)
+from chelseasymphony.main.privacy import is_live_public, restricted_paths
+
+SUGGEST_PAGE_MODELS = (Person, Concert)
+
+# Changes are looked for from this long before the index was last updated,
+# to catch those that took a while to commit
+CHANGE_OVERLAP = timedelta(minutes=5)
+
+
+def normalise(text):
+    """Folds case and accents, and collapses whitespace"""
+    text = ''.join(c for c in normalize('NFKD', text) if not combining(c))
+    return ' '.join(text.casefold().split())
+
+
+def title_keys(title):
+    """Returns the keys a title is indexed under, one per word"""
+    words = normalise(title).split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+class PrefixIndex:
+    """
+    Suggestions, by item, indexed by prefix. Items are `(type, pk)` pairs,
+    and suggestions are dicts with a `title`. Items updated with a version
+    keep it, and ignore updates with an earlier one.
+    """
+    def __init__(self):
+        self.version = None
+        self.changes_version = None
+        self.updated = None
+        self._lock = Lock()
+        self._keys = []
+        self._suggestions = {}
+        self._versions = {}
+
+    def build(self, suggestions, version=None):
+        keys = sorted(
+            (key, item) for item, suggestion in suggestions.items()
+            for key in title_keys(suggestion['title']))
+        with self._lock:
+            self._keys = keys
+            self._suggestions = dict(suggestions)
+            self._versions = {}
+            self.version = version
+
+    def update(self, item, suggestion=None, version=None):
+        """
+        Replaces an item's suggestion, or removes it if there is none,
+        unless the item has already been updated by a later version
+        """
+        with self._lock:
+            if version is not None:
+                if version <= self._versions.get(item, 0):
+                    return
+                self._versions[item] = version
+            old = self._suggestions.pop(item, None)
+            if old is not None:
+                for key in title_keys(old['title']):
+                    i = bisect_left(self._keys, (key, item))
+                    if i < len(self._keys) and self._keys[i] == (key, item):
+                        del self._keys[i]
+            if suggestion is not None:
+                self._suggestions[item] = suggestion
+                for key in title_keys(suggestion['title']):
+                    insort(self._keys, (key, item))
+
+    def search(self, prefix, limit=10):
+        """
+        Returns the suggestions with a word starting with the prefix, by
+        the title from that word on
+        """
+        prefix = normalise(prefix)
+        if not prefix:
+            return []
+        found = []
+        with self._lock:
+            i = bisect_left(self._keys, (prefix,))
+            while i < len(self._keys) and len(found) < limit:
+                key, item = self._keys[i]
+                if not key.startswith(prefix):
+                    break
+                if item not in found:
+                    found.append(item)
+                i += 1
+            return [self._suggestions[item] for item in found]
+
+
+def page_suggestion(page, paths=None):
+    if not is_live_public(page, paths):
+        return None
+    return {'type': page._meta.model_name, 'title': page.title,
+            'url': page.get_url()}
+
+
+def composition_suggestion(composition):
+    title = str(composition)
+    return {'type': 'composition', 'title': title,
+            'url': '{}?{}'.format(reverse('search'), urlencode({
+                'query': title}))}
+
+
+def build_suggestions():
+    """Returns the suggestion for every item, by item"""
+    suggestions = {}
+    paths = restricted_paths()
+    for model in SUGGEST_PAGE_MODELS:
+        for page in model.objects.live_public().defer_streamfields():
+            suggestions[(page._meta.model_name, page.pk)] = \
+                page_suggestion(page, paths)
+    for composition in Composition.objects.all():
+        suggestions[('composition', composition.pk)] = \
+            composition_suggestion(composition)
+    return suggestions
+
+
+suggestion_index = PrefixIndex()
+
+
+def apply_suggestion_changes(since):
+    """Applies the changes made since a time to this process's index"""
+    changes = SuggestionChange.objects.filter(changed__gte=since)
+    for change in changes.order_by('pk'):
+        suggestion_index.update(
+            (change.item_type, change.item_pk), change.suggestion, change.pk)
+
+
+def suggest(prefix, limit=10):
+    """
+    Returns the suggestions for a prefix, first rebuilding the index if it
+    is out of date, or applying the changes made since it was updated
+    """
+    versions = tag_versions([SUGGEST_TAG, SUGGEST_CHANGES_TAG])
+    changes_version = versions[SUGGEST_CHANGES_TAG]
+    if suggestion_index.version != versions[SUGGEST_TAG]:
+        now = timezone.now()
+        suggestion_index.build(build_suggestions(), versions[SUGGEST_TAG])
+        # Changes made while the index was built
+        apply_suggestion_changes(now - CHANGE_OVERLAP)
+        suggestion_index.updated = now
+        suggestion_index.changes_version = changes_version
+    elif suggestion_index.changes_version != changes_version:
+        now = timezone.now()
+        apply_suggestion_changes(suggestion_index.updated - CHANGE_OVERLAP)
+        suggestion_index.updated = now
+        suggestion_index.changes_version = changes_version
+    return suggestion_index.search(prefix, limit)
+
+
+def update_suggestion(item, suggestion=None):
+    """
+    Records a change to an item's suggestion, which every process applies
+    to its index once it commits
+    """
+    item_type, item_pk = item
+    # Only the latest change to each item is needed
+    SuggestionChange.objects.filter(
+        item_type=item_type, item_pk=item_pk).delete()
+    SuggestionChange.objects.create(
+        item_type=item_type, item_pk=item_pk, suggestion=suggestion)
+    transaction.on_commit(lambda: purge_cache_tags([SUGGEST_CHANGES_TAG]))
+
+
+def rebuild_suggestions():
+    """
+    Has every process rebuild its index, when changes to the page tree or
+    view restrictions affect more suggestions than were recorded
+    """
+    SuggestionChange.objects.all().delete()
+    purge_cache_tags([SUGGEST_TAG])
@@ -1,8 +1,22 @@
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.http import JsonResponse
 from django.shortcuts import render
 
 from wagtail.core.models import Page
-from wagtail.search.models import Query
+
+from .hits import record_hit
+from .results import search_result_ids
+from .suggest import suggest
+
+
+def specific_pages(page_ids):
+    """
+    Returns the live specific pages with the given IDs, in order, loading
+    the pages of each type in one query
+    """
+    specific = Page.objects.live().filter(pk__in=page_ids).specific()
+    by_id = {p.pk: p for p in specific}
+    return [by_id[pk] for pk in page_ids if pk in by_id]
 
 
 def search(request):
@@ -11,24 +25,29 @@ def search(request):
 
     # Search
     if search_query:
-        search_results = Page.objects.live().search(search_query)
-        query = Query.get(search_query)
-
-        # Record hit
-        query.add_hit()
+        result_ids = search_result_ids(search_query)
+        record_hit(search_query)
     else:
-        search_results = Page.objects.none()
+        result_ids = []
 
     # Pagination
-    paginator = Paginator(search_results, 10)
+    paginator = Paginator(result_ids, 10)
     try:
         search_results = paginator.page(page)
     except PageNotAnInteger:
         search_results = paginator.page(1)
     except EmptyPage:
         search_results = paginator.page(paginator.num_pages)
+    search_results.object_list = specific_pages(search_results.object_list)
 
     return render(request, 'search/search.html', {
         'search_query': search_query,
         'search_results': search_results,
     })
+
+
+def suggestions(request):
+    """Returns the people, concerts and works matching a prefix, as JSON"""
+    return JsonResponse({
+        'results': suggest(request.GET.get('query', '')),
+    })
@@ -62,10 +62,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'chelseasymphony.main.middleware.QueryProfileMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'chelseasymphony.main.middleware.PageCacheMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -74,6 +76,10 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'chelseasymphony.main.urls'
 
+# Wagtail's database search backend. On Postgres it keeps the indexed
+# content in Wagtail's `wagtailsearch_indexentry` table and searches it with
+# Postgres full text search. Rebuild the index with `./manage.py
+# update_index`.
 WAGTAILSEARCH_BACKENDS = {
     'default': {
         'BACKEND': 'wagtail.search.backends.database',
@@ -193,6 +199,73 @@ WAGTAILEMBEDS_FINDERS = [
 
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
+# Rendered concert cards are invalidated when their content changes, so the
+# timeout only bounds how long an orphaned card lingers
+CONCERT_CARD_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Anonymous page responses are cached whole when enabled. Purging keeps them
+# current with edits; the timeout bounds how stale time based listings, such
+# as upcoming concerts, can get.
+PAGE_CACHE_ENABLED = False
+PAGE_CACHE_TIMEOUT = 60 * 60
+# The query parameters cached pages read, which are part of their cache
+# keys. Other parameters are ignored, so that they can't be used to fill
+# the cache. No cached page reads any at present.
+PAGE_CACHE_QUERY_PARAMS = ()
+
+# Page requests are profiled when enabled; see `manage.py query_report`.
+# Tests fail when a page makes more queries than its budget.
+QUERY_PROFILE_ENABLED = False
+QUERY_BUDGETS = {
+    'Home': 40,
+    'ConcertIndex.upcoming_concerts': 35,
+    'ConcertIndex.concerts_by_season': 35,
+    'ConcertIndex.get_concert': 45,
+    'Person': 45,
+    'PersonIndex': 30,
+    'BlogIndex': 35,
+    'BlogPost': 40,
+    'Donate.donation_form': 25,
+}
+
+# Number of threads that run background tasks, such as generating image
+# renditions. With 0, tasks run inline when their transaction commits.
+BACKGROUND_TASK_WORKERS = 2
+
+# Tasks are queued in the database, and `manage.py run_background_tasks`,
+# which the Docker image keeps running, runs those that workers didn't
+# finish, in batches of up to BACKGROUND_TASK_BATCH_SIZE. A task not finished
+# within BACKGROUND_TASK_LEASE seconds is run again. Failed tasks are retried
+# with backoff, up to BACKGROUND_TASK_MAX_ATTEMPTS times.
+BACKGROUND_TASK_BATCH_SIZE = 20
+BACKGROUND_TASK_LEASE = 600
+BACKGROUND_TASK_MAX_ATTEMPTS = 5
+
+# Uploads are streamed to temporary files. Files posted to the public site
+# over the maximum size are dropped while they are received.
+FILE_UPLOAD_HANDLERS = [
+    'chelseasymphony.main.uploads.BoundedTemporaryFileUploadHandler',
+]
+FILE_UPLOAD_MAX_SIZE = 50 * 1024 * 1024
+
+# Search hits are counted in memory and written in batches, once this many
+# have been counted or this many seconds have passed
+SEARCH_HIT_FLUSH_SIZE = 50
+SEARCH_HIT_FLUSH_INTERVAL = 60
+
+# Search results are purged when the search index changes, so the timeout
+# only bounds how long orphaned results linger
+SEARCH_CACHE_TIMEOUT = 60 * 60 * 24
+
+# The legacy site import fetches API payloads, and downloads images, with
+# this many threads each
+IMPORT_FETCH_WORKERS = 4
+IMPORT_IMAGE_WORKERS = 4
+
+# Admin autocomplete results are cached briefly per query, and purged when
+# the model searched changes
+ADMIN_AUTOCOMPLETE_CACHE_TIMEOUT = 60
+
 # Base URL to use when referring to full URLs within the Wagtail admin backend -
 # e.g. in notification emails. Don't include '/admin' or a trailing slash
 BASE_URL = 'http://example.com'
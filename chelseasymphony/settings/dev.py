@@ -14,6 +14,8 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 PAYPAL_ACCT_EMAIL = 'info-facilitator@example.org'
 DONATION_EMAIL_ADDR = 'donations-test@example.org'
 
+QUERY_PROFILE_ENABLED = True
+
 try:
     from .local import *
 except ImportError: